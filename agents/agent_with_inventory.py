@@ -1,20 +1,62 @@
 from agents.chimera_agent import ChimeraAgent
 from utils.inventory import Inventory
+from utils.ledger import SettlementLedger
+from utils.inventory_store import PopulationInventoryStore
+from utils.inventory_events import InventoryEventStream
 
 class AgentWithInventory(ChimeraAgent):
     """
     An agent with an inventory.
     """
-    def __init__(self, jid, password, **kwargs):
+    # Well-known items of the agent (key -> item name), accessed through cached item handles
+    inventory_schema: dict[str, str] = {}
+
+    def __init__(self, jid, password, compact_inventory: bool = True, ledger: SettlementLedger = None, inventory_store: PopulationInventoryStore = None, inventory_events: InventoryEventStream = None, **kwargs):
         """
         Initialize the agent with an inventory.
 
         Args:
             jid (str): The JID of the agent.
             password (str): The password of the agent.
+            compact_inventory (bool, optional): Whether the inventory stores its stacks as compact records. Defaults to True.
+            ledger (SettlementLedger, optional): The ledger settling the agent's payments. Defaults to the simulation's ledger, or None (payments are applied directly).
+            inventory_store (PopulationInventoryStore, optional): The population store the inventory writes its well-known quantities to. Defaults to None.
+            inventory_events (InventoryEventStream, optional): The stream the inventory emits its change events to. Defaults to None.
         """
         super().__init__(jid, password, **kwargs)
-        self.inventory = Inventory()
+        self.inventory = Inventory(compact=compact_inventory)
+        if inventory_events is not None:
+            self.inventory.enable_events(inventory_events, source=str(self.jid))
+        self.item_handles = {}
+        self.ledger = ledger if ledger is not None or self.simulation is None else self.simulation.ledger
+        self.inventory_store = inventory_store
+        if inventory_store is not None:
+            inventory_store.register(str(self.jid), self.inventory)
+
+    def resolve_item_handles(self):
+        """
+        Resolve the handles of all items in the inventory schema. Called once the items have been added.
+        Opens the agent's ledger account on its budget, if the agent settles payments through a ledger.
+        """
+        self.item_handles = {key: self.inventory.get_item_handle(name) for key, name in self.inventory_schema.items()}
+        if self.ledger is not None and "budget" in self.item_handles and not self.ledger.has_account(str(self.jid)):
+            self.ledger.open_account(str(self.jid), self.item_handles.get("budget"))
+
+    def item_handle(self, key: str):
+        """
+        Get the cached handle of a well-known item, resolving it again only if its item was removed.
+
+        Args:
+            key (str): The key of the item in the inventory schema.
+
+        Returns:
+            ItemHandle: The handle of the item.
+        """
+        handle = self.item_handles.get(key)
+        if handle is None or not handle.valid:
+            handle = self.inventory.get_item_handle(self.inventory_schema.get(key))
+            self.item_handles.update({key: handle})
+        return handle
 
     async def setup(self):
         print(f"[Agent with inventory {self.jid}] Starting with inventory {self.inventory} and personality: {self.personality}")
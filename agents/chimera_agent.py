@@ -1,12 +1,14 @@
 from spade.agent import Agent
-from utils.personality import Personality
+from utils.personality import Personality, PersonalityProfile, defaultProfileInterner
+from utils.personality_matrix import PopulationPersonalityMatrix
+from utils.random_streams import RandomStreams, defaultRandomStreams
 
 
 class ChimeraAgent(Agent):
     """
     A Chimera agent is an agent that has a personality.
     """
-    def __init__(self, jid, password, personality: dict[str, int | float | list] = None, **kwargs):
+    def __init__(self, jid, password, personality: dict[str, int | float | list] = None, personality_matrix: PopulationPersonalityMatrix = None, random_streams: RandomStreams = None, simulation=None, **kwargs):
         """
         Initialize the Chimera agent.
 
@@ -14,9 +16,24 @@ class ChimeraAgent(Agent):
             jid (str): The JID of the agent.
             password (str): The password of the agent.
             personality (dict[str, int | float | list], optional): The personality of the agent. Defaults to None.
+            personality_matrix (PopulationPersonalityMatrix, optional): The population matrix the agent's personality profile is registered into. Defaults to None.
+            random_streams (RandomStreams, optional): The random streams of the run the agent draws its random numbers from. Defaults to defaultRandomStreams.
+            simulation (SimulationContext, optional): The simulation the agent takes the matrix, streams and other mutable state not given explicitly from. Defaults to None (process-wide defaults).
         """
         super().__init__(jid, password, **kwargs)
+        self.simulation = simulation
+        if simulation is not None:
+            personality_matrix = personality_matrix if personality_matrix is not None else simulation.personality_matrix
+            random_streams = random_streams if random_streams is not None else simulation.random_streams
+        # Random stream of the agent, reproducible from the run seed whatever the agents' scheduling
+        self.random = (random_streams if random_streams is not None else defaultRandomStreams).get_stream(jid)
+        if personality is not None and isinstance(personality.get("personality profile"), PersonalityProfile):
+            # Agents given the same profile share its scores and matrix row, but never its changes
+            personality = personality | {"personality profile": defaultProfileInterner.intern(personality.get("personality profile"))}
         self.personality = Personality(personality=personality)
+        self.personality_matrix = personality_matrix
+        if personality_matrix is not None:
+            personality_matrix.register(self.personality.personality_descriptor.get("personality profile"))
 
     async def setup(self):
         print(f"[Chimera {self.jid}] Starting with personality: {self.personality}")
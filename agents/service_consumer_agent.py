@@ -1,61 +1,90 @@
 from agents.agent_with_inventory import AgentWithInventory
-from behaviours.consumer_behaviours import setup_FSM, CheckOfferedServices
+from behaviours.consumer_behaviours import TENDER_REPLY_TEMPLATE, setup_FSM, CheckOfferedServices
 
 from utils.recipe import Recipe
 from utils.inventory import Item
+from utils.preferences import ConsumerPreferences
+from utils.logger import logger
 
 class ServiceConsumerAgent(AgentWithInventory):
-    def __init__(self, jid, password, recipe=None, budget=50, providers=None, **kwargs):
+    inventory_schema = {
+        "budget": "money",
+        "recipe": "recipe",
+        "current recipe element": "current recipe element",
+        "completed recipes": "completed recipe",
+        "providers": "list of providers",
+    }
+
+    def __init__(self, jid, password, recipe=None, budget=50, providers=None, tender_deadline=5, **kwargs):
         super().__init__(jid, password, **kwargs)
+        # Seconds a tender waits for the proposals of the providers called
+        self.tender_deadline = tender_deadline
         self.inventory.add_item_in_quantity(Item("money"), budget)
-        self.inventory.add_item(Item("recipe", {"object": recipe or Recipe.random()}))
+        self.inventory.add_item(Item("recipe", {"object": recipe or Recipe.random(stream=self.random)}))
         self.inventory.add_item(Item("current recipe element", {"object": None}))
         self.inventory.add_item_in_quantity(Item("completed recipe"), 0)
         self.inventory.add_item(Item("list of providers", {"values": providers or {}}))
+        self.resolve_item_handles()
         if not any(self.personality.get_personality_vector()):
-            self.personality.generate_random_personality_vector()
+            self.personality.generate_random_personality_vector(self.random)
+        self._preferences = None
+
+    @property
+    def preferences(self):
+        profile = self.personality.personality_descriptor.get("personality profile")
+        if self._preferences is None or not self._preferences.is_current(profile):
+            self._preferences = ConsumerPreferences(profile, self.random)
+            logger.info(f"[Consumer {self.jid}] Personality factors: {self._preferences}")
+        return self._preferences
 
     @property
     def budget(self):
-        return self.inventory.get_item_quantity(self.inventory.get_item_by_name("money"))
+        return self.item_handle("budget").quantity
 
     @budget.setter
     def budget(self, value):
-        self.inventory.update_item_stack_attribute(self.inventory.get_item_by_name("money"), "quantity", value)
+        self.item_handle("budget").quantity = value
+
+    @property
+    def available_budget(self):
+        if self.ledger is None:
+            return self.budget
+        return self.ledger.get_available_balance(str(self.jid))
 
     @property
     def recipe(self):
-        return self.inventory.get_item_by_name("recipe").get_feature_value("object")
+        return self.item_handle("recipe").get_feature("object")
 
     @recipe.setter
     def recipe(self, value):
-        self.inventory.get_item_by_name("recipe").set_feature("object", value)
+        self.item_handle("recipe").set_feature("object", value)
 
     @property
     def current_recipe_element(self):
-        return self.inventory.get_item_by_name("current recipe element").get_feature_value("object")
+        return self.item_handle("current recipe element").get_feature("object")
 
     @current_recipe_element.setter
     def current_recipe_element(self, value):
-        self.inventory.get_item_by_name("current recipe element").set_feature("object", value)
+        self.item_handle("current recipe element").set_feature("object", value)
 
     @property
     def completed_recipes(self):
-        return self.inventory.get_item_quantity(self.inventory.get_item_by_name("completed recipe"))
+        return self.item_handle("completed recipes").quantity
 
     @completed_recipes.setter
     def completed_recipes(self, value):
-        self.inventory.update_item_stack_attribute(self.inventory.get_item_by_name("completed recipe"), "quantity", value)
+        self.item_handle("completed recipes").quantity = value
 
     @property
     def providers(self):
-        return self.inventory.get_item_by_name("list of providers").get_feature_value("values")
+        return self.item_handle("providers").get_feature("values")
 
     @providers.setter
     def providers(self, value):
-        self.inventory.get_item_by_name("list of providers").set_feature("values", value)
+        self.item_handle("providers").set_feature("values", value)
 
     async def setup(self):
         print(f"[Consumer {self.jid}] Starting with recipe: {self.recipe} and budget: {self.budget}")
         self.main_FSM_behaviour = setup_FSM()
-        self.add_behaviour(self.main_FSM_behaviour)
\ No newline at end of file
+        # Replies to calls for proposal go to the mailbox of their tender only
+        self.add_behaviour(self.main_FSM_behaviour, ~TENDER_REPLY_TEMPLATE)
\ No newline at end of file
@@ -5,53 +5,94 @@ from behaviours.provider_behaviours import setup_FSM_provider_behaviour
 from behaviours.communication_behaviours import ReceiveMessagesBehaviour
 
 from utils.inventory import Item
-from utils.service import Service
+from utils.service import Service, ServiceTally
+from utils.gamification import GamificationPipeline
+from utils.gamification_techniques import defaultGamificationTechniqueCollection as techniques_collection
 
 class ServiceProviderAgent(AgentWithInventory):
+    inventory_schema = {
+        "budget": "money",
+        "services": "list of services",
+        "inbox": "inbox",
+        "provided services": "list of provided services",
+    }
+
     def __init__(self, jid, password, services=None, budget=100, capacity=1, **kwargs):
         super().__init__(jid, password, **kwargs)
         self.inventory.add_item_in_quantity(Item("money"), budget)
         if services is None:
-            services = [Service.random() for _ in range(2)]
+            services = [Service.random(self.random) for _ in range(2)]
         self.inventory.add_item(Item("list of services", {"values": services}))
         self.inventory.add_item(Item("inbox", {"messages": deque()}))
+        self.inventory.add_feature_index("available")
         for _ in range(capacity):
             self.inventory.add_item(Item("service providing medium", {"available": True}))
-        self.inventory.add_item(Item("list of provided services", {"values": {}}))
+        self.inventory.add_item(Item("list of provided services", {"values": ServiceTally()}))
+        self.resolve_item_handles()
 
         if not any(self.personality.get_personality_vector()):
-            self.personality.generate_random_personality_vector()
+            self.personality.generate_random_personality_vector(self.random)
+        # Techniques of the agent's simulation, with their own goal state
+        self.techniques_collection = self.simulation.techniques if self.simulation is not None else techniques_collection
+        self.gamification_pipeline = None
 
     @property
     def budget(self):
-        return self.inventory.get_item_quantity(self.inventory.get_item_by_name("money"))
+        return self.item_handle("budget").quantity
 
     @budget.setter
     def budget(self, value):
-        self.inventory.update_item_stack_attribute(self.inventory.get_item_by_name("money"), "quantity", value)
+        self.item_handle("budget").quantity = value
 
     @property
     def services(self):
-        return self.inventory.get_item_by_name("list of services").get_feature_value("values")
+        return self.item_handle("services").get_feature("values")
 
     @property
     def inbox(self):
-        return self.inventory.get_item_by_name("inbox").get_feature_value("messages")
+        return self.item_handle("inbox").get_feature("messages")
 
     @property
     def capacity(self):
         return self.inventory.get_items_by_name("service providing medium")
 
+    @property
+    def available_medium(self):
+        return self.inventory.get_item_by_feature("available", True)
+
     @property
     def provided_services(self):
-        return self.inventory.get_item_by_name("list of provided services").get_feature_value("values")
+        return self.item_handle("provided services").get_feature("values")
 
     @provided_services.setter
     def provided_services(self, value):
-        self.inventory.get_item_by_name("list of provided services").set_feature("values", value)
+        self.item_handle("provided services").set_feature("values", ServiceTally(value))
+
+    @property
+    def total_provided_services(self):
+        return self.provided_services.total
+
+    def get_gamification_pipeline(self, techniques=None):
+        """
+        Get the gamification techniques compiled for the agent, recompiling them if a personality changed.
+
+        Args:
+            techniques (list[GamificationTechnique], optional): The techniques. Defaults to the techniques of the agent's collection.
+
+        Returns:
+            GamificationPipeline: The compiled techniques.
+        """
+        techniques = list(techniques if techniques is not None else self.techniques_collection.get_techniques())
+        if self.gamification_pipeline is None or not self.gamification_pipeline.is_current(self, techniques):
+            compatibility = None
+            if self.personality_matrix is not None:
+                compatibility = self.techniques_collection.get_compatibility(self.personality_matrix)
+            self.gamification_pipeline = GamificationPipeline(self, techniques, compatibility)
+        return self.gamification_pipeline
 
     async def setup(self):
         print(f"[Provider {self.jid}] Starting with services: {self.services} and budget: {self.budget}")
+        self.get_gamification_pipeline()
         self.add_behaviour(ReceiveMessagesBehaviour())
         self.main_FSM_behaviour = setup_FSM_provider_behaviour()
         self.add_behaviour(self.main_FSM_behaviour)
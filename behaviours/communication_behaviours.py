@@ -2,6 +2,7 @@ import json
 import asyncio
 from spade.behaviour import CyclicBehaviour, OneShotBehaviour
 from spade.message import Message
+from spade.template import BaseTemplate
 
 from utils.logger import logger
 
@@ -32,19 +33,48 @@ class ReceiveMessagesBehaviour(CyclicBehaviour):
 
 
 class SendMessageBehaviour(OneShotBehaviour):
-    def __init__(self, receiver: str=None, payload: dict=None, metadata: dict = None, message: Message = None):
+    def __init__(self, receiver: str=None, payload: dict=None, metadata: dict = None, message: Message = None, thread: str = None):
         super().__init__()
         self.receiver = receiver
         self.payload = payload
         self.metadata = metadata
         self.message = message
+        self.thread = thread
 
     async def run(self):
         if self.message:
             msg = self.message
         else:
-            msg = Message(to=self.receiver)
+            msg = Message(to=self.receiver, thread=self.thread)
             msg.body = json.dumps(self.payload)
             msg.metadata = self.metadata
         await self.send(msg)
         logger.info(f"[{self.agent.jid}] Sent message:\n{msg}\n")
+
+
+class ThreadPrefixTemplate(BaseTemplate):
+    """A template matching the messages of every thread whose id starts with a prefix."""
+    __slots__ = ("prefix",)
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+
+    def match(self, message) -> bool:
+        return message.thread is not None and message.thread.startswith(self.prefix)
+
+
+class CollectMessagesBehaviour(OneShotBehaviour):
+    """
+    A mailbox for the messages matching the template the behaviour is added with, received by
+    another behaviour (e.g. an FSM state) until the mailbox is closed. The behaviour then ends and
+    is removed from the agent, so it never takes messages meant for other behaviours.
+    """
+    def __init__(self):
+        super().__init__()
+        self.closed = asyncio.Event()
+
+    async def run(self):
+        await self.closed.wait()
+
+    def close(self):
+        self.closed.set()
@@ -1,12 +1,22 @@
 import json
-import random
+import asyncio
+import uuid
+from slixmpp.jid import JID
 from spade.behaviour import FSMBehaviour, State, OneShotBehaviour
+from spade.template import Template
 
-from behaviours.communication_behaviours import SendMessageBehaviour
+from behaviours.communication_behaviours import CollectMessagesBehaviour, SendMessageBehaviour, ThreadPrefixTemplate
 
 from utils.logger import logger
 from utils.recipe import Recipe
 from utils.service import Service
+from utils.preferences import ConsumerPreferences
+from utils.random_streams import get_random
+
+
+# Threads of the calls for proposal; replies on them are received by their tender, never by the FSM
+TENDER_THREAD_PREFIX = "tender-"
+TENDER_REPLY_TEMPLATE = ThreadPrefixTemplate(TENDER_THREAD_PREFIX)
 
 
 def determine_best_offer(offers: list[dict[str, Service]], agent=None):
@@ -36,61 +46,29 @@ def determine_best_offer(offers: list[dict[str, Service]], agent=None):
         }
 
     try:
-        personality = agent.personality.personality_descriptor.get(
-            "personality profile"
-        )
-
-        # Price sensitivity (influenced by Conscientiousness - Self-Discipline)
-        price_sensitivity = personality.get_facet_score("Self-Discipline")
-
-        # Quality focus (influenced by Conscientiousness - Dutifulness)
-        quality_focus = personality.get_facet_score("Dutifulness")
-
-        # Badge appreciation (influenced by Openness - Values)
-        badge_appreciation = personality.get_facet_score("Values")
-
-        # Risk tolerance (influenced by Extraversion - Excitement seeking)
-        risk_tolerance = personality.get_facet_score("Excitement seeking")
-
-        logger.info(
-            f"[Consumer {agent.jid}] Personality factors: price_sensitivity={price_sensitivity:.2f}, "
-            f"quality_focus={quality_focus:.2f}, badge_appreciation={badge_appreciation:.2f}, "
-            f"risk_tolerance={risk_tolerance:.2f}"
-        )
+        # Preference weights compiled from the personality (recompiled only when it changes)
+        if hasattr(agent, "preferences"):
+            preferences = agent.preferences
+        else:
+            preferences = ConsumerPreferences(
+                agent.personality.personality_descriptor.get("personality profile"),
+                get_random(agent),
+            )
 
         offer_values = []
         for offer in offers:
             service = offer.get("service")
             provider = offer.get("provider")
 
+            # Awards are lists of names (one per award) or dicts of counts per reward name
             awards = offer.get("awards", {})
             awards = sum([
-                len(awards.get("badges", [])),
-                len(awards.get("trophies", []))
+                sum(rewards.values()) if isinstance(rewards, dict) else len(rewards)
+                for rewards in (awards.get("badges", []), awards.get("trophies", []))
             ])
 
-            price_value = service.price
-            duration_value = service.duration
-            awards_value = awards
-
-            # Calculate weighted value (lower is better)
-            # Price component (higher price sensitivity means price matters more)
-            price_component = price_value * (0.5 + price_sensitivity * 0.5)
-
-            # Duration component (higher quality focus means duration matters more - longer is better quality)
-            duration_component = -duration_value * (quality_focus * 0.5)
-
-            # Badge component (higher badge appreciation means awards matter more - more is better)
-            badge_component = -awards_value * (badge_appreciation * 10)
-
-            # Risk component (higher risk tolerance means more variability is acceptable)
-            # This creates a random factor in the valuation            
-            risk_component = (random.random() * 2 - 1) * risk_tolerance * 5
-
-            # Total weighted value (lower is better)
-            weighted_value = (
-                price_component + duration_component + badge_component + risk_component
-            )
+            # Weighted value (lower is better), with a random factor scaled by risk tolerance
+            weighted_value = preferences.value(service.price, service.duration, awards)
 
             offer_values.append(
                 {"provider": provider, "service": service, "value": weighted_value}
@@ -194,46 +172,91 @@ class Tender(State):
             )
         )
 
-        for provider in providers:
-            send_message_behaviour = SendMessageBehaviour(
-                provider,
-                {"service": requested_service.to_dict()},
-                metadata={"performative": "call for proposal"},
-            )
-            self.agent.add_behaviour(send_message_behaviour)
-            logger.info(
-                f"[Consumer {self.agent.jid}] Sent query to {provider} for service {requested_service}"
-            )
-
-            reply = await self.receive(timeout=5)
-            if reply:
+        # Each tender has its own thread; only replies on it reach the tender's mailbox, so late
+        # replies to earlier tenders are never taken and other messages stay with the FSM
+        thread = f"{TENDER_THREAD_PREFIX}{uuid.uuid4().hex}"
+        replies = CollectMessagesBehaviour()
+        self.agent.add_behaviour(replies, Template(thread=thread))
+        try:
+            # Call all providers at once, so they prepare their proposals concurrently
+            for provider in providers:
+                send_message_behaviour = SendMessageBehaviour(
+                    provider,
+                    {"service": requested_service.to_dict()},
+                    metadata={"performative": "call for proposal"},
+                    thread=thread,
+                )
+                self.agent.add_behaviour(send_message_behaviour)
                 logger.info(
-                    f"[Consumer {self.agent.jid}] Received reply from {provider}: {reply.body}"
+                    f"[Consumer {self.agent.jid}] Sent query to {provider} for service {requested_service}"
                 )
-                try:
-                    msg = json.loads(reply.body)
-                    received_service = Service.from_dict(msg.get("service"))
-                    awards = msg.get("awards", {})
-                except Exception:
-                    continue
-                if reply.metadata.get("performative") == "propose":
-                    if received_service.name == requested_service.name:
-                        self.agent.current_recipe_element.get("providers").append(
-                            provider
-                        )
-                        self.offers.append(
-                            {
-                                "provider": provider,
-                                "service": received_service,
-                                "awards": awards,
-                            }
-                        )
+            pending = await self.collect_offers(replies, providers, requested_service)
+        finally:
+            replies.close()
+
+        if pending:
+            logger.info(
+                f"[Consumer {self.agent.jid}] No reply from {list(pending)} within {self.agent.tender_deadline}s"
+            )
 
         if len(self.offers) == 0:
             self.set_next_state("LookForNewProvider")
         else:
             self.set_next_state("SelectBestOffer")
 
+    async def collect_offers(self, replies: CollectMessagesBehaviour, providers: list, requested_service: Service) -> dict:
+        """
+        Collect the providers' replies to the call for proposal until all providers replied or the
+        tender's deadline passed.
+
+        Args:
+            replies (CollectMessagesBehaviour): The mailbox of the tender's thread.
+            providers (list): The providers called for a proposal.
+            requested_service (Service): The requested service.
+
+        Returns:
+            dict: The providers that did not reply, by bare JID.
+        """
+        # Providers that have not replied yet, by bare JID, to attribute the replies by sender
+        pending = {str(JID(str(provider)).bare): provider for provider in providers}
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.agent.tender_deadline
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            reply = await replies.receive(timeout=remaining)
+            if not reply:
+                break
+            provider = pending.pop(str(reply.sender.bare), None)
+            if provider is None:
+                logger.info(
+                    f"[Consumer {self.agent.jid}] Ignored reply from {reply.sender}, which is not pending in this tender"
+                )
+                continue
+            logger.info(
+                f"[Consumer {self.agent.jid}] Received reply from {provider}: {reply.body}"
+            )
+            try:
+                msg = json.loads(reply.body)
+                received_service = Service.from_dict(msg.get("service"))
+                awards = msg.get("awards", {})
+            except Exception:
+                continue
+            if reply.metadata.get("performative") == "propose":
+                if received_service.name == requested_service.name:
+                    self.agent.current_recipe_element.get("providers").append(
+                        provider
+                    )
+                    self.offers.append(
+                        {
+                            "provider": provider,
+                            "service": received_service,
+                            "awards": awards,
+                        }
+                    )
+        return pending
+
     async def on_end(self):
         self.agent.offers = self.offers
         logger.info(f"[Consumer {self.agent.jid}] Offers: {self.agent.offers}")
@@ -284,9 +307,9 @@ class BudgetCheck(State):
         )
 
     async def run(self):
-        logger.info(f"[Consumer {self.agent.jid}] Budget: {self.agent.budget}")
+        logger.info(f"[Consumer {self.agent.jid}] Budget: {self.agent.available_budget}")
 
-        budget_ok = self.agent.budget >= self.agent.best_offer.price
+        budget_ok = self.agent.available_budget >= self.agent.best_offer.price
 
         if budget_ok:
             send_message_behaviour = SendMessageBehaviour(
@@ -308,7 +331,7 @@ class BudgetCheck(State):
 
     async def on_end(self):
         logger.info(
-            f"[Consumer {self.agent.jid}] Budget check complete. Budget OK? {self.agent.budget >= self.agent.best_offer.price}"
+            f"[Consumer {self.agent.jid}] Budget check complete. Budget OK? {self.agent.available_budget >= self.agent.best_offer.price}"
         )
 
 
@@ -378,17 +401,26 @@ class ServiceComplete(State):
     async def run(self):
         self.agent.recipe.finish_current_element()
 
+        payment = {
+            "service": self.agent.best_offer.to_dict(),
+            "cost": self.agent.best_offer.price,
+        }
+        if self.agent.ledger is not None:
+            # The ledger moves the money; the provider must not credit it again
+            self.agent.ledger.record(
+                str(self.agent.jid), str(self.agent.best_provider), self.agent.best_offer.price
+            )
+            payment.update({"settlement": "ledger"})
+        else:
+            self.agent.budget -= self.agent.best_offer.price
+
         send_message_behaviour = SendMessageBehaviour(
             self.agent.best_provider,
-            {
-                "service": self.agent.best_offer.to_dict(),
-                "cost": self.agent.best_offer.price,
-            },
+            payment,
             metadata={"performative": "inform"},
         )
         self.agent.add_behaviour(send_message_behaviour)
         logger.info(f"[Consumer {self.agent.jid}] Payment sent")
-        self.agent.budget -= self.agent.best_offer.price
 
         self.set_next_state("Idle")
 
@@ -397,7 +429,7 @@ class CompleteRecipe(State):
     async def run(self):
         if self.agent.completed_recipes < 2:
             self.agent.completed_recipes += 1
-            self.agent.recipe = Recipe.random()
+            self.agent.recipe = Recipe.random(stream=self.agent.random)
             logger.info(
                 f"[Consumer {self.agent.jid}] Recipe completed. New recipe: {self.agent.recipe}"
             )
@@ -8,10 +8,10 @@ from behaviours.communication_behaviours import SendMessageBehaviour
 
 from utils.gamification import *
 from utils.inventory import Item
+from utils.rewards import defaultRewardRegistry
 from utils.service import Service
 from utils.logger import logger
 
-from utils.gamification_techniques import defaultGamificationTechniqueCollection as techniques_collection
 
 class PerformServiceBehaviour(OneShotBehaviour):
     def __init__(self, service: Service, consumer_jid: str):
@@ -23,13 +23,7 @@ class PerformServiceBehaviour(OneShotBehaviour):
         logger.info(
             f"[Provider {self.agent.jid}] Performing service {self.service.name} for {self.consumer_jid}"
         )
-        service_providing_medium = next(
-            filter(
-                lambda medium: medium.get_feature_value("available"),
-                self.agent.capacity,
-            ),
-            None,
-        )
+        service_providing_medium = self.agent.available_medium
         service_providing_medium.set_feature("available", False)
         await asyncio.sleep(self.service.duration)
         service_providing_medium.set_feature("available", True)
@@ -45,17 +39,12 @@ class PerformServiceBehaviour(OneShotBehaviour):
         logger.info(
             f"[Provider {self.agent.jid}] Service {self.service.name} complete for {self.consumer_jid}"
         )
-        self.agent.provided_services.update(
-            {
-                self.service.name: self.agent.provided_services.get(
-                    self.service.name, 0
-                )
-                + 1
-            }
-        )
+        self.agent.provided_services.increment(self.service.name)
         logger.info(
             f"[Provider {self.agent.jid}] Provided services: {self.agent.provided_services}"
         )
+        # Evaluate the goals subscribed to the number of provided services
+        self.agent.get_gamification_pipeline().publish(self.agent, "total_services", self.agent.total_provided_services)
 
 
 class Idle(State):
@@ -113,9 +102,7 @@ class ProcessProposal(State):
     async def run(self):
         if self.proposed_service.name in [
             service.name for service in self.agent.services
-        ] and any(
-            medium.get_feature_value("available") for medium in self.agent.capacity
-        ):
+        ] and self.agent.available_medium is not None:
             self.matching_service = next(
                 filter(
                     lambda service: service.name == self.proposed_service.name,
@@ -124,28 +111,23 @@ class ProcessProposal(State):
                 None,
             )
 
-            techniques = techniques_collection.get_techniques()
-
-            self.proposal = adjust_proposal_values(
-                self.matching_service, self.agent, techniques
-            )
+            # Techniques compiled for the agent at setup (recompiled if a personality changed)
+            pipeline = self.agent.get_gamification_pipeline()
+            self.proposal = pipeline.run(self.matching_service, self.agent)
             self.proposal.price = round(self.proposal.price, 2)
 
+            # Reward name -> count, read from the inventory's name aggregates
             awards = {
-                "badges": [
-                    badge.name
-                    for badge in self.agent.inventory.get_items_by_name("badge")
-                ],
-                "trophies": [
-                    trophy.name
-                    for trophy in self.agent.inventory.get_items_by_name("trophy")
-                ],
+                "badges": defaultRewardRegistry.get_counts(self.agent.inventory, "badge"),
+                "trophies": defaultRewardRegistry.get_counts(self.agent.inventory, "trophy"),
             }
 
             send_message_behaviour = SendMessageBehaviour(
                 self.message.sender,
                 {"service": self.proposal.to_dict(), "awards": awards},
                 {"performative": "propose"},
+                # Replies carry the tender's thread, so the consumer matches them to its call
+                thread=self.message.thread,
             )
             self.agent.add_behaviour(send_message_behaviour)
             logger.info(f"[Provider {self.agent.jid}] Sent proposal: {self.proposal}")
@@ -154,6 +136,7 @@ class ProcessProposal(State):
                 self.message.sender,
                 {"service": self.proposed_service.to_dict()},
                 {"performative": "refuse"},
+                thread=self.message.thread,
             )
             self.agent.add_behaviour(send_message_behaviour)
             logger.info(
@@ -209,9 +192,7 @@ class ProcessRequest(State):
             )
             if self.requested_service.name in [
                 service.name for service in self.agent.services
-            ] and any(
-                medium.get_feature_value("available") for medium in self.agent.capacity
-            ):
+            ] and self.agent.available_medium is not None:
                 send_message_behaviour = SendMessageBehaviour(
                     self.message.sender,
                     {"service": self.requested_service.to_dict()},
@@ -244,7 +225,8 @@ class ProcessInform(State):
     async def run(self):
         self.msg = json.loads(self.message.body)
         if "cost" in self.msg:
-            self.agent.budget += self.msg.get("cost")
+            if self.msg.get("settlement") != "ledger":
+                self.agent.budget += self.msg.get("cost")
             logger.info(
                 f"[Provider {self.agent.jid}] Received payment for service {self.subject_service.name}"
             )
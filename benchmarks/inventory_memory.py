@@ -0,0 +1,127 @@
+"""
+Memory benchmark comparing dict-based and compact (slot-based) inventories.
+
+Builds the inventories of a population of consumer and provider agents the same way
+ServiceConsumerAgent and ServiceProviderAgent do, without starting any SPADE agents,
+and reports the memory they take in both modes, together with the cost of serializing
+services for message payloads.
+
+Run from the repository root:
+
+    python -m benchmarks.inventory_memory --agents 10000
+"""
+import argparse
+import gc
+import sys
+import timeit
+import tracemalloc
+from collections import deque
+from dataclasses import asdict
+
+from utils.inventory import Inventory, Item
+from utils.recipe import Recipe
+from utils.service import Service
+
+
+def build_consumer_inventory(compact: bool) -> Inventory:
+    inventory = Inventory(compact=compact)
+    inventory.add_item_in_quantity(Item("money"), 50)
+    inventory.add_item(Item("recipe", {"object": Recipe.random()}))
+    inventory.add_item(Item("current recipe element", {"object": None}))
+    inventory.add_item_in_quantity(Item("completed recipe"), 0)
+    inventory.add_item(Item("list of providers", {"values": {}}))
+    return inventory
+
+
+def build_provider_inventory(compact: bool, capacity: int = 1) -> Inventory:
+    inventory = Inventory(compact=compact)
+    inventory.add_item_in_quantity(Item("money"), 100)
+    inventory.add_item(Item("list of services", {"values": [Service.random() for _ in range(2)]}))
+    inventory.add_item(Item("inbox", {"messages": deque()}))
+    inventory.add_feature_index("available")
+    for _ in range(capacity):
+        inventory.add_item(Item("service providing medium", {"available": True}))
+    inventory.add_item(Item("list of provided services", {"values": {}}))
+    return inventory
+
+
+def measure_population(agents: int, compact: bool) -> int:
+    """
+    Measure the memory held by the inventories of a population.
+
+    Args:
+        agents (int): The number of agents, half of them consumers and half providers.
+        compact (bool): Whether to use compact inventories.
+
+    Returns:
+        int: The number of bytes allocated for the population.
+    """
+    gc.collect()
+    tracemalloc.start()
+    population = [
+        build_consumer_inventory(compact) if index % 2 else build_provider_inventory(compact)
+        for index in range(agents)
+    ]
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del population
+    return allocated
+
+
+def measure_item_overhead() -> tuple[int, int]:
+    """
+    Measure the per-item overhead of the slot-based Item against an equivalent __dict__-based object.
+
+    Returns:
+        tuple[int, int]: The size in bytes of a __dict__-based item and of a slot-based Item.
+    """
+    class DictItem:
+        def __init__(self, name, features=None):
+            self.name = name
+            self.features = features or {}
+            self._observers = None
+
+    dict_item = DictItem("money")
+    return sys.getsizeof(dict_item) + sys.getsizeof(dict_item.__dict__), sys.getsizeof(Item("money"))
+
+
+def measure_serialization(repeat: int = 100000) -> tuple[float, float]:
+    """
+    Measure the time needed to serialize a service with dataclasses.asdict and with Service.to_dict.
+
+    Args:
+        repeat (int, optional): The number of serializations. Defaults to 100000.
+
+    Returns:
+        tuple[float, float]: The time in seconds for asdict and for to_dict.
+    """
+    service = Service("A", 10, 3)
+    return (
+        timeit.timeit(lambda: asdict(service), number=repeat),
+        timeit.timeit(service.to_dict, number=repeat),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the memory of dict-based and compact inventories.")
+    parser.add_argument("--agents", type=int, default=10000, help="Number of agents.")
+    args = parser.parse_args()
+
+    regular = measure_population(args.agents, compact=False)
+    compact = measure_population(args.agents, compact=True)
+    print(f"Agents:            {args.agents}")
+    print(f"Dict stacks:       {regular / 2**20:8.2f} MiB ({regular / args.agents:.0f} B/agent)")
+    print(f"Compact stacks:    {compact / 2**20:8.2f} MiB ({compact / args.agents:.0f} B/agent)")
+    print(f"Saved:             {(1 - compact / regular) * 100:8.1f} %")
+
+    dict_item, slot_item = measure_item_overhead()
+    print(f"Item (__dict__):   {dict_item:8d} B")
+    print(f"Item (__slots__):  {slot_item:8d} B")
+
+    asdict_time, to_dict_time = measure_serialization()
+    print(f"Service.asdict:    {asdict_time:8.3f} s / 100k")
+    print(f"Service.to_dict:   {to_dict_time:8.3f} s / 100k")
+
+
+if __name__ == "__main__":
+    main()
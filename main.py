@@ -4,15 +4,24 @@ import argparse
 from agents.service_provider_agent import ServiceProviderAgent
 from agents.service_consumer_agent import ServiceConsumerAgent
 
+from utils.ledger import SettlementError
 from utils.service import Service
+from utils.simulation import SimulationContext
 import utils.personality_profiles as personality_profiles
+from utils.logger import logger
 
 
-async def main(simulation_timeout=None):
+async def main(simulation_timeout=None, seed=None):
     # Example provider services
     provider1_services = [Service("A", 10, 3), Service("B", 15, 5)]
     provider2_services = [Service("A", 8, 4), Service("C", 20, 2)]
 
+    # Ledger, personality matrix, random streams and technique state of this run; every agent
+    # draws from its own stream of the run, so runs with the same seed are reproducible
+    simulation = SimulationContext(seed=seed)
+    ledger = simulation.ledger
+    logger.info(f"[Simulation] Seed: {simulation.seed}")
+
     providers = []
 
     providers.append(
@@ -20,6 +29,7 @@ async def main(simulation_timeout=None):
             "provider1@localhost",
             "password",
             provider1_services,
+            simulation=simulation,
             personality={
                 "personality profile": personality_profiles.anti_gamification
             },
@@ -30,6 +40,7 @@ async def main(simulation_timeout=None):
             "provider2@localhost",
             "password",
             provider2_services,
+            simulation=simulation,
             personality={"personality profile": personality_profiles.creative_innovator},
         )
     )
@@ -43,6 +54,7 @@ async def main(simulation_timeout=None):
         "consumer1@localhost",
         "password",
         providers={provider.jid: {"services": None} for provider in providers},
+        simulation=simulation,
     )
     await consumer.start(auto_register=True)
 
@@ -51,12 +63,26 @@ async def main(simulation_timeout=None):
     while not consumer.main_FSM_behaviour.is_killed():
         try:
             await asyncio.sleep(1)
+            try:
+                ledger.settle()
+            except SettlementError as error:
+                # The transfers stay unsettled and are retried with the next tick
+                logger.error(f"[Ledger] {error}")
             counter += 1
             if simulation_timeout and counter == simulation_timeout:
                 break
         except KeyboardInterrupt:
             break
 
+    try:
+        ledger.settle()
+    except SettlementError as error:
+        logger.error(f"[Ledger] {error}")
+    logger.info(f"[Ledger] Audit: {ledger.audit()}")
+    stats = simulation.get_stats()
+    logger.info(f"[Gamification] Compatibility cache: {stats.get('compatibility cache')}")
+    logger.info(f"[Gamification] Goal engine: {stats.get('goal engine')}")
+
     await consumer.stop()
     for provider_agent in providers:
         await provider_agent.stop()
@@ -67,6 +93,7 @@ if __name__ == "__main__":
     parser.add_argument("--nologs", action="store_true", help="Disable logging.")
     parser.add_argument("--debug", action="store_true", help="Enable debug mode.")
     parser.add_argument("--timeout", type=int, default=120, help="Timeout in seconds.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the run.")
     args = parser.parse_args()
     if args.nologs:
         import logging
@@ -77,4 +104,4 @@ if __name__ == "__main__":
 
         logging.basicConfig(level=logging.DEBUG)
 
-    asyncio.run(main(simulation_timeout=args.timeout))
+    asyncio.run(main(simulation_timeout=args.timeout, seed=args.seed))
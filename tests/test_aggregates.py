@@ -0,0 +1,79 @@
+import copy
+import pickle
+
+import numpy as np
+import pytest
+
+from agents.service_provider_agent import ServiceProviderAgent
+from utils.inventory import Inventory, Item
+from utils.service import ServiceTally
+
+
+def check_aggregates(inventory):
+    quantities = {}
+    for item, stack in inventory.get_item_stacks().items():
+        name = item.get_name().lower()
+        quantities.update({name: quantities.get(name, 0) + stack.get("quantity")})
+    assert inventory.get_total_quantity() == sum(quantities.values())
+    for name, quantity in quantities.items():
+        assert inventory.get_quantity_by_name(name.upper()) == quantity
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_quantity_aggregates_follow_every_stack_change(compact):
+    generator = np.random.default_rng(5)
+    inventory = Inventory(compact=compact)
+    items = [Item(name) for name in ("money", "Money", "badge", "trophy")]
+    for _ in range(200):
+        item = items[generator.integers(len(items))]
+        operation = generator.integers(4)
+        if operation == 0:
+            inventory.add_item_in_quantity(item, int(generator.integers(1, 5)))
+        elif not inventory.has_item(item):
+            continue
+        elif operation == 1:
+            inventory.remove_item(item)
+        elif operation == 2:
+            inventory.get_handle(item).quantity = int(generator.integers(0, 10))
+        else:
+            inventory.apply_quantity_changes({item: 1})
+        check_aggregates(inventory)
+    assert inventory.get_quantity_by_name("missing") == 0
+
+
+def test_failed_transaction_restores_the_aggregates():
+    inventory = Inventory()
+    inventory.add_item_in_quantity(Item("money"), 10)
+    with pytest.raises(RuntimeError):
+        with inventory.transaction():
+            inventory.apply_quantity_changes({inventory.get_item_by_name("money"): -5, Item("badge"): 2})
+            raise RuntimeError
+    assert inventory.get_total_quantity() == inventory.get_quantity_by_name("money") == 10
+    assert inventory.get_quantity_by_name("badge") == 0
+
+
+def test_service_tally_keeps_its_total():
+    tally = ServiceTally({"A": 2})
+    tally.increment("B")
+    tally.increment("A", 3)
+    tally["C"] = 4
+    tally.update({"C": 1}, D=2)
+    tally.setdefault("E", 1)
+    tally.pop("B")
+    tally |= {"F": 5}
+    del tally["F"]
+    assert tally.total == sum(tally.values()) == 9
+    for other in (copy.copy(tally), copy.deepcopy(tally), pickle.loads(pickle.dumps(tally))):
+        assert other == tally and other.total == 9
+    tally.popitem()
+    tally.clear()
+    assert tally.total == 0
+
+
+def test_provider_counts_provided_services():
+    provider = ServiceProviderAgent("provider@localhost", "password")
+    for name in ("A", "B", "A"):
+        provider.provided_services.increment(name)
+    assert provider.total_provided_services == 3
+    provider.provided_services = {"A": 1}
+    assert isinstance(provider.provided_services, ServiceTally) and provider.total_provided_services == 1
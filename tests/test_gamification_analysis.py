@@ -0,0 +1,45 @@
+import numpy as np
+
+from utils.gamification_analysis import ALL, GamificationAnalyzer
+from utils.gamification_techniques import defaultGamificationTechniqueCollection
+from utils.personality import PersonalityProfile
+from utils.personality_matrix import PopulationPersonalityMatrix
+from utils.service import Service
+
+
+SEED = 2024
+CATALOG = [Service("A", 10.0, 3.0), Service("B", 4.0, 1.0)]
+
+
+def make_population():
+    population = PopulationPersonalityMatrix(dtype=np.uint8)
+    for vector in np.random.default_rng(SEED).random((600, 30)):
+        population.register(PersonalityProfile(vector))
+    return population
+
+
+def analyze(population, seed=SEED, workers=1):
+    analyzer = GamificationAnalyzer(defaultGamificationTechniqueCollection.get_techniques(), CATALOG, chunk_size=200, workers=workers, seed=seed)
+    results = analyzer.analyze(population)
+    return {
+        (technique, group, value): (distribution.histogram.tolist(), distribution.count, distribution.total, distribution.minimum, distribution.maximum)
+        for technique, groups in results.items()
+        for group, distributions in groups.items()
+        for value, distribution in distributions.items()
+    }
+
+
+def test_quantized_population_is_analyzed_from_its_rows():
+    population = make_population()
+    results = analyze(population)
+    assert results == analyze(population.matrix[:population.size])
+    assert results.get(("risk taking", ALL, "price"))[1] == len(population) * len(CATALOG)
+
+
+def test_analysis_is_reproducible():
+    population = make_population()
+    results = analyze(population)
+    assert results == analyze(population)
+    # Each chunk draws from its own stream, whichever worker analyzes it
+    assert results == analyze(population, workers=2)
+    assert results != analyze(population, seed=SEED + 1)
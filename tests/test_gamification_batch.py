@@ -0,0 +1,206 @@
+import copy
+
+import numpy as np
+import pytest
+
+from utils.gamification import (
+    CompatibilityCache,
+    GamificationPipeline,
+    PriceOptimizer,
+    RiskTaking,
+    ServiceMilestone,
+    adjust_proposal_values,
+    adjust_proposal_values_batch,
+)
+from utils.gamification_rules import RuleTechnique
+from utils.gamification_techniques import defaultGamificationTechniqueCollection, reward_items
+from utils.goals import GoalEngine
+from utils.inventory import Inventory
+from utils.personality import Personality, PersonalityProfile
+from utils.random_streams import RandomStreams
+from utils.service import Service
+import utils.personality_profiles as pprofile
+
+
+SEED = 2024
+AGENTS = 24
+PROPOSALS = 400
+
+RULES = [
+    {
+        "name": "rule price optimizer",
+        "personality profile": pprofile.price_optimizer,
+        "compatibility weights": (0.6, 0.4),
+        "parameters": {"bonus": "0.1 * compatibility * strength"},
+        "goal": {"metric": "price", "target": 5, "comparison": "lte"},
+        "goal effects": {"duration": "max(1, duration * (1 - bonus))"},
+        "reward item": reward_items.get("efficiency badge"),
+    },
+    {
+        "name": "rule milestone",
+        "personality profile": pprofile.service_milestone,
+        "facets": {"drive": "Achievement striving"},
+        "parameters": {"factor": "0.05 * drive * strength"},
+        "effects": {"price": "max(1, price - price * factor)"},
+        "goal": {"metric": "total_services", "target": 3, "comparison": "gte"},
+        "goal effects": {"price": "max(1, price * 0.8)"},
+        "reward item": reward_items.get("service trophy"),
+    },
+]
+
+
+class Agent:
+    """A provider with the attributes the techniques read, without a SPADE agent behind it."""
+
+    def __init__(self, index, profile, streams):
+        self.jid = f"provider{index}@localhost"
+        self.personality = Personality(personality={"personality profile": profile})
+        self.inventory = Inventory()
+        self.total_provided_services = index % 4
+        self.budget = 100
+        self.random = streams.get_stream(self.jid)
+
+
+def make_profiles():
+    generator = np.random.default_rng(SEED)
+    named = [profile for profile in vars(pprofile).values() if isinstance(profile, PersonalityProfile)]
+    # Every other agent has a technique's profile, so every technique fires for some agents
+    return [
+        copy.deepcopy(named[index % len(named)]) if index % 2 else PersonalityProfile(generator.random(30))
+        for index in range(AGENTS)
+    ]
+
+
+def make_techniques():
+    engine = GoalEngine()
+    cache = CompatibilityCache()
+    techniques = [technique.isolate(engine, cache) for technique in defaultGamificationTechniqueCollection.get_techniques()]
+    techniques += [RuleTechnique(rule).isolate(engine, cache) for rule in RULES]
+    return techniques
+
+
+def make_run():
+    streams = RandomStreams(SEED)
+    agents = [Agent(index, profile, streams) for index, profile in enumerate(make_profiles())]
+    return agents, make_techniques()
+
+
+def make_proposals():
+    generator = np.random.default_rng(SEED + 1)
+    agent_indices = generator.integers(0, AGENTS, PROPOSALS)
+    prices = generator.uniform(1, 15, PROPOSALS)
+    durations = generator.uniform(0.5, 6, PROPOSALS)
+    # Proposals without a price or a duration
+    prices[generator.random(PROPOSALS) < 0.1] = np.nan
+    durations[generator.random(PROPOSALS) < 0.1] = np.nan
+    return prices, durations, agent_indices
+
+
+def to_service(price, duration):
+    return Service("A", None if np.isnan(price) else float(price), None if np.isnan(duration) else float(duration))
+
+
+def to_values(proposals):
+    prices = np.array([np.nan if proposal.price is None else proposal.price for proposal in proposals])
+    durations = np.array([np.nan if proposal.duration is None else proposal.duration for proposal in proposals])
+    return prices, durations
+
+
+def run_scalar(agents, techniques, prices, durations, agent_indices):
+    proposals = [
+        adjust_proposal_values(to_service(price, duration), agents[index], techniques)
+        for price, duration, index in zip(prices, durations, agent_indices)
+    ]
+    return to_values(proposals)
+
+
+def run_pipeline(agents, techniques, prices, durations, agent_indices):
+    # Compiled on the agent's first proposal, as providers do
+    pipelines = {}
+    proposals = []
+    for price, duration, index in zip(prices, durations, agent_indices):
+        agent = agents[index]
+        if index not in pipelines:
+            pipelines.update({index: GamificationPipeline(agent, techniques)})
+        proposals.append(pipelines.get(index).run(to_service(price, duration), agent))
+    return to_values(proposals)
+
+
+def run_batch(agents, techniques, prices, durations, agent_indices):
+    return adjust_proposal_values_batch(prices, durations, agent_indices, agents, techniques)
+
+
+def get_state(agents, techniques):
+    return {
+        "achieved by": {technique.name: set(technique.achieved_by) for technique in techniques},
+        "rewards": [
+            {item.get_name(): stack.get("quantity") for item, stack in agent.inventory.get_item_stacks().items()}
+            for agent in agents
+        ],
+        # The next draw of every stream, equal only if both paths drew the same numbers
+        "next draws": [agent.random.random() for agent in agents],
+    }
+
+
+@pytest.mark.parametrize("run_scalar_path", [run_scalar, run_pipeline], ids=["adjust_proposal_values", "GamificationPipeline"])
+def test_batch_matches_scalar(run_scalar_path):
+    prices, durations, agent_indices = make_proposals()
+    scalar_agents, scalar_techniques = make_run()
+    batch_agents, batch_techniques = make_run()
+
+    scalar_prices, scalar_durations = run_scalar_path(scalar_agents, scalar_techniques, prices, durations, agent_indices)
+    batch_prices, batch_durations = run_batch(batch_agents, batch_techniques, prices, durations, agent_indices)
+
+    np.testing.assert_allclose(batch_prices, scalar_prices, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(batch_durations, scalar_durations, rtol=0, atol=1e-9)
+    assert np.array_equal(np.isnan(batch_prices), np.isnan(prices))
+    assert np.array_equal(np.isnan(batch_durations), np.isnan(durations))
+    assert get_state(batch_agents, batch_techniques) == get_state(scalar_agents, scalar_techniques)
+
+
+def test_proposals_exercise_the_techniques():
+    prices, durations, agent_indices = make_proposals()
+    agents, techniques = make_run()
+    streams = RandomStreams(SEED)
+    run_batch(agents, techniques, prices, durations, agent_indices)
+
+    kinds = {type(technique) for technique in techniques}
+    assert {RiskTaking, ServiceMilestone, PriceOptimizer, RuleTechnique} <= kinds
+    # The default quality achievement goal is out of reach at the default effect strength
+    for technique in techniques:
+        if isinstance(technique, (ServiceMilestone, PriceOptimizer, RuleTechnique)):
+            assert len(technique.achieved_by), f"No agent achieved the goal of {technique.name}"
+    # Risk taking drew from the streams of the agents it fired for
+    assert any(agent.random.random() != streams.get_stream(agent.jid).random() for agent in agents)
+
+
+def test_batch_consumes_achievements_published_between_proposals():
+    prices, durations, agent_indices = make_proposals()
+    runs = [make_run() for _ in range(3)]
+    results = []
+    for path, (agents, techniques) in zip(("pipeline", "scalar", "batch"), runs):
+        pipelines = [GamificationPipeline(agent, techniques) for agent in agents]
+        first = [pipeline.run(Service("A", 10.0, 3.0), agent) for pipeline, agent in zip(pipelines, agents)]
+        # Every agent completes services; the goals are met now and take effect with the next proposal
+        for pipeline, agent in zip(pipelines, agents):
+            agent.total_provided_services = 5
+            pipeline.publish(agent, "total_services", agent.total_provided_services)
+        if path == "pipeline":
+            values = to_values([pipelines[index].run(to_service(price, duration), agents[index]) for price, duration, index in zip(prices, durations, agent_indices)])
+        elif path == "scalar":
+            values = run_scalar(agents, techniques, prices, durations, agent_indices)
+        else:
+            values = run_batch(agents, techniques, prices, durations, agent_indices)
+        results.append((to_values(first), values, get_state(agents, techniques)))
+        # Every agent that made a proposal consumed its achievements
+        proposing = [agents[index] for index in set(agent_indices.tolist())]
+        assert not any(technique.goal_engine.is_pending(technique, agent) for technique in techniques for agent in proposing)
+
+    (first, values, state), *others = results
+    for other_first, other_values, other_state in others:
+        np.testing.assert_allclose(other_first, first, rtol=0, atol=1e-9)
+        np.testing.assert_allclose(other_values, values, rtol=0, atol=1e-9)
+        assert other_state == state
+    # The milestones were achieved by publishing, not by a proposal
+    milestones = [technique for technique in runs[2][1] if technique.goal and technique.goal.get("metric") == "total_services"]
+    assert all(len(technique.achieved_by) for technique in milestones)
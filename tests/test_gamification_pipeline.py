@@ -0,0 +1,50 @@
+import numpy as np
+
+from agents.service_provider_agent import ServiceProviderAgent
+from utils.gamification import RiskTaking
+from utils.personality import PersonalityProfile
+from utils.service import Service
+from utils.simulation import SimulationContext
+import utils.personality_profiles as pprofile
+
+
+def make_provider():
+    profile = PersonalityProfile(np.random.default_rng(4).random(30))
+    return ServiceProviderAgent(
+        "provider@localhost", "password", services=[Service("A", 10.0, 3.0)],
+        personality={"age": 30, "gender": 0, "personality profile": profile}, simulation=SimulationContext(seed=4),
+    )
+
+
+def test_pipeline_is_reused_until_the_profile_changes():
+    provider = make_provider()
+    pipeline = provider.get_gamification_pipeline()
+    assert provider.get_gamification_pipeline() is pipeline
+    # Running it and publishing metrics does not change what it was compiled from
+    pipeline.run(Service("A", 10.0, 3.0), provider)
+    pipeline.publish(provider, "total_services", 1)
+    assert provider.get_gamification_pipeline() is pipeline
+
+    provider.personality.personality_descriptor.get("personality profile").set_facet_score("Order", 0.0)
+    recompiled = provider.get_gamification_pipeline()
+    assert recompiled is not pipeline and provider.get_gamification_pipeline() is recompiled
+
+
+def test_pipeline_is_recompiled_when_a_technique_changes():
+    provider = make_provider()
+    collection = provider.techniques_collection
+    technique = collection.techniques.get("risk taking")
+    pipeline = provider.get_gamification_pipeline()
+
+    technique.effect_strength *= 2
+    strengthened = provider.get_gamification_pipeline()
+    assert strengthened is not pipeline
+
+    # Techniques of the simulation share their profiles, so a new profile replaces the shared one
+    technique.personality_profile = PersonalityProfile(np.full(30, 0.5))
+    reprofiled = provider.get_gamification_pipeline()
+    assert reprofiled is not strengthened
+
+    collection.add_technique(RiskTaking("cautious risk taking", pprofile.risk_taking))
+    extended = provider.get_gamification_pipeline()
+    assert extended is not reprofiled and "cautious risk taking" in [technique.name for technique in extended.techniques]
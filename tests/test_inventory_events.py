@@ -0,0 +1,54 @@
+import asyncio
+
+from utils.inventory import Inventory, Item
+from utils.inventory_events import InventoryEventStream
+
+
+def test_inventory_changes_are_emitted_in_order():
+    inventory = Inventory()
+    stream = inventory.enable_events(source="agent0")
+    badge = Item("badge", {"tier": "bronze"})
+    inventory.add_item_in_quantity(badge, 2)
+    inventory.get_handle(badge).quantity = 5
+    inventory.add_item_stack_attribute(badge, "status", "new")
+    badge.set_feature("tier", "gold")
+    inventory.remove_item(badge)
+    events = stream.drain()
+    assert [(event.kind, event.key, event.value) for event in events] == [
+        ("added", None, 2), ("quantity", "quantity", 3), ("attribute", "status", "new"), ("feature", "tier", "gold"), ("quantity", "quantity", -1),
+    ]
+    assert [event.sequence for event in events] == list(range(5)) and {event.source for event in events} == {"agent0"}
+    assert len(stream) == 0
+
+    inventory.disable_events()
+    inventory.add_item(Item("trophy"))
+    assert stream.drain() == [] and stream.sequence == 5
+
+
+def test_full_ring_buffer_counts_overwritten_events():
+    stream = InventoryEventStream(maxlen=3)
+    for value in range(5):
+        stream.emit("agent0", "quantity", None, "quantity", value)
+    assert stream.buffer_dropped == 2
+    assert [event.value for event in stream.drain()] == [2, 3, 4]
+    stream.emit("agent0", "quantity", None, "quantity", 5)
+    assert stream.buffer_dropped == 2 and stream.queue_dropped == 0
+
+
+def test_full_queues_drop_their_oldest_events():
+    async def main():
+        stream = InventoryEventStream()
+        small, large = stream.subscribe_queue(maxsize=2), stream.subscribe_queue(maxsize=10)
+        received = []
+        stream.subscribe(received.append)
+        for value in range(5):
+            stream.emit("agent0", "quantity", None, "quantity", value)
+        assert stream.queue_dropped == 3 and stream.buffer_dropped == 0
+        assert [small.get_nowait().value for _ in range(small.qsize())] == [3, 4]
+        assert large.qsize() == len(received) == 5
+
+        stream.unsubscribe_queue(small)
+        stream.unsubscribe(received.append)
+        stream.emit("agent0", "quantity", None, "quantity", 5)
+        assert small.empty() and len(received) == 5 and stream.queue_dropped == 3
+    asyncio.run(main())
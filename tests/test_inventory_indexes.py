@@ -0,0 +1,115 @@
+import pytest
+
+from utils.inventory import Inventory, Item
+
+
+NAMES = ["Budget", "recipe", "Efficiency Badge", "Premium Badge", "badge", "list of providers", "BUDGET"]
+QUERIES = ["budget", "BADGE", "ge", "list", "missing", "", "e"]
+
+
+def linear_filter(inventory, name):
+    return [item for item in inventory.get_item_stacks() if name.lower() in item.get_name().lower()]
+
+
+def check_name_queries(inventory):
+    for query in QUERIES:
+        assert inventory.get_items_by_name(query) == linear_filter(inventory, query), query
+        exact = [item for item in inventory.get_item_stacks() if item.get_name().lower() == query.lower()]
+        assert inventory.get_items_by_exact_name(query) == exact
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_name_queries_match_the_linear_filter(compact):
+    inventory = Inventory(compact=compact)
+    items = [Item(name) for name in NAMES]
+    inventory.add_items(items)
+    check_name_queries(inventory)
+    # Cached queries are kept up to date on add and remove
+    inventory.add_item(Item("Service Badge"))
+    inventory.add_item_in_quantity(Item("budget"), 3)
+    check_name_queries(inventory)
+    for item in (items[0], items[3], items[5]):
+        inventory.remove_item(item)
+    check_name_queries(inventory)
+    inventory.add_item(items[3])
+    check_name_queries(inventory)
+    assert inventory.get_item_by_name("badge") is linear_filter(inventory, "badge")[0]
+
+
+def test_exact_name_queries_can_be_case_sensitive():
+    inventory = Inventory()
+    inventory.add_items([Item("Budget"), Item("budget")])
+    assert [item.get_name() for item in inventory.get_items_by_exact_name("budget", case_sensitive=True)] == ["budget"]
+    assert len(inventory.get_items_by_exact_name("BUDGET")) == 2
+
+
+def test_name_queries_stay_correct_after_the_cache_is_cleared():
+    inventory = Inventory()
+    inventory.add_items([Item(f"item {index}") for index in range(10)])
+    for index in range(Inventory.MAX_CACHED_NAME_QUERIES + 10):
+        inventory.get_items_by_name(f"query {index}")
+    inventory.add_item(Item("item 10"))
+    assert inventory.get_items_by_name("item") == linear_filter(inventory, "item")
+
+
+def linear_feature_filter(inventory, feature, value):
+    return [item for item in inventory.get_item_stacks() if feature in item.get_features() and item.get_feature_value(feature) == value]
+
+
+def check_feature_queries(inventory, feature, values):
+    for value in values:
+        # Indexed lookups return the items in the order they obtained the value
+        items = inventory.get_items_by_feature(feature, value)
+        assert len(items) == len(set(items)) and set(items) == set(linear_feature_filter(inventory, feature, value)), value
+        assert inventory.count_items_by_feature(feature, value) == len(items)
+
+
+def test_feature_index_follows_feature_changes_and_removals():
+    inventory = Inventory()
+    items = [Item(f"service {index}", {"type": "A" if index % 2 else "B", "available": True}) for index in range(6)]
+    inventory.add_items(items)
+    inventory.add_feature_index("type")
+    check_feature_queries(inventory, "type", ["A", "B", "C"])
+
+    items[0].set_feature("type", "A")
+    items[1].set_feature("type", "C")
+    inventory.get_handle(items[2]).set_feature("type", "C")
+    check_feature_queries(inventory, "type", ["A", "B", "C"])
+    # The indexed and unindexed features are matched together
+    items[3].set_feature("available", False)
+    assert set(inventory.get_items_by_features({"type": "A", "available": True})) == {items[0], items[5]}
+
+    inventory.remove_item(items[1])
+    items[1].set_feature("type", "A")
+    check_feature_queries(inventory, "type", ["A", "B", "C"])
+    items[5].remove_feature("type")
+    inventory.add_item(Item("service 6", {"type": "B"}))
+    check_feature_queries(inventory, "type", ["A", "B", "C"])
+
+    # Without the index, lookups scan the inventory again
+    inventory.remove_feature_index("type")
+    items[0].set_feature("type", "B")
+    check_feature_queries(inventory, "type", ["A", "B", "C"])
+
+
+def test_stack_attribute_index_follows_attribute_changes_and_removals():
+    inventory = Inventory()
+    items = [Item(f"offer {index}") for index in range(4)]
+    for index, item in enumerate(items):
+        inventory.add_item(item)
+        inventory.add_item_stack_attribute(item, "status", "open" if index % 2 else "closed")
+    inventory.add_stack_attribute_index("status")
+
+    def check():
+        for value in ("open", "closed", "expired"):
+            expected = {item: stack for item, stack in inventory.get_item_stacks().items() if stack.get("status") == value}
+            assert inventory.get_item_stacks_by_attribute("status", value) == expected
+
+    check()
+    inventory.update_item_stack_attribute(items[0], "status", "open")
+    inventory.update_item_stack_attribute(items[1], "status", "expired")
+    check()
+    inventory.remove_item_stack_attribute(items[2], "status")
+    inventory.remove_item(items[3])
+    check()
+    assert inventory.get_item_stacks_by_attributes({"status": "open", "quantity": 1}) == {items[0]: inventory.get_item_stacks().get(items[0])}
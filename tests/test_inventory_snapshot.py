@@ -0,0 +1,73 @@
+import json
+from collections import deque
+
+from utils.inventory import Inventory, Item
+from utils.recipe import Recipe
+from utils.service import Service, ServiceTally
+
+
+def make_inventory():
+    inventory = Inventory()
+    inventory.add_item_in_quantity(Item("money"), 100)
+    inventory.add_item(Item("list of provided services", {"values": ServiceTally()}))
+    inventory.add_item(Item("inbox", {"messages": deque()}))
+    inventory.add_item(Item("recipe", {"object": Recipe([{"service": Service("A"), "done": False}])}))
+    return inventory
+
+
+def test_in_place_tally_change_is_in_the_diff():
+    inventory = make_inventory()
+    tally = inventory.get_item_by_name("list of provided services")
+    before = inventory.snapshot()
+    tally.get_features()["values"].increment("A")
+    after = inventory.snapshot()
+
+    diff = after.diff(before)
+    assert list(diff["changed"]) == [tally]
+    old, new = diff["changed"][tally]
+    assert old.features["values"] == {} and old.features["values"].total == 0
+    assert new.features["values"] == {"A": 1} and new.features["values"].total == 1
+
+
+def test_in_place_deque_and_recipe_changes_are_in_the_diff():
+    inventory = make_inventory()
+    inbox = inventory.get_item_by_name("inbox")
+    recipe = inventory.get_item_by_name("recipe")
+    before = inventory.snapshot()
+    inbox.get_features()["messages"].append("request")
+    recipe.get_features()["object"].finish_current_element()
+    after = inventory.snapshot()
+
+    diff = after.diff(before)
+    assert set(diff["changed"]) == {inbox, recipe}
+    assert before.get_entry(inbox).features["messages"] == deque()
+    assert after.get_entry(inbox).features["messages"] == deque(["request"])
+    assert not before.get_entry(recipe).features["object"].is_done()
+    assert after.get_entry(recipe).features["object"].is_done()
+
+
+def test_unchanged_mutable_values_are_shared_between_snapshots():
+    inventory = make_inventory()
+    first = inventory.snapshot()
+    second = inventory.snapshot()
+    assert not second.delta
+    assert second.diff(first) == {"added": {}, "removed": {}, "changed": {}}
+
+
+def test_snapshots_do_not_follow_later_changes():
+    inventory = make_inventory()
+    tally = inventory.get_item_by_name("list of provided services")
+    snapshot = inventory.snapshot()
+    tally.get_features()["values"].increment("B", 3)
+    assert snapshot.get_entry(tally).features["values"] == {}
+
+
+def test_agent_inventory_to_json_is_serializable():
+    inventory = make_inventory()
+    inventory.get_item_by_name("list of provided services").get_features()["values"].increment("A")
+    inventory.get_item_by_name("inbox").get_features()["messages"].append("request")
+    for data in (inventory.to_json(), inventory.snapshot().to_json()):
+        items = {entry["item"]["name"]: entry["item"]["features"] for entry in json.loads(json.dumps(data))["items"]}
+        assert items["list of provided services"] == {"values": {"A": 1}}
+        assert items["inbox"] == {"messages": ["request"]}
+        assert items["recipe"]["object"]["recipe"][0]["service"]["name"] == "A"
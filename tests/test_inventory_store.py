@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from utils.inventory import Inventory, Item
+from utils.inventory_store import PopulationInventoryStore
+
+
+def make_inventory(money, media=1):
+    inventory = Inventory()
+    inventory.add_item_in_quantity(Item("money"), money)
+    for _ in range(media):
+        inventory.add_item(Item("service providing medium", {"available": True}))
+    return inventory
+
+
+def test_registered_inventories_write_through_to_their_rows():
+    store = PopulationInventoryStore(capacity=1)
+    inventories = {f"agent{index}": make_inventory(10 * index, media=index) for index in range(3)}
+    for key, inventory in inventories.items():
+        store.register(key, inventory)
+    assert store["money"].tolist() == [0, 10, 20] and store["free media"].tolist() == [0, 1, 2]
+
+    inventories["agent0"].get_item_handle("money").quantity = 50
+    inventories["agent2"].get_item_by_name("medium").set_feature("available", False)
+    inventories["agent1"].add_item_in_quantity(Item("completed recipe"), 2)
+    assert store.get_row("agent0") == {"money": 50.0, "completed recipes": 0.0, "free media": 0}
+    assert store.get_row("agent1")["completed recipes"] == 2 and store.get_row("agent2")["free media"] == 1
+    assert store.select((store["money"] > 15) & (store["free media"] > 0)) == ["agent2"]
+    assert store.select(store["money"] > 15) == ["agent0", "agent2"]
+
+
+def test_unregistered_rows_stop_following_and_are_not_selected():
+    store = PopulationInventoryStore()
+    inventory = make_inventory(10)
+    store.register("agent0", inventory)
+    store.register("agent1", make_inventory(20))
+    store.unregister("agent0")
+
+    inventory.get_item_handle("money").quantity = 99
+    assert store.get_row("agent0")["money"] == 10
+    assert store.select(store["money"] >= 0) == ["agent1"] and len(store) == 1
+    with pytest.raises(AssertionError):
+        store.unregister("agent0")
+
+
+def test_reregistered_key_gets_its_row_back():
+    store = PopulationInventoryStore()
+    first = make_inventory(10)
+    store.register("agent0", first)
+    store.register("agent1", make_inventory(20))
+    store.unregister("agent0")
+
+    # A restarted agent, with a new inventory
+    second = make_inventory(30, media=2)
+    assert store.register("agent0", second) == 0
+    assert store.get_row("agent0")["money"] == 30 and store.get_row("agent0")["free media"] == 2
+    first.get_item_handle("money").quantity = 1
+    second.get_item_handle("money").quantity = 5
+    assert store["money"].tolist() == [5, 20] and len(store) == 2
+    with pytest.raises(AssertionError):
+        store.register("agent0", second)
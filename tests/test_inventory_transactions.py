@@ -0,0 +1,82 @@
+import pytest
+
+from utils.inventory import Inventory, Item
+
+
+def make_inventory():
+    inventory = Inventory()
+    inventory.add_item_in_quantity(Item("budget"), 10)
+    inventory.add_item_in_quantity(Item("badge"), 2)
+    return inventory
+
+
+def get_state(inventory):
+    return {item.get_name(): dict(stack) for item, stack in inventory.get_item_stacks().items()}, inventory.get_total_quantity()
+
+
+def test_rollback_restores_quantities_and_stacks():
+    inventory = make_inventory()
+    before = get_state(inventory)
+    budget = inventory.get_item_by_name("budget")
+    with pytest.raises(RuntimeError):
+        with inventory.transaction():
+            inventory.apply_quantity_changes({budget: -4, Item("trophy"): 1})
+            inventory.add_item_stack_attribute(budget, "tier", "gold")
+            inventory.remove_item(inventory.get_item_by_name("badge"))
+            raise RuntimeError
+    assert get_state(inventory) == before
+    assert inventory.get_items_by_name("trophy") == []
+
+
+def test_nested_savepoint_rolls_back_only_the_inner_transaction():
+    inventory = make_inventory()
+    budget = inventory.get_item_by_name("budget")
+    with inventory.transaction():
+        inventory.apply_quantity_changes({budget: -3})
+        with pytest.raises(RuntimeError):
+            with inventory.transaction():
+                inventory.apply_quantity_changes({budget: -5})
+                inventory.add_item(Item("trophy"))
+                raise RuntimeError
+        assert inventory.get_item_quantity(budget) == 7
+        assert inventory.get_items_by_name("trophy") == []
+    assert inventory.get_item_quantity(budget) == 7
+
+
+def test_failed_transaction_rolls_back_every_level():
+    inventory = make_inventory()
+    before = get_state(inventory)
+    budget = inventory.get_item_by_name("budget")
+    with pytest.raises(RuntimeError):
+        with inventory.transaction():
+            inventory.apply_quantity_changes({budget: -3})
+            with inventory.transaction():
+                inventory.apply_quantity_changes({budget: -5})
+            raise RuntimeError
+    assert get_state(inventory) == before
+
+
+def test_rollback_revalidates_handles_of_dropped_stacks():
+    inventory = make_inventory()
+    badge = inventory.get_item_by_name("badge")
+    handle = inventory.get_handle(badge)
+    with pytest.raises(RuntimeError):
+        with inventory.transaction():
+            inventory.remove_item(badge)
+            inventory.remove_item(badge)
+            assert not handle.valid
+            raise RuntimeError
+    assert handle.valid and inventory.get_handle(badge) is handle
+    handle.quantity = 5
+    assert inventory.get_item_quantity(badge) == 5 and inventory.get_quantity_by_name("badge") == 5
+
+
+def test_rollback_invalidates_handles_of_inserted_stacks():
+    inventory = make_inventory()
+    trophy = Item("trophy")
+    with pytest.raises(RuntimeError):
+        with inventory.transaction():
+            inventory.add_item(trophy)
+            handle = inventory.get_handle(trophy)
+            raise RuntimeError
+    assert not handle.valid and not inventory.has_item(trophy)
@@ -0,0 +1,49 @@
+import pytest
+
+from agents.service_consumer_agent import ServiceConsumerAgent
+from utils.inventory import Inventory, Item
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_handle_reads_and_writes_the_stack(compact):
+    inventory = Inventory(compact=compact)
+    inventory.add_item_in_quantity(Item("money", {"currency": "EUR"}), 10)
+    handle = inventory.get_item_handle("money")
+    assert inventory.get_handle(inventory.get_item_by_name("money")) is handle
+
+    handle.quantity = 4
+    assert handle.quantity == inventory.get_item_quantity(handle.item) == 4
+    # The aggregates are kept up to date through the handle
+    assert inventory.get_quantity_by_name("MONEY") == inventory.get_total_quantity() == 4
+    handle.set_feature("currency", "USD")
+    assert handle.get_feature("currency") == "USD" and inventory.get_item_by_feature("currency", "USD") is handle.item
+
+
+def test_handle_is_invalidated_when_its_stack_is_removed():
+    inventory = Inventory()
+    item = Item("badge")
+    inventory.add_item(item)
+    handle = inventory.get_handle(item)
+    inventory.remove_item(item)
+    assert not handle.valid
+    with pytest.raises(AssertionError):
+        handle.quantity = 2
+
+    inventory.add_item(item)
+    assert inventory.get_handle(item) is not handle and inventory.get_handle(item).quantity == 1
+
+
+def test_agent_properties_go_through_the_schema_handles():
+    agent = ServiceConsumerAgent("consumer@localhost", "password", budget=30)
+    assert set(agent.item_handles) == set(agent.inventory_schema)
+    handle = agent.item_handle("budget")
+    agent.budget -= 12
+    assert agent.budget == 18 and handle.quantity == 18 and agent.inventory.get_quantity_by_name("money") == 18
+    assert agent.item_handle("budget") is handle
+
+    # A removed item is resolved again once it is back
+    money = handle.item
+    for _ in range(18):
+        agent.inventory.remove_item(money)
+    agent.inventory.add_item_in_quantity(Item("money"), 5)
+    assert agent.budget == 5 and agent.item_handle("budget") is not handle
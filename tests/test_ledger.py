@@ -0,0 +1,108 @@
+import pytest
+
+from utils.inventory import Inventory, Item
+from utils.ledger import SettlementError, SettlementLedger
+
+
+def make_ledger(balances=(100, 50, 0)):
+    ledger = SettlementLedger(batch_size=1000)
+    inventories = {}
+    for index, balance in enumerate(balances):
+        inventory = Inventory()
+        inventory.add_item_in_quantity(Item("budget"), balance)
+        inventories.update({f"agent{index}": inventory})
+        ledger.open_account(f"agent{index}", inventory.get_item_handle("budget"))
+    return ledger, inventories
+
+
+def test_record_settle_and_audit():
+    ledger, inventories = make_ledger()
+    ledger.record("agent0", "agent1", 30)
+    ledger.record("agent1", "agent2", 70)
+    # Unsettled entries only show in the available balance
+    assert ledger.get_balance("agent1") == 50 and ledger.get_available_balance("agent1") == 10
+
+    assert ledger.settle() == 2
+    assert [ledger.get_balance(key) for key in inventories] == [70, 10, 70]
+    assert ledger.settle() == 0
+    assert list(ledger.get_entries()) == [("agent0", "agent1", 30), ("agent1", "agent2", 70)]
+    audit = ledger.audit()
+    assert audit["conserved"] and audit["discrepancies"] == {}
+    assert audit["recorded"] == audit["settled"] == 100 and audit["settled entries"] == 2
+
+
+def test_batch_is_settled_automatically():
+    ledger, inventories = make_ledger()
+    ledger.batch_size = 3
+    for _ in range(3):
+        ledger.record("agent0", "agent2", 1)
+    assert ledger.settled == 3 and ledger.get_balance("agent2") == 3
+
+
+def test_invalid_transfers_raise_value_error():
+    ledger, inventories = make_ledger()
+    with pytest.raises(ValueError):
+        ledger.record("agent0", "agent1", -1)
+    ledger.record("agent2", "agent0", 0)
+    with pytest.raises(ValueError):
+        ledger.record("agent1", "agent0", 51)
+    assert len(ledger) == 1
+
+
+def test_audit_reports_money_changed_outside_the_ledger():
+    ledger, inventories = make_ledger()
+    ledger.record("agent0", "agent1", 30)
+    ledger.settle()
+    inventories["agent1"].get_item_handle("budget").quantity += 5
+
+    audit = ledger.audit()
+    assert not audit["conserved"]
+    assert audit["discrepancies"] == {"agent1": 5} and audit["imbalance"] == 5
+
+
+def test_failed_settlement_is_rolled_back_and_retried(monkeypatch):
+    ledger, inventories = make_ledger()
+    ledger.record("agent0", "agent1", 30)
+    ledger.record("agent1", "agent2", 20)
+    apply_quantity_changes = inventories["agent2"].apply_quantity_changes
+
+    def fail(changes):
+        apply_quantity_changes(changes)
+        raise RuntimeError("inventory failure")
+
+    monkeypatch.setattr(inventories["agent2"], "apply_quantity_changes", fail)
+    with pytest.raises(SettlementError):
+        ledger.settle()
+    # Nothing was applied and the entries are still unsettled
+    assert [ledger.get_balance(key) for key in inventories] == [100, 50, 0]
+    assert ledger.settled == 0 and ledger.audit()["conserved"]
+
+    monkeypatch.undo()
+    assert ledger.settle() == 2
+    assert [ledger.get_balance(key) for key in inventories] == [70, 60, 20]
+    assert ledger.audit()["conserved"]
+
+
+def test_settlement_waits_for_a_removed_money_item():
+    ledger, inventories = make_ledger()
+    ledger.record("agent0", "agent1", 30)
+    budget = inventories["agent1"].get_item_by_name("budget")
+    for _ in range(50):
+        inventories["agent1"].remove_item(budget)
+    with pytest.raises(SettlementError):
+        ledger.settle()
+    assert ledger.settled == 0
+
+    # Added back, the item is bound again and the entries are settled
+    inventories["agent1"].add_item_in_quantity(budget, 50)
+    assert ledger.settle() == 1
+    assert ledger.get_balance("agent1") == 80
+
+
+def test_settlement_rejects_accounts_spent_outside_the_ledger():
+    ledger, inventories = make_ledger()
+    ledger.record("agent1", "agent0", 50)
+    inventories["agent1"].get_item_handle("budget").quantity = 10
+    with pytest.raises(SettlementError):
+        ledger.settle()
+    assert ledger.get_balance("agent0") == 100 and ledger.settled == 0
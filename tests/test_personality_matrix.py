@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from utils.gamification import TechniqueCompatibility
+from utils.gamification_techniques import defaultGamificationTechniqueCollection
+from utils.personality import PersonalityProfile
+from utils.personality_matrix import PersonalityIndex, PopulationPersonalityMatrix, compatibility_matrix
+
+
+@pytest.fixture(params=[(np.float64, False), (np.float32, True), (np.uint8, True)], ids=["float64", "float32 views", "uint8 views"])
+def population(request):
+    dtype, views = request.param
+    matrix = PopulationPersonalityMatrix(4, dtype=dtype, views=views)
+    generator = np.random.default_rng(7)
+    for _ in range(50):
+        matrix.register(PersonalityProfile(generator.random(30)))
+    return matrix
+
+
+def test_changed_rows(population):
+    version = population.version
+    population.profiles[3].set_facet_score("Order", 0.25)
+    population.register(PersonalityProfile(np.full(30, 0.5)))
+    assert population.get_changed_rows(version).tolist() == [3, 50]
+    assert not len(population.get_changed_rows(population.version))
+
+
+def test_technique_compatibility_updates_only_changed_rows(population):
+    techniques = defaultGamificationTechniqueCollection.get_techniques()
+    compatibility = TechniqueCompatibility(population, techniques)
+    compatibility.refresh()
+    technique_vectors = compatibility.technique_vectors
+
+    population.profiles[10].set_facet_score("Order", 0.0)
+    population.profiles[20].set_personality_vector(np.full(30, 0.3))
+    for _ in range(10):
+        population.register(PersonalityProfile(np.random.default_rng(len(population)).random(30)))
+    stale = compatibility.values[:population.size].copy()
+    values = compatibility.refresh()
+
+    assert values.shape == (60, len(techniques))
+    np.testing.assert_allclose(values, compatibility_matrix(population.vectors, technique_vectors))
+    # Rows of unchanged profiles keep their values
+    unchanged = np.setdiff1d(np.arange(50), [10, 20])
+    assert np.array_equal(values[unchanged], stale[unchanged])
+
+
+def test_index_follows_changes(population):
+    index = PersonalityIndex(population, block_size=16)
+    queries = np.random.default_rng(3).random((5, 30))
+    index.query_batch(queries, 3)
+
+    population.profiles[7].set_personality_vector(queries[0])
+    index.add(PersonalityProfile(queries[1]))
+    rows, distances = index.query_batch(queries, 3)
+
+    expected = np.linalg.norm(queries[:, None] - population.vectors[None], axis=2)
+    np.testing.assert_allclose(distances, np.sort(expected, axis=1)[:, :3], atol=1e-5)
+    assert rows[0, 0] == 7 and rows[1, 0] == 50
+    np.testing.assert_allclose(index.norms[:population.size], np.einsum("ij,ij->i", population.vectors, population.vectors), rtol=1e-6)
+
+
+def test_scores_are_changed_only_through_the_setters(population):
+    profile = population.profiles[5]
+    version, profile_version = population.version, profile.version
+    with pytest.raises(ValueError):
+        profile.scores[0] = 0.9
+    with pytest.raises(ValueError):
+        profile.get_factor_scores("Openness")[:] = 0.9
+    assert population.version == version and profile.version == profile_version
+
+    profile.scores = np.full(30, 0.9)
+    assert profile.version == profile_version + 1
+    assert population.get_changed_rows(version).tolist() == [5]
+    np.testing.assert_allclose(population.get_vectors([5])[0], 0.9, atol=1 / 255)
@@ -0,0 +1,42 @@
+import numpy as np
+
+from agents.service_consumer_agent import ServiceConsumerAgent
+from utils.personality import PersonalityProfile
+from utils.preferences import ConsumerPreferences
+from utils.random_streams import RandomStreams
+
+
+def make_consumer():
+    profile = PersonalityProfile(np.full(30, 0.5))
+    return ServiceConsumerAgent("consumer@localhost", "password", personality={"age": 30, "gender": 0, "personality profile": profile}, random_streams=RandomStreams(1))
+
+
+def test_preferences_are_compiled_once_per_profile_version():
+    consumer = make_consumer()
+    preferences = consumer.preferences
+    assert consumer.preferences is preferences and preferences.price == 0.75
+
+    profile = consumer.personality.personality_descriptor.get("personality profile")
+    profile.set_facet_score("Self-Discipline", 1.0)
+    assert consumer.preferences is not preferences
+    assert consumer.preferences.price == 1.0 and consumer.preferences.is_current(profile)
+    # Facets the preferences do not depend on still change the version
+    recompiled = consumer.preferences
+    profile.set_facet_score("Order", 0.1)
+    assert consumer.preferences is not recompiled and consumer.preferences.price == 1.0
+
+
+def test_preferences_follow_a_replaced_profile():
+    consumer = make_consumer()
+    preferences = consumer.preferences
+    consumer.personality.update_personality_descriptor({"personality profile": PersonalityProfile(np.zeros(30))})
+    assert consumer.preferences is not preferences and consumer.preferences.price == 0.5
+
+
+def test_value_weights_the_offer():
+    vector = np.zeros(30)
+    vector[PersonalityProfile.facet_to_index["Self-Discipline"]] = 1.0
+    vector[PersonalityProfile.facet_to_index["Values"]] = 0.5
+    preferences = ConsumerPreferences(PersonalityProfile(vector), RandomStreams(1).get_stream("consumer"))
+    # Without risk tolerance the value does not depend on the stream
+    assert preferences.value(10, 4, 2) == 10 * 1.0 + 4 * 0.0 - 2 * 5.0
@@ -0,0 +1,46 @@
+import numpy as np
+
+from agents.chimera_agent import ChimeraAgent
+from utils.personality import PersonalityProfile, ProfileInterner
+from utils.personality_matrix import PopulationPersonalityMatrix
+
+
+def test_interned_profiles_share_scores_until_changed():
+    interner = ProfileInterner()
+    vector = np.random.default_rng(1).random(30)
+    first, second = interner.intern(PersonalityProfile(vector)), interner.intern(PersonalityProfile(vector))
+    assert first is not second and first.canonical is second.canonical
+    assert np.shares_memory(first.scores, second.scores)
+    assert len(interner) == 1 and interner.hits == 1
+
+    first.set_facet_score("Order", 0.0)
+    # The change is not seen by the other profile nor by the pool
+    assert first.get_facet_score("Order") == 0.0 and first.canonical is first
+    assert second.get_facet_score("Order") == vector[PersonalityProfile.facet_to_index["Order"]]
+    assert interner.intern(PersonalityProfile(vector)).canonical is second.canonical
+
+
+def test_profiles_hash_by_content():
+    vector = np.random.default_rng(2).random(30)
+    profile = ProfileInterner().intern(PersonalityProfile(vector))
+    assert profile == PersonalityProfile(vector) and hash(profile) == hash(PersonalityProfile(vector))
+    assert len({profile, PersonalityProfile(vector), PersonalityProfile()}) == 2
+
+
+def test_agents_with_the_same_profile_share_a_row_until_one_changes():
+    matrix = PopulationPersonalityMatrix()
+    vector = np.random.default_rng(3).random(30)
+    agents = [
+        ChimeraAgent(f"agent{index}@localhost", "password", {"age": 30, "gender": 0, "personality profile": PersonalityProfile(vector)}, personality_matrix=matrix)
+        for index in range(3)
+    ]
+    profiles = [agent.personality.personality_descriptor.get("personality profile") for agent in agents]
+    assert len({profile.canonical for profile in profiles}) == 1
+    assert {matrix.get_row(profile) for profile in profiles} == {0} and len(matrix) == 1
+
+    profiles[1].set_facet_score("Order", 0.0)
+    assert matrix.get_row(profiles[1]) == 1 and len(matrix) == 2
+    np.testing.assert_array_equal(matrix.get_vector(1), profiles[1].scores)
+    # The shared row still holds the pooled scores
+    np.testing.assert_array_equal(matrix.get_vector(0), vector)
+    assert matrix.get_row(profiles[0]) == matrix.get_row(profiles[2]) == 0
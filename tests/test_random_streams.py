@@ -0,0 +1,73 @@
+import numpy as np
+
+from agents.service_consumer_agent import ServiceConsumerAgent
+from agents.service_provider_agent import ServiceProviderAgent
+from behaviours.consumer_behaviours import determine_best_offer
+from utils.random_streams import RandomStreams, get_random, random_batch
+from utils.service import Service
+from utils.simulation import SimulationContext
+import utils.personality_profiles as personality_profiles
+
+
+def test_streams_are_reproducible_per_key():
+    first, second = RandomStreams(11), RandomStreams(11)
+    # Created and drawn in a different order, the streams of a key are the same
+    draws = {key: first.get_stream(key).random_batch(5).tolist() for key in ("a", "b", "c")}
+    assert {key: second.get_stream(key).random_batch(5).tolist() for key in ("c", "a", "b")} == draws
+    assert first.get_stream("a") is first.get_stream("a")
+
+
+def test_streams_are_independent_per_key_and_seed():
+    streams = RandomStreams(11)
+    a = streams.get_stream("a").random_batch(1000)
+    b = streams.get_stream("b").random_batch(1000)
+    assert not np.array_equal(a, b)
+    assert abs(np.corrcoef(a, b)[0, 1]) < 0.1
+    assert not np.array_equal(RandomStreams(12).get_stream("a").random_batch(1000), a)
+    # Drawing from one stream leaves the others unchanged
+    assert RandomStreams(11).get_stream("b").random_batch(1000).tolist() == b.tolist()
+
+
+def test_single_draws_match_batches():
+    stream, batch = RandomStreams(3, buffer_size=7).get_stream("a"), RandomStreams(3, buffer_size=7).get_stream("a")
+    assert [stream.random() for _ in range(20)] == batch.random_batch(20).tolist()
+
+
+def test_batched_draws_follow_each_agents_stream():
+    streams = RandomStreams(5)
+    agents = [type("Agent", (), {"random": streams.get_stream(key)})() for key in ("x", "y")]
+    draws = random_batch(agents, np.array([1, 0, 1, 1, 0]))
+    expected = RandomStreams(5)
+    x, y = expected.get_stream("x"), expected.get_stream("y")
+    assert draws.tolist() == [y.random(), x.random(), y.random(), y.random(), x.random()]
+    assert get_random(agents[0]) is agents[0].random
+
+
+def run(seed, rounds=6):
+    simulation = SimulationContext(seed=seed)
+    providers = [
+        ServiceProviderAgent("provider1@localhost", "password", [Service("A", 10, 3), Service("B", 15, 5)], simulation=simulation,
+                             personality={"personality profile": personality_profiles.anti_gamification}),
+        ServiceProviderAgent("provider2@localhost", "password", [Service("A", 8, 4), Service("C", 20, 2)], simulation=simulation,
+                             personality={"personality profile": personality_profiles.creative_innovator}),
+        # A provider with a random personality and random services
+        ServiceProviderAgent("provider3@localhost", "password", simulation=simulation),
+    ]
+    consumer = ServiceConsumerAgent("consumer1@localhost", "password", providers={provider.jid: {} for provider in providers}, simulation=simulation)
+    history = {"recipe": str(consumer.recipe), "personality": consumer.personality.get_personality_vector().tolist(), "rounds": []}
+    for _ in range(rounds):
+        for name in ("A", "B", "C"):
+            offers = []
+            for provider in providers:
+                service = next((service for service in provider.services if service.name == name), None)
+                if service is not None:
+                    proposal = provider.get_gamification_pipeline().run(Service(service.name, service.price, service.duration), provider)
+                    offers.append({"provider": str(provider.jid), "service": proposal, "awards": {}})
+            choice = determine_best_offer(offers, consumer)
+            history["rounds"].append(([offer["service"].to_dict() for offer in offers], choice))
+    return history
+
+
+def test_runs_with_the_same_seed_make_the_same_offers_and_choices():
+    assert run(42) == run(42)
+    assert run(42) != run(43)
@@ -0,0 +1,34 @@
+import pytest
+
+from utils.inventory import Inventory, Item
+from utils.rewards import RewardRegistry
+
+
+def test_kind_is_stored_with_the_prototype():
+    registry = RewardRegistry()
+    # The kind is not read from the name
+    medal = registry.intern(Item("Gold Star", {"value": 1}), kind="medal")
+    assert medal.get_features()["kind"] == "medal"
+    assert registry.intern(Item("Gold Star", {"value": 1})) is medal
+    assert registry.intern(Item("Speed Badge", {"kind": "trophy"})).get_features()["kind"] == "trophy"
+
+    inventory = Inventory()
+    registry.award(inventory, Item("Gold Star", {"value": 1}), 2)
+    registry.award(inventory, Item("Speed Badge", {"kind": "trophy"}))
+    assert registry.get_counts(inventory, "medal") == {"Gold Star": 2}
+    assert registry.get_counts(inventory, "badge") == {}
+    assert registry.count(inventory, "trophy") == 1
+
+
+def test_conflicting_rewards_raise_value_error():
+    registry = RewardRegistry()
+    registry.intern(Item("Gold Star", {"value": 1, "kind": "medal"}))
+    with pytest.raises(ValueError):
+        registry.intern(Item("gold star", {"value": 2, "kind": "medal"}))
+    with pytest.raises(ValueError):
+        registry.intern(Item("Gold Star", {"value": 1}), kind="badge")
+    with pytest.raises(ValueError):
+        registry.intern(Item("Silver Star", {"kind": "medal"}), kind="badge")
+    with pytest.raises(ValueError):
+        registry.intern(Item("Bronze Star"))
+    assert len(registry) == 1
@@ -0,0 +1,54 @@
+from agents.service_provider_agent import ServiceProviderAgent
+from utils.gamification_techniques import defaultGamificationTechniqueCollection
+from utils.personality import PersonalityProfile
+from utils.service import Service
+from utils.simulation import SimulationContext
+import utils.personality_profiles as pprofile
+
+
+def make_provider(simulation):
+    # A provider of the same name in each simulation, keen on milestones
+    profile = PersonalityProfile(pprofile.service_milestone.get_personality_vector())
+    return ServiceProviderAgent(
+        "provider@localhost", "password", services=[Service("A", 10.0, 3.0)],
+        personality={"age": 30, "gender": 0, "personality profile": profile}, simulation=simulation,
+    )
+
+
+def test_goal_state_is_kept_per_simulation():
+    first, second = SimulationContext(seed=8), SimulationContext(seed=8)
+    providers = [make_provider(simulation) for simulation in (first, second)]
+    pipelines = [provider.get_gamification_pipeline() for provider in providers]
+    assert "service milestone" in [technique.name for technique, _ in pipelines[0].steps]
+
+    default_engine = defaultGamificationTechniqueCollection.techniques.get("service milestone").goal_engine
+    default_events = default_engine.get_stats().get("events")
+    events = [simulation.goal_engine.get_stats().get("events") for simulation in (first, second)]
+    achieved = pipelines[0].publish(providers[0], "total_services", 5)
+    assert [technique.name for technique in achieved] == ["service milestone"]
+    assert [simulation.goal_engine.get_stats().get("events") for simulation in (first, second)] == [events[0] + 1, events[1]]
+    # The same agent has not achieved the goal in the other simulation, nor in the default techniques
+    assert pipelines[1].publish(providers[1], "total_services", 1) == []
+    assert [technique.name for technique in pipelines[1].publish(providers[1], "total_services", 5)] == ["service milestone"]
+    assert default_engine.get_stats().get("events") == default_events
+
+
+def test_simulations_share_definitions_but_not_state():
+    first, second = SimulationContext(seed=8), SimulationContext(seed=8)
+    first_technique, second_technique = (simulation.techniques.techniques.get("service milestone") for simulation in (first, second))
+    assert first_technique is not second_technique
+    assert first_technique.personality_profile is second_technique.personality_profile
+    assert first_technique.reward_item is second_technique.reward_item
+
+    providers = [make_provider(simulation) for simulation in (first, second)]
+    assert len(first.personality_matrix) == len(second.personality_matrix) == 1
+    assert first.personality_matrix is not second.personality_matrix and first.ledger is not second.ledger
+    # Equal seeds give equal but separate streams
+    assert providers[0].random is not providers[1].random
+    assert providers[0].random.random_batch(5).tolist() == providers[1].random.random_batch(5).tolist()
+    assert SimulationContext(seed=9).random_streams.get_stream("provider@localhost").random() != providers[0].random.random()
+
+    first_technique.effect_strength = 0
+    assert second_technique.effect_strength != 0
+    first.techniques.remove_reward_item("service trophy")
+    assert second.techniques.get_reward_item("service trophy") is not None
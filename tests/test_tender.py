@@ -0,0 +1,103 @@
+import asyncio
+import json
+import time
+
+from spade.agent import Agent
+from spade.message import Message
+
+from behaviours.communication_behaviours import CollectMessagesBehaviour, SendMessageBehaviour
+from behaviours.consumer_behaviours import TENDER_REPLY_TEMPLATE, Tender
+from utils.service import Service
+
+
+def make_message(sender, performative, body, thread=None):
+    message = Message(to="consumer@localhost", sender=sender, body=json.dumps(body), thread=thread)
+    # Read by the behaviours, as set by SendMessageBehaviour
+    message.metadata = {"performative": performative}
+    return message
+
+
+class TenderAgent(Agent):
+    """A consumer that is never started: calls for proposal are answered by fake providers."""
+
+    def __init__(self, delays, deadline=0.5):
+        super().__init__("consumer@localhost", "password")
+        # Provider -> seconds until it replies (None: it never replies)
+        self.delays = delays
+        self.tender_deadline = deadline
+        self.providers = {provider: {"services": ["A"]} for provider in delays}
+        self.current_recipe_element = {"service": Service("A"), "providers": []}
+        self.calls = []
+        self.fsm = CollectMessagesBehaviour()
+        self.add_behaviour(self.fsm, ~TENDER_REPLY_TEMPLATE)
+
+    def add_behaviour(self, behaviour, template=None):
+        if isinstance(behaviour, SendMessageBehaviour):
+            self.calls.append(behaviour)
+            delay = self.delays.get(behaviour.receiver)
+            if delay is not None:
+                asyncio.get_running_loop().call_later(delay, self.reply, behaviour)
+            return
+        super().add_behaviour(behaviour, template)
+
+    def reply(self, call):
+        sender = str(call.receiver).split("/")[0] + "/replies"
+        self.dispatch(make_message(sender, "propose", {"service": {"name": "A", "price": 5, "duration": 2}, "awards": {}}, call.thread))
+
+
+def run_tender(agent, before=None):
+    async def main():
+        tender = Tender()
+        tender.agent = agent
+        await tender.on_start()
+        if before is not None:
+            before(agent)
+        start = time.monotonic()
+        await tender.run()
+        await tender.on_end()
+        return tender, time.monotonic() - start
+    return asyncio.run(main())
+
+
+def test_replies_are_attributed_to_the_providers_called():
+    # Provider JIDs with resources and upper case, replies from other resources
+    agent = TenderAgent({"Provider1@localhost/home": 0.05, "provider2@LOCALHOST": 0.1})
+    tender, elapsed = run_tender(agent)
+    assert tender.next_state == "SelectBestOffer"
+    assert [offer["provider"] for offer in agent.offers] == ["Provider1@localhost/home", "provider2@LOCALHOST"]
+    # Every provider replied, so the tender did not wait for the deadline
+    assert elapsed < agent.tender_deadline
+    assert len({call.thread for call in agent.calls}) == 1
+
+
+def test_tender_ends_at_the_deadline():
+    agent = TenderAgent({"provider1@localhost": 0.05, "provider2@localhost": None}, deadline=0.3)
+    tender, elapsed = run_tender(agent)
+    assert elapsed >= 0.3
+    assert [offer["provider"] for offer in agent.offers] == ["provider1@localhost"]
+    assert tender.next_state == "SelectBestOffer"
+
+
+def test_late_replies_to_earlier_tenders_are_ignored():
+    agent = TenderAgent({"provider1@localhost": None}, deadline=0.2)
+    late = make_message("provider1@localhost/r", "propose", {"service": {"name": "A", "price": 1, "duration": 1}}, "tender-earlier")
+    tender, _ = run_tender(agent, before=lambda agent: agent.dispatch(late))
+    assert agent.offers == [] and tender.next_state == "LookForNewProvider"
+    # Not handed to the FSM either
+    assert agent.fsm.mailbox_size() == 0
+
+
+def test_other_messages_stay_with_the_fsm_in_order():
+    agent = TenderAgent({"provider1@localhost": 0.1})
+    messages = [make_message("provider2@localhost/r", performative, {}) for performative in ("inform", "confirm")]
+
+    def send(agent):
+        for message in messages:
+            agent.dispatch(message)
+
+    run_tender(agent, before=send)
+    assert len(agent.offers) == 1
+
+    async def receive():
+        return [await agent.fsm.receive(timeout=1) for _ in messages]
+    assert asyncio.run(receive()) == messages
@@ -1,9 +1,17 @@
+import copy
+from collections import OrderedDict
+from types import SimpleNamespace
+
 import numpy as np
 
 from utils.personality import PersonalityProfile
+from utils.personality_matrix import PopulationPersonalityMatrix, compatibility_matrix
+from utils.rewards import defaultRewardRegistry
+from utils.goals import defaultGoalEngine
+from utils.random_streams import RandomStreams, get_random, random_batch
 from utils.logger import logger
 
-def adjust_proposal_values(initial_proposal, agent=None, techniques=None):
+def adjust_proposal_values(initial_proposal, agent=None, techniques=None, compatibility=None):
     """
     Adjust proposal values based on gamification techniques.
     
@@ -11,6 +19,7 @@ def adjust_proposal_values(initial_proposal, agent=None, techniques=None):
         initial_proposal: The initial service proposal
         agent: The agent making the proposal
         techniques: List of gamification techniques to apply
+        compatibility: Precomputed compatibilities of the agent's population with the techniques (optional)
         
     Returns:
         Service: Modified service proposal
@@ -18,20 +27,486 @@ def adjust_proposal_values(initial_proposal, agent=None, techniques=None):
     if not agent or not techniques:
         return initial_proposal
         
-    proposal = initial_proposal
-    context = {"proposal": proposal}
-
-    if hasattr(agent, "provided_services"):
-        context["total_services"] = sum(agent.provided_services.values())
-    if hasattr(agent, "budget"):
-        context["budget"] = agent.budget
+    context = create_context(initial_proposal, agent, compatibility)
     
     for technique in techniques:
         context = technique.apply(agent, context)
         
     return context.get("proposal", initial_proposal)
 
+def adjust_proposal_values_batch(prices, durations, agent_indices, agents, techniques, compatibility=None):
+    """
+    Adjust the values of many proposals at once, e.g. a burst of CFPs or a whole catalog, with
+    the same result as adjusting them one by one in order with adjust_proposal_values.
+    
+    Args:
+        prices: The prices of the proposals (NaN for none)
+        durations: The durations of the proposals (NaN for none)
+        agent_indices: The index of the agent making each proposal
+        agents: The agents making the proposals
+        techniques: List of gamification techniques to apply
+        compatibility: Precomputed compatibilities of the agents' population with the techniques (optional)
+        
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The adjusted prices and durations
+    """
+    batch = ProposalBatch(prices, durations, agent_indices, agents, compatibility)
+    for technique in techniques or ():
+        technique.apply_batch(batch)
+    return batch.prices, batch.durations
+
+def goal_mask(goal, values):
+    """
+    Check which values meet the condition of a goal.
+    
+    Args:
+        goal (dict): The goal, {"metric": "metric_name", "target": target_value, "comparison": "gt|lt|eq|gte|lte"}
+        values (np.ndarray): The values of the metric
+        
+    Returns:
+        np.ndarray: True where the value meets the condition
+    """
+    target = goal.get("target")
+    match goal.get("comparison", "eq"):
+        case "gt":
+            return values > target
+        case "lt":
+            return values < target
+        case "eq":
+            return values == target
+        case "gte":
+            return values >= target
+        case "lte":
+            return values <= target
+        case comparison:
+            logger.warning(f"Unknown comparison operator: {comparison}")
+            return np.zeros(len(values), dtype=bool)
+
+class ProposalBatch:
+    """
+    Proposals adjusted together: their prices and durations as arrays, and the agents making them.
+    """
+    def __init__(self, prices, durations, agent_indices, agents, compatibility=None, parameters=None, rewards=True):
+        """
+        Initialize the batch.
+        
+        Args:
+            prices: The prices of the proposals (NaN for none)
+            durations: The durations of the proposals (NaN for none)
+            agent_indices: The index of the agent making each proposal
+            agents: The agents making the proposals
+            compatibility: Precomputed compatibilities of the agents' population with the techniques (optional)
+            parameters: Precomputed per-agent parameters of the techniques, by technique id, as returned by get_parameters (optional)
+            rewards: Whether goals achieved in the batch are recorded and rewarded; if not, every proposal meeting a goal gets its effect, as if it were the agent's first (optional)
+        """
+        self.prices = np.array(prices, dtype=np.float64)
+        self.durations = np.array(durations, dtype=np.float64)
+        self.agent_indices = np.asarray(agent_indices, dtype=np.int64)
+        assert self.prices.shape == self.durations.shape == self.agent_indices.shape, "Prices, durations and agent indices must have the same length."
+        self.agents = list(agents)
+        self.compatibility = compatibility
+        self.parameters = parameters or {}
+        self.rewards = rewards
+        self._contexts = None
+
+    @property
+    def contexts(self):
+        """
+        The context of each agent (without a proposal), created when first needed.
+        """
+        if self._contexts is None:
+            self._contexts = [create_context(None, agent, self.compatibility) for agent in self.agents]
+        return self._contexts
+
+    def get_parameters(self, technique):
+        """
+        Get the per-agent parameters of a technique.
+        
+        Args:
+            technique (GamificationTechnique): The technique
+            
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Whether the technique can fire for each agent, and the parameters of each agent (one row per agent)
+        """
+        precomputed = self.parameters.get(id(technique))
+        if precomputed is not None:
+            return precomputed
+        results = [technique.get_parameters(agent, context) for agent, context in zip(self.agents, self.contexts)]
+        fires = np.array([result is not None for result in results], dtype=bool)
+        parameters = np.full((len(self.agents), max((len(result) for result in results if result is not None), default=0)), np.nan)
+        for index, result in enumerate(results):
+            if result:
+                parameters[index] = result
+        return fires, parameters
+
+    def achieve(self, technique, rows, values):
+        """
+        Check the goal of a technique for the proposals, as the scalar path does proposal by proposal:
+        an agent with an achievement pending in the technique's goal engine (e.g. published when it
+        completed a service) consumes it with its first proposal, and each agent that has not
+        achieved the goal yet achieves it with its first proposal meeting the goal, and is awarded
+        the technique's reward. The effect of the goal applies to those proposals.
+        
+        Args:
+            technique (GamificationTechnique): The technique
+            rows (np.ndarray): True for the proposals the goal is checked for
+            values (np.ndarray): The metric value of each proposal (NaN never meets the goal)
+            
+        Returns:
+            np.ndarray: The proposals the effect of the goal applies to
+        """
+        if not technique.goal:
+            return np.zeros(0, dtype=np.int64)
+        if not self.rewards:
+            return np.flatnonzero(rows & goal_mask(technique.goal, values))
+        engine = technique.goal_engine
+        if technique.achieved_by:
+            achieved_before = np.array([agent.jid in technique.achieved_by for agent in self.agents], dtype=bool)
+            pending = np.array([engine.is_pending(technique, agent) for agent in self.agents], dtype=bool)
+        else:
+            achieved_before = pending = np.zeros(len(self.agents), dtype=bool)
+        candidates = np.flatnonzero(rows & (pending[self.agent_indices] | (goal_mask(technique.goal, values) & ~achieved_before[self.agent_indices])))
+        _, first = np.unique(self.agent_indices[candidates], return_index=True)
+        achieved = np.sort(candidates[first])
+        for row in achieved:
+            agent = self.agents[self.agent_indices[row]]
+            if pending[self.agent_indices[row]]:
+                engine.consume(technique, agent)
+            elif technique.check_goal_achievement(agent, values[row]):
+                technique.award_reward(agent)
+        return achieved
+
+    def __len__(self):
+        return len(self.prices)
+
+def create_context(proposal, agent, compatibility=None):
+    """
+    Create the context the gamification techniques adjust a proposal in.
+    
+    Args:
+        proposal: The service proposal
+        agent: The agent making the proposal
+        compatibility: Precomputed compatibilities of the agent's population with the techniques (optional)
+        
+    Returns:
+        dict: The context
+    """
+    context = {"proposal": proposal}
+
+    if hasattr(agent, "total_provided_services"):
+        context["total_services"] = agent.total_provided_services
+    if hasattr(agent, "budget"):
+        context["budget"] = agent.budget
+    if compatibility is not None:
+        row = compatibility.get_row(agent.personality.personality_descriptor.get("personality profile"))
+        if row is not None:
+            context["compatibility row"] = row
+            context["compatibility columns"] = compatibility.columns
+    return context
+
+class GamificationPipeline:
+    """
+    The gamification techniques of one agent compiled into a short list of steps. Whether a
+    technique can fire and how strongly only depends on personalities, which rarely change, so
+    compiling drops the techniques that can never fire for the agent and precomputes the
+    compatibilities and facet-derived factors of the others; adjusting a proposal then only runs
+    the remaining arithmetic. The pipeline has to be recompiled once a personality changes.
+    """
+    def __init__(self, agent, techniques, compatibility=None):
+        """
+        Compile the techniques for an agent.
+        
+        Args:
+            agent: The agent making the proposals
+            techniques: List of gamification techniques
+            compatibility: Precomputed compatibilities of the agent's population with the techniques (optional)
+        """
+        self.techniques = list(techniques)
+        self.goal_engines = list({id(technique.goal_engine): technique.goal_engine for technique in self.techniques}.values())
+        # The compiled techniques subscribe the agent to the metrics of their goals again
+        for engine in self.goal_engines:
+            engine.unsubscribe(agent)
+        context = create_context(None, agent, compatibility)
+        # (technique, step) pairs of the techniques that can fire
+        self.steps = []
+        for technique in self.techniques:
+            step = technique.compile(agent, context)
+            if step is not None:
+                self.steps.append((technique, step))
+        self.profile, self.signature = self.get_signature(agent, self.techniques)
+        logger.info(f"[Gamification] Compiled pipeline for {agent.jid}: {[technique.name for technique, _ in self.steps]}")
+
+    @staticmethod
+    def get_signature(agent, techniques):
+        """
+        Get what a pipeline depends on: the agent's profile and the versions of all personalities.
+        
+        Args:
+            agent: The agent making the proposals
+            techniques: List of gamification techniques
+            
+        Returns:
+            tuple: The canonical profile of the agent and the versions and parameters it was compiled with
+        """
+        profile = agent.personality.personality_descriptor.get("personality profile")
+        return profile.canonical, (profile.version,) + tuple(
+            (id(technique), id(technique.personality_profile), technique.personality_profile.version,
+             id(technique.reward_item), technique.effect_strength)
+            for technique in techniques
+        )
+
+    def is_current(self, agent, techniques) -> bool:
+        """
+        Check if the pipeline was compiled from the current personalities and techniques.
+        
+        Args:
+            agent: The agent making the proposals
+            techniques: List of gamification techniques
+            
+        Returns:
+            bool: True if the pipeline is up to date, False if it has to be recompiled
+        """
+        profile, signature = self.get_signature(agent, techniques)
+        return profile is self.profile and signature == self.signature
+
+    def run(self, initial_proposal, agent):
+        """
+        Adjust proposal values with the compiled techniques.
+        
+        Args:
+            initial_proposal: The initial service proposal
+            agent: The agent making the proposal
+            
+        Returns:
+            Service: Modified service proposal
+        """
+        context = create_context(initial_proposal, agent)
+        for _, step in self.steps:
+            context = step(context)
+        return context.get("proposal", initial_proposal)
+
+    def publish(self, agent, metric, value):
+        """
+        Publish a new value of a metric of the agent to the goal engines of the techniques.
+        
+        Args:
+            agent: The agent making the proposals
+            metric: The name of the metric
+            value: The value of the metric
+            
+        Returns:
+            list: The techniques whose goal the agent achieved
+        """
+        achieved = []
+        for engine in self.goal_engines:
+            achieved.extend(engine.publish(agent, metric, value))
+        return achieved
+
+    def __len__(self):
+        return len(self.steps)
+
+class TechniqueCompatibility:
+    """
+    The compatibility of every profile of a population with every technique of a collection,
+    computed for the whole population at once. Afterwards only the rows of the profiles added or
+    changed since are recomputed, and everything only when a technique's profile changed.
+    """
+    def __init__(self, population: PopulationPersonalityMatrix, techniques):
+        """
+        Initialize the compatibility table.
+
+        Args:
+            population (PopulationPersonalityMatrix): The personality matrix of the agents.
+            techniques: The gamification techniques
+        """
+        self.population = population
+        self.techniques = list(techniques)
+        # Technique name -> column
+        self.columns = {technique.name: column for column, technique in enumerate(self.techniques)}
+        self.technique_matrix = PopulationPersonalityMatrix(len(self.techniques))
+        for technique in self.techniques:
+            self.technique_matrix.register(technique.personality_profile)
+        self.technique_rows = np.array([self.technique_matrix.get_row(technique.personality_profile) for technique in self.techniques], dtype=np.int64)
+
+        # Compatibilities of the population's rows, with spare rows for new profiles
+        self.values = np.zeros((0, len(self.techniques)))
+        self.technique_vectors = None
+        # Versions of both matrices the values were computed from
+        self.population_version = None
+        self.technique_version = None
+
+    def refresh(self) -> np.ndarray:
+        """
+        Recompute the compatibilities of the profiles added or changed since they were last computed.
+
+        Returns:
+            np.ndarray: The compatibility of each profile (row) with each technique (column).
+        """
+        size = self.population.size
+        if size > len(self.values):
+            values = np.zeros((self.population.capacity, len(self.techniques)))
+            values[:len(self.values)] = self.values
+            self.values = values
+        if self.technique_version != self.technique_matrix.version:
+            self.technique_vectors = self.technique_matrix.vectors[self.technique_rows]
+            self.values[:size] = compatibility_matrix(self.population.vectors, self.technique_vectors)
+            self.technique_version = self.technique_matrix.version
+        elif self.population_version != self.population.version:
+            rows = self.population.get_changed_rows(self.population_version)
+            if len(rows):
+                self.values[rows] = compatibility_matrix(self.population.get_vectors(rows), self.technique_vectors)
+        self.population_version = self.population.version
+        return self.values[:size]
+
+    def get_row(self, profile: PersonalityProfile) -> np.ndarray | None:
+        """
+        Get the compatibilities of a profile with all techniques.
+
+        Args:
+            profile (PersonalityProfile): The profile.
+
+        Returns:
+            np.ndarray | None: The compatibilities by column, or None if the profile is not in the population.
+        """
+        row = self.population.get_row(profile)
+        if row is None:
+            return None
+        return self.refresh()[row]
+
+    def get(self, profile: PersonalityProfile, technique) -> float | None:
+        """
+        Get the compatibility of a profile with a technique.
+
+        Args:
+            profile (PersonalityProfile): The profile.
+            technique (GamificationTechnique): The technique.
+
+        Returns:
+            float | None: The compatibility, or None if the profile or the technique is unknown.
+        """
+        row = self.get_row(profile)
+        column = self.columns.get(technique.name)
+        if row is None or column is None:
+            return None
+        return float(row[column])
+
+    def get_best_techniques(self, profile: PersonalityProfile, k: int = 1) -> list:
+        """
+        Get the techniques most compatible with a profile.
+
+        Args:
+            profile (PersonalityProfile): The profile.
+            k (int, optional): The number of techniques. Defaults to 1.
+
+        Returns:
+            list[GamificationTechnique]: The techniques, most compatible first (empty if the profile is not in the population).
+        """
+        row = self.get_row(profile)
+        if row is None:
+            return []
+        k = min(k, len(self.techniques))
+        best = np.argpartition(-row, k - 1)[:k] if k < len(self.techniques) else np.arange(len(self.techniques))
+        return [self.techniques[column] for column in best[np.argsort(-row[best], kind="stable")]]
+
+class CompatibilityCache:
+    """
+    A cache of compatibility scores keyed on (technique, agent personality profile). Each entry
+    remembers the profile versions it was calculated from and is recalculated once they change.
+    The cache is bounded and evicts the least recently used entries, so long runs with many
+    (e.g. interned copy-on-write) profiles do not grow it without limit.
+    """
+    def __init__(self, max_entries: int = 65536):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (int, optional): The number of entries kept. Defaults to 65536.
+        """
+        assert max_entries > 0, "Cache size must be positive."
+        self.max_entries = max_entries
+        # (kind, id of the technique, id of the profile) -> (technique, profile, versions, score), least recently used first.
+        # Entries reference their technique and profile, so their ids cannot be reused while cached.
+        self.entries: OrderedDict[tuple[str, int, int], tuple[object, PersonalityProfile, tuple, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, kind: str, technique, profile: PersonalityProfile, versions: tuple) -> float | None:
+        """
+        Get a cached score.
+
+        Args:
+            kind (str): The kind of the score ("technique" or "reward").
+            technique (GamificationTechnique): The technique.
+            profile (PersonalityProfile): The agent's personality profile.
+            versions (tuple): The versions the score must have been calculated from.
+
+        Returns:
+            float | None: The score, or None if it is not cached or outdated.
+        """
+        key = (kind, id(technique), id(profile))
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] is technique and entry[1] is profile and entry[2] == versions:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[3]
+        self.misses += 1
+        return None
+
+    def put(self, kind: str, technique, profile: PersonalityProfile, versions: tuple, score: float):
+        """
+        Cache a score.
+
+        Args:
+            kind (str): The kind of the score ("technique" or "reward").
+            technique (GamificationTechnique): The technique.
+            profile (PersonalityProfile): The agent's personality profile.
+            versions (tuple): The versions the score was calculated from.
+            score (float): The score.
+        """
+        key = (kind, id(technique), id(profile))
+        self.entries.update({key: (technique, profile, versions, score)})
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Remove all cached scores.
+        """
+        self.entries.clear()
+
+    def get_stats(self) -> dict[str, int | float]:
+        """
+        Get the cache statistics.
+
+        Returns:
+            dict[str, int | float]: The number of entries, hits, misses and evictions, and the hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self.entries)
+
+# Cache shared by all gamification techniques
+defaultCompatibilityCache = CompatibilityCache()
+
+# Profiles of the techniques defined without one are drawn from the stream of the technique's name,
+# so they are the same in every run
+techniqueProfileStreams = RandomStreams(0)
+
 class GamificationTechnique():
+    # Weights of the technique and reward compatibility in the combined compatibility
+    compatibility_weights = (0.7, 0.3)
+
     def __init__(self, name, personality_profile=None, effect_strength=0.5, goal=None, reward_item=None):
         """
         Initialize a gamification technique.
@@ -42,21 +517,42 @@ class GamificationTechnique():
             effect_strength (float): Base strength of the effect (0.0-1.0)
             goal (dict): Condition that must be met to earn the reward
                          Format: {"metric": "metric_name", "target": target_value, "comparison": "gt|lt|eq"}
-            reward_item (Item): Item to be awarded when goal is achieved
+            reward_item (Item): Item to be awarded when goal is achieved, replaced by its shared reward prototype
         """
         self.name = name
         if personality_profile is None:
             self.personality_profile = PersonalityProfile()
-            self.personality_profile.generate_random_personality_vector()
+            self.personality_profile.generate_random_personality_vector(techniqueProfileStreams.get_stream(name))
         else:
             self.personality_profile = personality_profile
         
         self.effect_strength = effect_strength
         self.goal = goal
-        self.reward_item = reward_item
+        self.reward_item = defaultRewardRegistry.intern(reward_item) if reward_item is not None else None
 
-        self.achieved_by = set()
+        # Agents that achieved the goal, stored as a bitset indexed by the goal engine's agent ids
+        self.goal_engine = defaultGoalEngine
+        self.achieved_by = self.goal_engine.create_achievements()
+        self.compatibility_cache = defaultCompatibilityCache
         
+    def isolate(self, goal_engine, compatibility_cache):
+        """
+        Copy the technique for a separate simulation. The copy shares the technique's definition
+        (personality profile, goal and reward prototype) and has its own goal state and cache.
+        
+        Args:
+            goal_engine (GoalEngine): The goal engine of the simulation
+            compatibility_cache (CompatibilityCache): The compatibility cache of the simulation
+            
+        Returns:
+            GamificationTechnique: The copy
+        """
+        technique = copy.copy(self)
+        technique.goal_engine = goal_engine
+        technique.achieved_by = goal_engine.create_achievements()
+        technique.compatibility_cache = compatibility_cache
+        return technique
+
     def calculate_compatibility(self, agent_personality):
         """
         Calculate compatibility between technique and agent personality.
@@ -80,6 +576,52 @@ class GamificationTechnique():
         logger.info(f"[{self.name}] Compatibility: {compatibility}")
         return compatibility
 
+    def get_compatibility(self, agent, context):
+        """
+        Get the compatibility between technique and agent personality, looked up in the
+        precomputed population compatibilities if the context holds them, or in the cache.
+        
+        Args:
+            agent: The agent
+            context: Context information for the technique
+            
+        Returns:
+            float: Compatibility score (0.0-1.0)
+        """
+        row = context.get("compatibility row")
+        if row is not None:
+            column = context.get("compatibility columns").get(self.name)
+            if column is not None:
+                return float(row[column])
+
+        # Profiles sharing interned scores share their cache entries
+        profile = agent.personality.personality_descriptor.get("personality profile").canonical
+        versions = (profile.version, id(self.personality_profile), self.personality_profile.version)
+        compatibility = self.compatibility_cache.get("technique", self, profile, versions)
+        if compatibility is None:
+            compatibility = self.calculate_compatibility(agent.personality)
+            self.compatibility_cache.put("technique", self, profile, versions, compatibility)
+        return compatibility
+
+    def get_reward_compatibility(self, agent):
+        """
+        Get how compatible the technique's reward is with an agent's personality, using the cache.
+        
+        Args:
+            agent: The agent to check compatibility with
+            
+        Returns:
+            float: Reward compatibility score (0.0-1.0)
+        """
+        # Profiles sharing interned scores share their cache entries
+        profile = agent.personality.personality_descriptor.get("personality profile").canonical
+        versions = (profile.version, id(self.reward_item))
+        compatibility = self.compatibility_cache.get("reward", self, profile, versions)
+        if compatibility is None:
+            compatibility = self.calculate_reward_compatibility(agent, self.reward_item)
+            self.compatibility_cache.put("reward", self, profile, versions, compatibility)
+        return compatibility
+
     def calculate_reward_compatibility(self, agent, reward_item=None):
         """
         Calculate how compatible a reward is with an agent's personality.
@@ -135,6 +677,41 @@ class GamificationTechnique():
             # Default moderate compatibility on error
             return 0.5
 
+    def calculate_reward_compatibility_batch(self, vectors):
+        """
+        Calculate how compatible the technique's reward is with many personalities at once.
+        
+        Args:
+            vectors: The personality vectors (one row per personality)
+            
+        Returns:
+            np.ndarray: Reward compatibility score of each personality (0.0-1.0)
+        """
+        vectors = np.asarray(vectors)
+        if not self.reward_item:
+            return np.full(len(vectors), 0.3)
+        achievement_drive = vectors[:, PersonalityProfile.facet_to_index.get("Achievement striving")]
+        status_orientation = vectors[:, PersonalityProfile.facet_to_index.get("Assertiveness")]
+        novelty_seeking = vectors[:, PersonalityProfile.facet_to_index.get("Actions")]
+        reward_name = self.reward_item.name.lower()
+        if "trophy" in reward_name or "badge" in reward_name:
+            return 0.6 + (0.7 * achievement_drive + 0.3 * status_orientation) * 0.4
+        return 0.4 + (0.6 * novelty_seeking + 0.4 * achievement_drive) * 0.4
+
+    def get_combined_compatibility_batch(self, vectors, technique_compatibility):
+        """
+        Get the combined technique and reward compatibility with many personalities at once.
+        
+        Args:
+            vectors: The personality vectors (one row per personality)
+            technique_compatibility: The compatibility of each personality with the technique
+            
+        Returns:
+            np.ndarray: Combined compatibility score of each personality (0.0-1.0)
+        """
+        technique_weight, reward_weight = self.compatibility_weights
+        return (np.asarray(technique_compatibility) * technique_weight) + (self.calculate_reward_compatibility_batch(vectors) * reward_weight)
+
     def check_goal_achievement(self, agent, metric_value):
         """
         Check if the agent has achieved the goal.
@@ -188,16 +765,106 @@ class GamificationTechnique():
             return False
             
         try:
-            from copy import deepcopy
-            reward = deepcopy(self.reward_item)
-            
-            agent.inventory.add_item(reward)
+            # The prototype is shared, so awarding it only increments its stack
+            reward = defaultRewardRegistry.award(agent.inventory, self.reward_item)
             logger.info(f"[{self.name}] Awarded {reward.name} to {agent.jid}")
             return True
         except Exception as e:
             logger.error(f"[{self.name}] Failed to award reward: {e}")
             return False
 
+    def get_combined_compatibility(self, agent, context):
+        """
+        Get the combined technique and reward compatibility with an agent.
+        
+        Args:
+            agent: The agent
+            context: Context information for the technique
+            
+        Returns:
+            float: Combined compatibility score (0.0-1.0)
+        """
+        technique_weight, reward_weight = self.compatibility_weights
+        return (self.get_compatibility(agent, context) * technique_weight) + (self.get_reward_compatibility(agent) * reward_weight)
+
+    def get_facet_score(self, agent, facet):
+        """
+        Get a facet score of an agent's personality.
+        
+        Args:
+            agent: The agent
+            facet: The name of the facet
+            
+        Returns:
+            float: The score, or None if the agent has no personality profile
+        """
+        try:
+            return agent.personality.personality_descriptor.get("personality profile").get_facet_score(facet)
+        except:
+            return None
+
+    def get_parameters(self, agent, context):
+        """
+        Get the per-agent parameters of the compiled and batched forms of the technique.
+        
+        Args:
+            agent: The agent the technique is applied to
+            context: Context information for the technique (without a proposal)
+            
+        Returns:
+            tuple | None: The parameters, or None if the technique can never fire (or has no compiled form)
+        """
+        return None
+
+    def get_parameters_batch(self, vectors, combined_compatibility):
+        """
+        Get the parameters of the compiled and batched forms of the technique for many
+        personalities at once, as get_parameters does for one agent.
+        
+        Args:
+            vectors: The personality vectors (one row per personality)
+            combined_compatibility: The combined compatibility of each personality with the technique
+            
+        Returns:
+            tuple[np.ndarray, np.ndarray] | None: Whether the technique can fire for each personality and
+                the parameters of each personality (one row per personality), or None if the technique has no vectorized parameters
+        """
+        return None
+
+    def compile(self, agent, context):
+        """
+        Compile the technique for an agent into a step of a gamification pipeline.
+        Techniques without a compiled form run their apply method as the step.
+        
+        Args:
+            agent: The agent the technique is applied to
+            context: Context information for the technique (without a proposal)
+            
+        Returns:
+            Callable[[dict], dict] | None: The step modifying the context, or None if the technique can never fire
+        """
+        return lambda context: self.apply(agent, context)
+
+    def apply_batch(self, batch):
+        """
+        Apply the technique to a batch of proposals. Techniques without a batched form are applied
+        to one proposal at a time (without the context values set by other techniques).
+        
+        Args:
+            batch (ProposalBatch): The proposals
+        """
+        for row, agent_index in enumerate(batch.agent_indices):
+            price, duration = batch.prices[row], batch.durations[row]
+            proposal = SimpleNamespace(
+                price=None if np.isnan(price) else float(price),
+                duration=None if np.isnan(duration) else float(duration),
+            )
+            context = dict(batch.contexts[agent_index])
+            context["proposal"] = proposal
+            proposal = self.apply(batch.agents[agent_index], context).get("proposal", proposal)
+            batch.prices[row] = np.nan if proposal.price is None else proposal.price
+            batch.durations[row] = np.nan if proposal.duration is None else proposal.duration
+
     def apply(self, agent, context):
         """
         Apply the technique to modify agent behaviour.
@@ -209,8 +876,8 @@ class GamificationTechnique():
         Returns:
             dict: Modified context
         """
-        technique_compatibility = self.calculate_compatibility(agent.personality)
-        reward_compatibility = self.calculate_reward_compatibility(agent, self.reward_item)
+        technique_compatibility = self.get_compatibility(agent, context)
+        reward_compatibility = self.get_reward_compatibility(agent)
         
         combined_compatibility = (technique_compatibility * 0.7) + (reward_compatibility * 0.3)
         logger.info(f"[{self.name}] Combined compatibility: {combined_compatibility:.2f}")
@@ -231,8 +898,8 @@ class CompetitivePricing(GamificationTechnique):
     """Reduces prices for competitive personalities."""
     
     def apply(self, agent, context):
-        technique_compatibility = self.calculate_compatibility(agent.personality)
-        reward_compatibility = self.calculate_reward_compatibility(agent, self.reward_item)
+        technique_compatibility = self.get_compatibility(agent, context)
+        reward_compatibility = self.get_reward_compatibility(agent)
         combined_compatibility = (technique_compatibility * 0.7) + (reward_compatibility * 0.3)
         logger.info(f"[{self.name}] Combined compatibility: {combined_compatibility:.2f}")
         
@@ -255,12 +922,45 @@ class CompetitivePricing(GamificationTechnique):
         context["proposal"] = proposal
         return context
 
+    def get_parameters(self, agent, context):
+        combined_compatibility = self.get_combined_compatibility(agent, context)
+        assertiveness = self.get_facet_score(agent, "Assertiveness")
+        if combined_compatibility <= 0.6 or assertiveness is None:
+            return None
+        # Competitiveness factor
+        return (max(0.0, assertiveness) * combined_compatibility * self.effect_strength,)
+
+    def get_parameters_batch(self, vectors, combined_compatibility):
+        vectors = np.asarray(vectors)
+        assertiveness = np.maximum(0.0, vectors[:, PersonalityProfile.facet_to_index.get("Assertiveness")])
+        return combined_compatibility > 0.6, (assertiveness * combined_compatibility * self.effect_strength)[:, None]
+
+    def compile(self, agent, context):
+        parameters = self.get_parameters(agent, context)
+        if parameters is None:
+            return None
+        competitiveness_factor, = parameters
+
+        def step(context):
+            proposal = context.get("proposal")
+            if getattr(proposal, "price", None) is not None:
+                proposal.price = max(1, proposal.price - proposal.price * competitiveness_factor)
+            return context
+        return step
+
+    def apply_batch(self, batch):
+        fires, parameters = batch.get_parameters(self)
+        rows = fires[batch.agent_indices] & ~np.isnan(batch.prices)
+        competitiveness_factors = parameters[batch.agent_indices[rows], 0]
+        prices = batch.prices[rows]
+        batch.prices[rows] = np.maximum(1, prices - prices * competitiveness_factors)
+
 class QualityFocus(GamificationTechnique):
     """Increases service duration for conscientious personalities."""
     
     def apply(self, agent, context):
-        technique_compatibility = self.calculate_compatibility(agent.personality)
-        reward_compatibility = self.calculate_reward_compatibility(agent, self.reward_item)
+        technique_compatibility = self.get_compatibility(agent, context)
+        reward_compatibility = self.get_reward_compatibility(agent)
         combined_compatibility = (technique_compatibility * 0.7) + (reward_compatibility * 0.3)
         logger.info(f"[{self.name}] Combined compatibility: {combined_compatibility:.2f}")
         
@@ -283,12 +983,45 @@ class QualityFocus(GamificationTechnique):
         context["proposal"] = proposal
         return context
 
+    def get_parameters(self, agent, context):
+        combined_compatibility = self.get_combined_compatibility(agent, context)
+        dutifulness = self.get_facet_score(agent, "Dutifulness")
+        if combined_compatibility <= 0.6 or dutifulness is None:
+            return None
+        # Quality factor
+        return (max(0.0, dutifulness) * combined_compatibility * self.effect_strength,)
+
+    def get_parameters_batch(self, vectors, combined_compatibility):
+        vectors = np.asarray(vectors)
+        dutifulness = np.maximum(0.0, vectors[:, PersonalityProfile.facet_to_index.get("Dutifulness")])
+        return combined_compatibility > 0.6, (dutifulness * combined_compatibility * self.effect_strength)[:, None]
+
+    def compile(self, agent, context):
+        parameters = self.get_parameters(agent, context)
+        if parameters is None:
+            return None
+        quality_factor, = parameters
+
+        def step(context):
+            proposal = context.get("proposal")
+            if getattr(proposal, "duration", None) is not None:
+                proposal.duration = proposal.duration + proposal.duration * quality_factor
+            return context
+        return step
+
+    def apply_batch(self, batch):
+        fires, parameters = batch.get_parameters(self)
+        rows = fires[batch.agent_indices] & ~np.isnan(batch.durations)
+        quality_factors = parameters[batch.agent_indices[rows], 0]
+        durations = batch.durations[rows]
+        batch.durations[rows] = durations + durations * quality_factors
+
 class RiskTaking(GamificationTechnique):
     """Varies prices based on openness to risk."""
     
     def apply(self, agent, context):
-        technique_compatibility = self.calculate_compatibility(agent.personality)
-        reward_compatibility = self.calculate_reward_compatibility(agent, self.reward_item)
+        technique_compatibility = self.get_compatibility(agent, context)
+        reward_compatibility = self.get_reward_compatibility(agent)
         combined_compatibility = (technique_compatibility * 0.7) + (reward_compatibility * 0.3)
         logger.info(f"[{self.name}] Combined compatibility: {combined_compatibility:.2f}")
 
@@ -302,8 +1035,7 @@ class RiskTaking(GamificationTechnique):
                 
                 # Apply random price variation based on risk tolerance
                 if hasattr(proposal, "price") and proposal.price is not None:
-                    import random
-                    variation = (random.random() * 2 - 1) * risk_factor * proposal.price * 0.2
+                    variation = (get_random(agent).random() * 2 - 1) * risk_factor * proposal.price * 0.2
                     proposal.price = max(1, proposal.price + variation)
                     logger.info(f"[{self.name}] Applied price variation of {variation:.2f} for {agent.jid}")
             except:
@@ -312,28 +1044,68 @@ class RiskTaking(GamificationTechnique):
         context["proposal"] = proposal
         return context
 
+    def get_parameters(self, agent, context):
+        combined_compatibility = self.get_combined_compatibility(agent, context)
+        excitement_seeking = self.get_facet_score(agent, "Excitement seeking")
+        if combined_compatibility <= 0.6 or excitement_seeking is None:
+            return None
+        # Risk factor
+        return (excitement_seeking * combined_compatibility * self.effect_strength,)
+
+    def get_parameters_batch(self, vectors, combined_compatibility):
+        vectors = np.asarray(vectors)
+        excitement_seeking = vectors[:, PersonalityProfile.facet_to_index.get("Excitement seeking")]
+        return combined_compatibility > 0.6, (excitement_seeking * combined_compatibility * self.effect_strength)[:, None]
+
+    def compile(self, agent, context):
+        parameters = self.get_parameters(agent, context)
+        if parameters is None:
+            return None
+        risk_factor, = parameters
+        stream = get_random(agent)
+
+        def step(context):
+            proposal = context.get("proposal")
+            if getattr(proposal, "price", None) is not None:
+                variation = (stream.random() * 2 - 1) * risk_factor * proposal.price * 0.2
+                proposal.price = max(1, proposal.price + variation)
+            return context
+        return step
+
+    def apply_batch(self, batch):
+        fires, parameters = batch.get_parameters(self)
+        rows = fires[batch.agent_indices] & ~np.isnan(batch.prices)
+        risk_factors = parameters[batch.agent_indices[rows], 0]
+        # The same draws as the scalar path, in proposal order for each agent
+        draws = random_batch(batch.agents, batch.agent_indices[rows])
+        prices = batch.prices[rows]
+        batch.prices[rows] = np.maximum(1, prices + (draws * 2 - 1) * risk_factors * prices * 0.2)
+
 # Gamification techniques with rewards
 
 class ServiceMilestone(GamificationTechnique):
     """Rewards agents for completing a certain number of services."""
     
     def apply(self, agent, context):
-        technique_compatibility = self.calculate_compatibility(agent.personality)
-        reward_compatibility = self.calculate_reward_compatibility(agent, self.reward_item)
+        technique_compatibility = self.get_compatibility(agent, context)
+        reward_compatibility = self.get_reward_compatibility(agent)
         combined_compatibility = (technique_compatibility * 0.7) + (reward_compatibility * 0.3)
         logger.info(f"[{self.name}] Combined compatibility: {combined_compatibility:.2f}")
 
         proposal = context.get("proposal")
         
-        if hasattr(agent, "provided_services") and combined_compatibility > 0.6:
-            total_services = sum(agent.provided_services.values())
+        if hasattr(agent, "total_provided_services") and combined_compatibility > 0.6:
+            total_services = agent.total_provided_services
             
             # Add current value to context for goal checking
             context["current_value"] = total_services
             
-            if self.check_goal_achievement(agent, total_services):
+            achieved = self.check_goal_achievement(agent, total_services)
+            if achieved:
                 self.award_reward(agent)
-                
+            
+            # An achievement published by the goal engine (e.g. when a service was completed) takes effect now
+            if achieved or self.goal_engine.consume(self, agent):
                 # Celebration effect - temporary price reduction
                 if hasattr(proposal, "price") and proposal.price is not None:
                     proposal.price = max(1, proposal.price * 0.9)  # 10% discount
@@ -342,12 +1114,46 @@ class ServiceMilestone(GamificationTechnique):
         context["proposal"] = proposal
         return context
 
+    def get_parameters(self, agent, context):
+        if not hasattr(agent, "total_provided_services") or self.get_combined_compatibility(agent, context) <= 0.6:
+            return None
+        return ()
+
+    def get_parameters_batch(self, vectors, combined_compatibility):
+        return combined_compatibility > 0.6, np.zeros((len(combined_compatibility), 0))
+
+    def compile(self, agent, context):
+        if self.get_parameters(agent, context) is None:
+            return None
+        if self.goal:
+            # Evaluated whenever the agent completes a service, and now for the services completed so far
+            self.goal_engine.subscribe(agent, self)
+            self.goal_engine.publish(agent, self.goal.get("metric"), agent.total_provided_services)
+
+        def step(context):
+            proposal = context.get("proposal")
+            context["current_value"] = agent.total_provided_services
+            if self.goal_engine.consume(self, agent):
+                if getattr(proposal, "price", None) is not None:
+                    proposal.price = max(1, proposal.price * 0.9)  # 10% discount
+            return context
+        return step
+
+    def apply_batch(self, batch):
+        fires, _ = batch.get_parameters(self)
+        rows = fires[batch.agent_indices]
+        total_services = np.array([getattr(agent, "total_provided_services", 0) for agent in batch.agents], dtype=np.float64)
+        achieved = batch.achieve(self, rows, total_services[batch.agent_indices])
+        achieved = achieved[~np.isnan(batch.prices[achieved])]
+        batch.prices[achieved] = np.maximum(1, batch.prices[achieved] * 0.9)
+
 class PriceOptimizer(GamificationTechnique):
     """Rewards agents for maintaining competitive pricing."""
+    compatibility_weights = (0.6, 0.4)
     
     def apply(self, agent, context):
-        technique_compatibility = self.calculate_compatibility(agent.personality)
-        reward_compatibility = self.calculate_reward_compatibility(agent, self.reward_item)
+        technique_compatibility = self.get_compatibility(agent, context)
+        reward_compatibility = self.get_reward_compatibility(agent)
         combined_compatibility = (technique_compatibility * 0.6) + (reward_compatibility * 0.4)
         logger.info(f"[{self.name}] Combined compatibility: {combined_compatibility:.2f}")
 
@@ -356,9 +1162,11 @@ class PriceOptimizer(GamificationTechnique):
         if hasattr(proposal, "price") and proposal.price is not None and combined_compatibility > 0.6:
             context["current_value"] = proposal.price
             
-            if self.check_goal_achievement(agent, proposal.price):
+            achieved = self.check_goal_achievement(agent, proposal.price)
+            if achieved:
                 self.award_reward(agent)
-                
+            
+            if achieved or self.goal_engine.consume(self, agent):
                 # Apply a small efficiency bonus to duration
                 if hasattr(proposal, "duration") and proposal.duration is not None:
                     efficiency_bonus = 0.1 * combined_compatibility * self.effect_strength
@@ -368,12 +1176,52 @@ class PriceOptimizer(GamificationTechnique):
         context["proposal"] = proposal
         return context
 
+    def get_parameters(self, agent, context):
+        combined_compatibility = self.get_combined_compatibility(agent, context)
+        if combined_compatibility <= 0.6:
+            return None
+        # Efficiency bonus
+        return (0.1 * combined_compatibility * self.effect_strength,)
+
+    def get_parameters_batch(self, vectors, combined_compatibility):
+        return combined_compatibility > 0.6, (0.1 * combined_compatibility * self.effect_strength)[:, None]
+
+    def compile(self, agent, context):
+        parameters = self.get_parameters(agent, context)
+        if parameters is None:
+            return None
+        efficiency_bonus, = parameters
+        if self.goal:
+            self.goal_engine.subscribe(agent, self)
+
+        def step(context):
+            proposal = context.get("proposal")
+            if getattr(proposal, "price", None) is not None:
+                context["current_value"] = proposal.price
+                if self.goal:
+                    # Evaluated only if the price differs from the last one published
+                    self.goal_engine.publish(agent, self.goal.get("metric"), proposal.price)
+                if self.goal_engine.consume(self, agent):
+                    if getattr(proposal, "duration", None) is not None:
+                        proposal.duration = max(1, proposal.duration * (1 - efficiency_bonus))
+            return context
+        return step
+
+    def apply_batch(self, batch):
+        fires, parameters = batch.get_parameters(self)
+        rows = fires[batch.agent_indices] & ~np.isnan(batch.prices)
+        achieved = batch.achieve(self, rows, batch.prices)
+        achieved = achieved[~np.isnan(batch.durations[achieved])]
+        efficiency_bonuses = parameters[batch.agent_indices[achieved], 0]
+        batch.durations[achieved] = np.maximum(1, batch.durations[achieved] * (1 - efficiency_bonuses))
+
 class QualityAchievement(GamificationTechnique):
     """Rewards agents for maintaining high quality standards."""
+    compatibility_weights = (0.6, 0.4)
     
     def apply(self, agent, context):
-        technique_compatibility = self.calculate_compatibility(agent.personality)
-        reward_compatibility = self.calculate_reward_compatibility(agent, self.reward_item)
+        technique_compatibility = self.get_compatibility(agent, context)
+        reward_compatibility = self.get_reward_compatibility(agent)
         combined_compatibility = (technique_compatibility * 0.6) + (reward_compatibility * 0.4)
         logger.info(f"[{self.name}] Combined compatibility: {combined_compatibility:.2f}")
 
@@ -387,9 +1235,11 @@ class QualityAchievement(GamificationTechnique):
                 
                 context["current_value"] = quality_factor
                 
-                if self.check_goal_achievement(agent, quality_factor):
+                achieved = self.check_goal_achievement(agent, quality_factor)
+                if achieved:
                     self.award_reward(agent)
-                    
+                
+                if achieved or self.goal_engine.consume(self, agent):
                     # Apply a premium pricing bonus
                     if hasattr(proposal, "price") and proposal.price is not None:
                         premium = 0.15 * combined_compatibility  # 15% premium at max compatibility
@@ -400,3 +1250,42 @@ class QualityAchievement(GamificationTechnique):
             
         context["proposal"] = proposal
         return context
+
+    def get_parameters(self, agent, context):
+        combined_compatibility = self.get_combined_compatibility(agent, context)
+        dutifulness = self.get_facet_score(agent, "Dutifulness")
+        if combined_compatibility <= 0.6 or dutifulness is None:
+            return None
+        # Quality factor and premium (15% at max compatibility)
+        return (max(0.0, dutifulness) * combined_compatibility * self.effect_strength, 0.15 * combined_compatibility)
+
+    def get_parameters_batch(self, vectors, combined_compatibility):
+        vectors = np.asarray(vectors)
+        dutifulness = np.maximum(0.0, vectors[:, PersonalityProfile.facet_to_index.get("Dutifulness")])
+        return combined_compatibility > 0.6, np.column_stack((dutifulness * combined_compatibility * self.effect_strength, 0.15 * combined_compatibility))
+
+    def compile(self, agent, context):
+        parameters = self.get_parameters(agent, context)
+        if parameters is None:
+            return None
+        quality_factor, premium = parameters
+        if self.goal:
+            # The quality factor only changes with the personalities, i.e. when the pipeline is recompiled
+            self.goal_engine.subscribe(agent, self)
+            self.goal_engine.publish(agent, self.goal.get("metric"), quality_factor)
+
+        def step(context):
+            proposal = context.get("proposal")
+            context["current_value"] = quality_factor
+            if self.goal_engine.consume(self, agent):
+                if getattr(proposal, "price", None) is not None:
+                    proposal.price = proposal.price * (1 + premium)
+            return context
+        return step
+
+    def apply_batch(self, batch):
+        fires, parameters = batch.get_parameters(self)
+        rows = fires[batch.agent_indices]
+        achieved = batch.achieve(self, rows, parameters[batch.agent_indices, 0])
+        achieved = achieved[~np.isnan(batch.prices[achieved])]
+        batch.prices[achieved] = batch.prices[achieved] * (1 + parameters[batch.agent_indices[achieved], 1])
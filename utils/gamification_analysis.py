@@ -0,0 +1,365 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+
+from utils.gamification import CompatibilityCache, ProposalBatch
+from utils.goals import GoalEngine
+from utils.personality import Personality, PersonalityProfile
+from utils.personality_matrix import QUANTIZATION_LEVELS, PopulationPersonalityMatrix, compatibility_matrix
+from utils.random_streams import RandomStreams
+from utils.service import Service
+from utils.logger import logger
+import utils.personality_profiles as personality_profiles
+
+
+# Name of the results of all techniques applied together, and of the whole population
+ALL = "all"
+
+
+class ShiftDistribution:
+    """
+    The distribution of the relative shifts (adjusted / initial - 1) of a proposal value, as a
+    histogram and running moments, so the distributions of chunks analyzed separately can be merged.
+    """
+    def __init__(self, bins: int = 200, limit: float = 1.0):
+        """
+        Initialize an empty distribution.
+
+        Args:
+            bins (int, optional): The number of histogram bins. Defaults to 200.
+            limit (float, optional): The largest absolute shift with its own bins, larger ones fall into the outer bins. Defaults to 1.0.
+        """
+        self.edges = np.linspace(-limit, limit, bins + 1)
+        self.histogram = np.zeros(bins, dtype=np.int64)
+        self.count = 0
+        self.changed = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+
+    def add(self, shifts: np.ndarray):
+        """
+        Add shifts to the distribution, ignoring NaN (proposals without the value).
+
+        Args:
+            shifts (np.ndarray): The shifts.
+        """
+        shifts = shifts[~np.isnan(shifts)]
+        if not len(shifts):
+            return
+        self.histogram += np.histogram(np.clip(shifts, self.edges[0], self.edges[-1]), self.edges)[0]
+        self.count += len(shifts)
+        self.changed += int(np.count_nonzero(shifts))
+        self.total += float(shifts.sum())
+        self.total_squares += float(np.square(shifts).sum())
+        self.minimum = min(self.minimum, float(shifts.min()))
+        self.maximum = max(self.maximum, float(shifts.max()))
+
+    def merge(self, other):
+        """
+        Add the shifts of another distribution with the same bins.
+
+        Args:
+            other (ShiftDistribution): The distribution.
+        """
+        assert np.array_equal(self.edges, other.edges), "Distributions must have the same bins."
+        self.histogram += other.histogram
+        self.count += other.count
+        self.changed += other.changed
+        self.total += other.total
+        self.total_squares += other.total_squares
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else float("nan")
+
+    @property
+    def std(self) -> float:
+        if not self.count:
+            return float("nan")
+        return float(np.sqrt(max(0.0, self.total_squares / self.count - self.mean ** 2)))
+
+    def get_percentile(self, percentile: float) -> float:
+        """
+        Get a percentile of the shifts, interpolated within its histogram bin.
+
+        Args:
+            percentile (float): The percentile (0-100).
+
+        Returns:
+            float: The shift at the percentile (NaN for an empty distribution).
+        """
+        if not self.count:
+            return float("nan")
+        rank = percentile / 100 * self.count
+        cumulative = np.cumsum(self.histogram)
+        index = min(int(np.searchsorted(cumulative, rank)), len(self.histogram) - 1)
+        before = cumulative[index - 1] if index else 0
+        fraction = (rank - before) / self.histogram[index] if self.histogram[index] else 0.0
+        shift = self.edges[index] + fraction * (self.edges[index + 1] - self.edges[index])
+        return float(np.clip(shift, self.minimum, self.maximum))
+
+    def get_summary(self) -> dict[str, float]:
+        """
+        Get the summary statistics of the distribution.
+
+        Returns:
+            dict[str, float]: The count, the share of changed values, the mean, standard deviation, extremes and quartiles.
+        """
+        return {
+            "count": self.count,
+            "changed": self.changed / self.count if self.count else float("nan"),
+            "mean": self.mean,
+            "std": self.std,
+            "min": self.minimum if self.count else float("nan"),
+            "p5": self.get_percentile(5),
+            "p25": self.get_percentile(25),
+            "median": self.get_percentile(50),
+            "p75": self.get_percentile(75),
+            "p95": self.get_percentile(95),
+            "max": self.maximum if self.count else float("nan"),
+        }
+
+    def __repr__(self):
+        return f"ShiftDistribution(count={self.count}, mean={self.mean:.4f}, std={self.std:.4f})"
+
+
+def isolate_techniques(techniques: list) -> list:
+    """
+    Copy techniques with their own goal state and compatibility cache, so analyzing them leaves
+    the techniques of the running agents untouched.
+
+    Args:
+        techniques (list): The gamification techniques.
+
+    Returns:
+        list: The copies.
+    """
+    engine = GoalEngine()
+    cache = CompatibilityCache()
+    return [technique.isolate(engine, cache) for technique in techniques]
+
+
+def get_named_profiles() -> dict[str, PersonalityProfile]:
+    """
+    Get the named profiles of utils.personality_profiles.
+
+    Returns:
+        dict[str, PersonalityProfile]: The profiles by name.
+    """
+    return {
+        name: profile for name, profile in vars(personality_profiles).items()
+        if isinstance(profile, PersonalityProfile) and not name.startswith("_")
+    }
+
+
+def analyze_chunk(vectors, start, techniques, catalog, profile_names, profile_vectors, total_services, bins, seed):
+    """
+    Analyze a chunk of a population: every proposal of the catalog is made by every personality
+    of the chunk, once per technique on its own and once with all techniques in order. Each
+    (personality, service) pair is analyzed as a first proposal: every pair meeting a goal gets
+    its effect, and no achievement is recorded or rewarded. The personalities of the chunk draw
+    their random numbers from one stream derived from the seed and the chunk's start, so the
+    results only depend on the seed and the chunks, not on the worker analyzing them.
+
+    Args:
+        vectors: The personality vectors of the chunk (uint8 vectors hold scores quantized to 256 levels)
+        start: The index of the chunk's first personality in the population
+        techniques: The isolated gamification techniques
+        catalog: The (price, duration) of each service
+        profile_names: The names of the profiles the personalities are grouped by
+        profile_vectors: The personality vectors of those profiles
+        total_services: The number of services the providers completed so far
+        bins: The number of histogram bins of the distributions
+        seed: The seed of the analysis' random streams
+
+    Returns:
+        dict: The price and duration shift distributions by technique (or ALL) and group (profile name or ALL)
+    """
+    vectors = np.asarray(vectors, dtype=np.float64) / (QUANTIZATION_LEVELS if vectors.dtype == np.uint8 else 1)
+    count = len(vectors)
+    # The group of each personality is its closest named profile
+    distances = (
+        np.einsum("ij,ij->i", vectors, vectors)[:, None]
+        - 2 * vectors @ profile_vectors.T
+        + np.einsum("ij,ij->i", profile_vectors, profile_vectors)[None, :]
+    )
+    groups = np.argmin(distances, axis=1)
+
+    technique_compatibility = compatibility_matrix(vectors, np.array([technique.personality_profile.get_personality_vector() for technique in techniques]))
+    parameters = {}
+    for column, technique in enumerate(techniques):
+        combined_compatibility = technique.get_combined_compatibility_batch(vectors, technique_compatibility[:, column])
+        precomputed = technique.get_parameters_batch(vectors, combined_compatibility)
+        if precomputed is not None:
+            parameters.update({id(technique): precomputed})
+
+    stream = RandomStreams(seed).get_stream(f"chunk{start}")
+    agents = [SimpleNamespace(jid=f"analysis{start + index}", total_provided_services=total_services, random=stream) for index in range(count)]
+    if len(parameters) < len(techniques):
+        # Techniques without vectorized parameters get them from the agents' personalities
+        for agent, vector in zip(agents, vectors):
+            agent.personality = Personality(personality={"personality profile": PersonalityProfile(vector)})
+    agent_indices = np.arange(count)
+
+    results = {}
+    configurations = [(technique.name, [technique]) for technique in techniques] + [(ALL, techniques)]
+    for name, applied in configurations:
+        distributions = {
+            group: {"price": ShiftDistribution(bins), "duration": ShiftDistribution(bins)}
+            for group in [ALL] + list(profile_names)
+        }
+        for price, duration in catalog:
+            batch = ProposalBatch(np.full(count, price), np.full(count, duration), agent_indices, agents, parameters=parameters, rewards=False)
+            for technique in applied:
+                technique.apply_batch(batch)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                shifts = {"price": batch.prices / price - 1, "duration": batch.durations / duration - 1}
+            for value, shift in shifts.items():
+                distributions.get(ALL).get(value).add(shift)
+                for group, group_name in enumerate(profile_names):
+                    distributions.get(group_name).get(value).add(shift[groups == group])
+        results.update({name: distributions})
+    return results
+
+
+def _analyze_chunk_in_worker(arguments):
+    # Goal achievements would otherwise be logged once per analyzed pair
+    logger.disabled = True
+    return analyze_chunk(*arguments)
+
+
+class GamificationAnalyzer:
+    """
+    An offline analyzer of the impact of gamification techniques: every service of a catalog is
+    proposed by every personality of a population, with vectorized technique parameters and
+    batched technique kernels, and the relative price and duration shifts are collected per
+    technique and per named profile (the profile closest to each personality). The population is
+    processed in chunks, optionally spread over worker processes.
+    """
+    def __init__(
+        self,
+        techniques: list,
+        catalog: list[Service],
+        profiles: dict[str, PersonalityProfile] = None,
+        total_services: int = 0,
+        chunk_size: int = 16384,
+        workers: int = None,
+        bins: int = 200,
+        seed: int = None,
+    ):
+        """
+        Initialize the analyzer.
+
+        Args:
+            techniques (list): The gamification techniques, e.g. those of a GamificationTechniqueCollection.
+            catalog (list[Service]): The services proposed by every personality.
+            profiles (dict[str, PersonalityProfile], optional): The profiles personalities are grouped by. Defaults to those in utils.personality_profiles.
+            total_services (int, optional): The number of services the providers completed so far. Defaults to 0.
+            chunk_size (int, optional): The number of personalities analyzed at once. Defaults to 16384.
+            workers (int, optional): The number of worker processes, 1 to analyze in this process. Defaults to the number of CPUs.
+            bins (int, optional): The number of histogram bins of the distributions. Defaults to 200.
+            seed (int, optional): The seed of the random draws of the techniques (e.g. risk taking). Defaults to None (fresh entropy, see the seed attribute).
+        """
+        assert chunk_size > 0, "Chunk size must be positive."
+        assert workers is None or workers > 0, "Number of workers must be positive."
+        assert all(service.price and service.duration for service in catalog), "Catalog services must have a price and a duration."
+        self.techniques = isolate_techniques(techniques)
+        self.catalog = [(float(service.price), float(service.duration)) for service in catalog]
+        profiles = get_named_profiles() if profiles is None else profiles
+        self.profile_names = list(profiles)
+        self.profile_vectors = np.array([profile.get_personality_vector() for profile in profiles.values()], dtype=np.float64).reshape(-1, 30)
+        self.total_services = total_services
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count() or 1
+        self.bins = bins
+        # Recorded, so analyses started without a seed can be reproduced
+        self.seed = np.random.SeedSequence(seed).entropy
+
+    def analyze(self, population: np.ndarray | PopulationPersonalityMatrix) -> dict:
+        """
+        Analyze a population.
+
+        Args:
+            population (np.ndarray | PopulationPersonalityMatrix): The personality vectors (one row per
+                personality), e.g. generated or loaded by utils.personality_generator, or a population matrix.
+
+        Returns:
+            dict: The price and duration shift distributions by technique name (or ALL for all techniques
+                together) and group (profile name or ALL for the whole population), e.g.
+                results["competitive pricing"][ALL]["price"]
+        """
+        # The stored rows, so quantized matrices are dequantized one chunk at a time
+        vectors = population.matrix[:population.size] if isinstance(population, PopulationPersonalityMatrix) else population
+        assert vectors.ndim == 2 and vectors.shape[1] == 30, "Population must have 30 scores per personality."
+        # Chunks are read one at a time, so memory-mapped populations are never loaded at once
+        tasks = (
+            (np.array(vectors[start:start + self.chunk_size]), start, self.techniques, self.catalog, self.profile_names,
+             self.profile_vectors, self.total_services, self.bins, self.seed)
+            for start in range(0, len(vectors), self.chunk_size)
+        )
+
+        results = None
+        if self.workers == 1 or len(vectors) <= self.chunk_size:
+            disabled = logger.disabled
+            try:
+                for task in tasks:
+                    results = self.merge(results, _analyze_chunk_in_worker(task))
+            finally:
+                logger.disabled = disabled
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                # At most two chunks per worker are pending, to bound the memory held by the queue
+                pending = deque()
+                for task in tasks:
+                    pending.append(executor.submit(_analyze_chunk_in_worker, task))
+                    if len(pending) >= 2 * self.workers:
+                        results = self.merge(results, pending.popleft().result())
+                while pending:
+                    results = self.merge(results, pending.popleft().result())
+        return results or {}
+
+    @staticmethod
+    def merge(results: dict | None, chunk: dict) -> dict:
+        """
+        Merge the results of a chunk into the results so far.
+
+        Args:
+            results (dict | None): The results so far, or None for the first chunk.
+            chunk (dict): The results of the chunk.
+
+        Returns:
+            dict: The merged results.
+        """
+        if results is None:
+            return chunk
+        for name, groups in chunk.items():
+            for group, values in groups.items():
+                for value, distribution in values.items():
+                    results.get(name).get(group).get(value).merge(distribution)
+        return results
+
+    @staticmethod
+    def get_summary(results: dict) -> dict:
+        """
+        Summarize analysis results.
+
+        Args:
+            results (dict): The results of analyze.
+
+        Returns:
+            dict: The summary statistics of each distribution, nested like the results.
+        """
+        return {
+            name: {
+                group: {value: distribution.get_summary() for value, distribution in values.items()}
+                for group, values in groups.items()
+            }
+            for name, groups in results.items()
+        }
@@ -0,0 +1,311 @@
+import ast
+
+import numpy as np
+
+from utils.gamification import GamificationTechnique
+from utils.personality import PersonalityProfile
+
+
+# Functions available in rule expressions, with their argument counts
+RULE_FUNCTIONS = {"max": 2, "min": 2, "abs": 1}
+SCALAR_FUNCTIONS = {"__builtins__": {}, "max": max, "min": min, "abs": abs}
+VECTOR_FUNCTIONS = {"__builtins__": {}, "max": np.maximum, "min": np.minimum, "abs": np.abs}
+
+# Proposal values available in effect expressions
+PROPOSAL_VALUES = ("price", "duration")
+
+# Values the effect expressions need to be known to apply
+RULE_VALUES = PROPOSAL_VALUES + ("total_services",)
+
+# Variables of the parameter expressions besides the facet inputs
+PARAMETER_VARIABLES = ("compatibility", "strength")
+
+RULE_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd,
+)
+
+
+class RuleExpression:
+    """
+    An arithmetic expression of a gamification rule, e.g. "max(1, price * (1 - factor))".
+    Expressions may use numbers, variables, + - * / ** and the functions max, min and abs; they
+    are compiled once and evaluated on scalars or, element-wise, on NumPy arrays.
+    """
+    __slots__ = ("source", "names", "code")
+
+    def __init__(self, source: str, variables: set[str]):
+        """
+        Parse and compile an expression.
+
+        Args:
+            source (str): The expression.
+            variables (set[str]): The variables the expression may use.
+        """
+        tree = ast.parse(source, mode="eval")
+        for node in ast.walk(tree):
+            assert isinstance(node, RULE_NODES), f"Unsupported syntax in rule expression: {source}"
+            if isinstance(node, ast.Call):
+                assert isinstance(node.func, ast.Name) and node.func.id in RULE_FUNCTIONS, f"Unknown function in rule expression: {source}"
+                assert len(node.args) == RULE_FUNCTIONS.get(node.func.id) and not node.keywords, f"Wrong arguments of {node.func.id} in rule expression: {source}"
+        functions = {node.func.id for node in ast.walk(tree) if isinstance(node, ast.Call)}
+        self.names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)} - functions
+        assert self.names <= variables, f"Unknown variables {sorted(self.names - variables)} in rule expression: {source}"
+        self.source = source
+        self.code = compile(tree, f"<rule: {source}>", "eval")
+
+    def evaluate(self, values: dict[str, float]) -> float:
+        """
+        Evaluate the expression on scalars.
+
+        Args:
+            values (dict[str, float]): The value of each variable.
+
+        Returns:
+            float: The value of the expression.
+        """
+        return eval(self.code, SCALAR_FUNCTIONS, values)
+
+    def evaluate_batch(self, values: dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Evaluate the expression element-wise on arrays.
+
+        Args:
+            values (dict[str, np.ndarray]): The values of each variable.
+
+        Returns:
+            np.ndarray: The values of the expression.
+        """
+        with np.errstate(all="ignore"):
+            return eval(self.code, VECTOR_FUNCTIONS, values)
+
+    def __reduce__(self):
+        # Code objects cannot be pickled, so the expression is compiled again from its source
+        return (RuleExpression, (self.source, self.names))
+
+    def __repr__(self):
+        return f"RuleExpression({self.source!r})"
+
+
+class GamificationRule:
+    """
+    A declarative gamification technique:
+        facets: the facet scores the technique reads, by variable name
+        compatibility weights: the weights of the technique and reward compatibility
+        threshold: the combined compatibility the technique fires above
+        parameters: per-agent expressions of the facet variables, compatibility and strength
+        effects: expressions of the proposal values (price, duration), total_services and the
+                 parameters, assigned to the proposal values in order
+        goal, goal effects and reward item: a goal whose metric is one of the variables of the
+                 effects, the effects applied when it is achieved and the item awarded for it
+    For example:
+        {
+            "name": "competitive pricing",
+            "personality profile": pprofile.competitive_pricing,
+            "facets": {"assertiveness": "Assertiveness"},
+            "parameters": {"factor": "max(0, assertiveness) * compatibility * strength"},
+            "effects": {"price": "max(1, price - price * factor)"},
+        }
+    """
+    def __init__(self, rule: dict):
+        """
+        Validate and compile a rule.
+
+        Args:
+            rule (dict): The rule.
+        """
+        assert "name" in rule, "Rule must have a name."
+        self.name = rule.get("name")
+        self.personality_profile = rule.get("personality profile")
+        self.effect_strength = rule.get("effect strength", 0.5)
+        self.compatibility_weights = tuple(rule.get("compatibility weights", GamificationTechnique.compatibility_weights))
+        assert len(self.compatibility_weights) == 2, "Compatibility weights must be a pair."
+        self.threshold = rule.get("threshold", 0.6)
+        self.goal = rule.get("goal")
+        self.reward_item = rule.get("reward item")
+
+        self.facets = dict(rule.get("facets", {}))
+        for facet in self.facets.values():
+            assert facet in PersonalityProfile.facet_to_index, f"Facet {facet} not found."
+        parameter_variables = set(self.facets) | set(PARAMETER_VARIABLES)
+        self.parameters = {
+            name: RuleExpression(source, parameter_variables)
+            for name, source in rule.get("parameters", {}).items()
+        }
+
+        self.variables = set(RULE_VALUES) | set(self.parameters)
+        self.effects = self.compile_effects(rule.get("effects", {}))
+        self.goal_effects = self.compile_effects(rule.get("goal effects", {}))
+        if self.goal:
+            assert self.goal.get("metric") in self.variables, f"Goal metric {self.goal.get('metric')} is not a rule variable."
+        else:
+            assert not self.goal_effects, "Goal effects require a goal."
+
+    def compile_effects(self, effects: dict[str, str]) -> list[tuple[str, RuleExpression, tuple[str]]]:
+        """
+        Compile effect expressions.
+
+        Args:
+            effects (dict[str, str]): The expression of each proposal value.
+
+        Returns:
+            list[tuple[str, RuleExpression, tuple[str]]]: The proposal value, its expression and the values it requires.
+        """
+        compiled = []
+        for target, source in effects.items():
+            assert target in PROPOSAL_VALUES, f"Effects can only change {PROPOSAL_VALUES}."
+            expression = RuleExpression(source, self.variables)
+            required = tuple(value for value in RULE_VALUES if value == target or value in expression.names)
+            compiled.append((target, expression, required))
+        return compiled
+
+
+class RuleTechnique(GamificationTechnique):
+    """A gamification technique defined by a GamificationRule."""
+
+    def __init__(self, rule: GamificationRule | dict):
+        """
+        Initialize the technique from a rule.
+
+        Args:
+            rule (GamificationRule | dict): The rule, compiled or declarative.
+        """
+        if not isinstance(rule, GamificationRule):
+            rule = GamificationRule(rule)
+        super().__init__(rule.name, rule.personality_profile, rule.effect_strength, rule.goal, rule.reward_item)
+        self.rule = rule
+        self.compatibility_weights = rule.compatibility_weights
+
+    def get_parameters(self, agent, context):
+        combined_compatibility = self.get_combined_compatibility(agent, context)
+        if combined_compatibility <= self.rule.threshold:
+            return None
+        values = {"compatibility": combined_compatibility, "strength": self.effect_strength}
+        for name, facet in self.rule.facets.items():
+            score = self.get_facet_score(agent, facet)
+            if score is None:
+                return None
+            values[name] = score
+        return tuple(expression.evaluate(values) for expression in self.rule.parameters.values())
+
+    def get_parameters_batch(self, vectors, combined_compatibility):
+        vectors = np.asarray(vectors)
+        values = {"compatibility": combined_compatibility, "strength": self.effect_strength}
+        for name, facet in self.rule.facets.items():
+            values[name] = vectors[:, PersonalityProfile.facet_to_index.get(facet)]
+        parameters = np.empty((len(vectors), len(self.rule.parameters)))
+        for column, expression in enumerate(self.rule.parameters.values()):
+            parameters[:, column] = expression.evaluate_batch(values)
+        return combined_compatibility > self.rule.threshold, parameters
+
+    def get_values(self, agent, parameters, proposal):
+        """
+        Get the variables of the effect expressions for a proposal.
+
+        Args:
+            agent: The agent making the proposal
+            parameters: The parameters of the agent
+            proposal: The service proposal
+
+        Returns:
+            dict: The value of each variable (None if unknown)
+        """
+        values = dict(zip(self.rule.parameters, parameters))
+        values["total_services"] = getattr(agent, "total_provided_services", None)
+        for value in PROPOSAL_VALUES:
+            values[value] = getattr(proposal, value, None)
+        return values
+
+    def apply_effects(self, effects, values, proposal):
+        """
+        Apply effect expressions to a proposal.
+
+        Args:
+            effects: The compiled effects
+            values: The variables of the effect expressions, updated with the new proposal values
+            proposal: The service proposal
+        """
+        for target, expression, required in effects:
+            if all(values.get(value) is not None for value in required):
+                values[target] = expression.evaluate(values)
+                setattr(proposal, target, values.get(target))
+
+    def apply(self, agent, context):
+        parameters = self.get_parameters(agent, context)
+        if parameters is None:
+            return context
+        proposal = context.get("proposal")
+        values = self.get_values(agent, parameters, proposal)
+        achieved = False
+        if self.goal and values.get(self.goal.get("metric")) is not None:
+            context["current_value"] = values.get(self.goal.get("metric"))
+            achieved = self.check_goal_achievement(agent, context["current_value"])
+            if achieved:
+                self.award_reward(agent)
+        self.apply_effects(self.rule.effects, values, proposal)
+        # An achievement published by the goal engine takes effect with the next proposal
+        if achieved or (self.goal and self.goal_engine.consume(self, agent)):
+            self.apply_effects(self.rule.goal_effects, values, proposal)
+        return context
+
+    def compile(self, agent, context):
+        parameters = self.get_parameters(agent, context)
+        if parameters is None:
+            return None
+        metric = self.goal.get("metric") if self.goal else None
+        if metric is not None:
+            self.goal_engine.subscribe(agent, self)
+            if metric == "total_services":
+                # Published whenever the agent completes a service, and now for the services completed so far
+                self.goal_engine.publish(agent, metric, getattr(agent, "total_provided_services", None))
+            elif metric in self.rule.parameters:
+                # Parameters only change with the personalities, i.e. when the pipeline is recompiled
+                self.goal_engine.publish(agent, metric, parameters[list(self.rule.parameters).index(metric)])
+
+        def step(context):
+            proposal = context.get("proposal")
+            values = self.get_values(agent, parameters, proposal)
+            if metric is not None and values.get(metric) is not None:
+                context["current_value"] = values.get(metric)
+                if metric in PROPOSAL_VALUES:
+                    self.goal_engine.publish(agent, metric, values.get(metric))
+            achieved = metric is not None and self.goal_engine.consume(self, agent)
+            self.apply_effects(self.rule.effects, values, proposal)
+            if achieved:
+                self.apply_effects(self.rule.goal_effects, values, proposal)
+            return context
+        return step
+
+    def apply_batch(self, batch):
+        fires, parameters = batch.get_parameters(self)
+        rows = fires[batch.agent_indices]
+        values = {"price": batch.prices, "duration": batch.durations}
+        values["total_services"] = np.array(
+            [getattr(agent, "total_provided_services", np.nan) for agent in batch.agents], dtype=np.float64
+        )[batch.agent_indices]
+        for column, name in enumerate(self.rule.parameters):
+            values[name] = parameters[batch.agent_indices, column]
+
+        achieved = np.zeros(len(batch), dtype=bool)
+        if self.goal:
+            metric_values = values.get(self.goal.get("metric"))
+            achieved[batch.achieve(self, rows, metric_values)] = True
+        self.apply_effects_batch(self.rule.effects, values, rows)
+        self.apply_effects_batch(self.rule.goal_effects, values, achieved)
+
+    def apply_effects_batch(self, effects, values, rows):
+        """
+        Apply effect expressions to a batch of proposals, in place.
+
+        Args:
+            effects: The compiled effects
+            values: The variables of the effect expressions, as arrays (the proposal values are the batch arrays)
+            rows: True for the proposals the effects apply to
+        """
+        for target, expression, required in effects:
+            mask = rows.copy()
+            for value in required:
+                mask &= ~np.isnan(values.get(value))
+            if mask.any():
+                result = np.broadcast_to(expression.evaluate_batch(values), mask.shape)
+                values.get(target)[mask] = result[mask]
@@ -1,6 +1,10 @@
 from utils.gamification import *
+from utils.gamification_rules import GamificationRule, RuleTechnique
 import utils.personality_profiles as pprofile
 from utils.inventory import Item
+from utils.personality_matrix import PopulationPersonalityMatrix
+from utils.rewards import defaultRewardRegistry
+from utils.goals import GoalEngine
 
 
 class GamificationTechniqueCollection:
@@ -14,6 +18,25 @@ class GamificationTechniqueCollection:
     ):
         self.techniques = techniques or {}
         self.reward_items = reward_items or {}
+        # id of the population matrix -> compatibilities of its profiles with the techniques
+        self.compatibilities: dict[int, TechniqueCompatibility] = {}
+
+    def isolate(self, goal_engine: GoalEngine, compatibility_cache: CompatibilityCache):
+        """
+        Copy the collection for a separate simulation, with copies of the techniques sharing their
+        definitions but not their goal state, and the same reward prototypes.
+
+        Args:
+            goal_engine (GoalEngine): The goal engine of the simulation.
+            compatibility_cache (CompatibilityCache): The compatibility cache of the simulation.
+
+        Returns:
+            GamificationTechniqueCollection: The copy.
+        """
+        return GamificationTechniqueCollection(
+            techniques={name: technique.isolate(goal_engine, compatibility_cache) for name, technique in self.techniques.items()},
+            reward_items=dict(self.reward_items),
+        )
 
     def add_technique(self, technique: GamificationTechnique):
         """
@@ -23,6 +46,31 @@ class GamificationTechniqueCollection:
             technique (GamificationTechnique): The technique to add.
         """
         self.techniques.update({technique.name: technique})
+        self.compatibilities.clear()
+
+    def add_rule(self, rule: GamificationRule | dict) -> RuleTechnique:
+        """
+        Compile a declarative rule into a technique and add it to the collection.
+
+        Args:
+            rule (GamificationRule | dict): The rule.
+
+        Returns:
+            RuleTechnique: The added technique.
+        """
+        technique = RuleTechnique(rule)
+        self.add_technique(technique)
+        return technique
+
+    def add_rules(self, rules: list[GamificationRule | dict]):
+        """
+        Compile multiple declarative rules into techniques and add them to the collection.
+
+        Args:
+            rules (list[GamificationRule | dict]): The rules.
+        """
+        for rule in rules:
+            self.add_rule(rule)
 
     def add_techniques(self, techniques: list[GamificationTechnique]):
         """
@@ -42,6 +90,7 @@ class GamificationTechniqueCollection:
             name (str): The name of the technique to remove.
         """
         self.techniques.pop(name, None)
+        self.compatibilities.clear()
 
     def get_technique(self, name: str):
         """
@@ -64,14 +113,31 @@ class GamificationTechniqueCollection:
         """
         return self.techniques.values()
 
-    def add_reward_item(self, item: Item):
+    def get_compatibility(self, population: PopulationPersonalityMatrix) -> TechniqueCompatibility:
+        """
+        Get the compatibilities of a population with the techniques of the collection.
+
+        Args:
+            population (PopulationPersonalityMatrix): The personality matrix of the agents.
+
+        Returns:
+            TechniqueCompatibility: The compatibilities, shared by all agents of the population.
+        """
+        compatibility = self.compatibilities.get(id(population))
+        if compatibility is None or compatibility.population is not population:
+            compatibility = TechniqueCompatibility(population, self.get_techniques())
+            self.compatibilities.update({id(population): compatibility})
+        return compatibility
+
+    def add_reward_item(self, item: Item, kind: str = None):
         """
         Add a reward item to the collection.
 
         Args:
-            item (Item): The reward item to add.
+            item (Item): The reward item to add, replaced by its shared reward prototype.
+            kind (str, optional): The kind of the reward (e.g. "badge"). Defaults to the item's "kind" feature.
         """
-        self.reward_items.update({item.name: item})
+        self.reward_items.update({item.name: defaultRewardRegistry.intern(item, kind)})
 
     def add_reward_items(self, items: list[Item]):
         """
@@ -135,12 +201,14 @@ class GamificationTechniqueCollection:
 
 
 reward_items = {
-    "efficiency badge": Item(
-        "Efficiency Badge", {"effect": "duration_reduction", "value": 0.2}
+    "efficiency badge": defaultRewardRegistry.intern(
+        Item("Efficiency Badge", {"effect": "duration_reduction", "value": 0.2, "kind": "badge"})
+    ),
+    "premium badge": defaultRewardRegistry.intern(
+        Item("Premium Badge", {"effect": "price_increase", "value": 0.15, "kind": "badge"})
     ),
-    "premium badge": Item("Premium Badge", {"effect": "price_increase", "value": 0.15}),
-    "service trophy": Item(
-        "Service Trophy", {"effect": "reputation_boost", "value": 10}
+    "service trophy": defaultRewardRegistry.intern(
+        Item("Service Trophy", {"effect": "reputation_boost", "value": 10, "kind": "trophy"})
     ),
 }
 
@@ -0,0 +1,260 @@
+class Bitset:
+    """
+    A compact set of non-negative integers, one bit per integer.
+    """
+    __slots__ = ("bits",)
+
+    def __init__(self):
+        self.bits = bytearray()
+
+    def add(self, index: int):
+        """
+        Add an integer to the set.
+
+        Args:
+            index (int): The integer.
+        """
+        byte = index >> 3
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte + 1 - len(self.bits)))
+        self.bits[byte] |= 1 << (index & 7)
+
+    def discard(self, index: int):
+        """
+        Remove an integer from the set, if present.
+
+        Args:
+            index (int): The integer.
+        """
+        byte = index >> 3
+        if byte < len(self.bits):
+            self.bits[byte] &= ~(1 << (index & 7)) & 0xFF
+
+    def clear(self):
+        self.bits = bytearray()
+
+    def __contains__(self, index: int) -> bool:
+        byte = index >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (index & 7)))
+
+    def __iter__(self):
+        for byte, value in enumerate(self.bits):
+            while value:
+                low = value & -value
+                yield (byte << 3) + low.bit_length() - 1
+                value ^= low
+
+    def __len__(self):
+        return int.from_bytes(self.bits, "little").bit_count()
+
+    def __repr__(self):
+        return f"Bitset({list(self)})"
+
+
+class Achievements:
+    """
+    The agents that achieved a goal, as a set of JIDs stored in a bitset indexed by the agent
+    ids of a goal engine.
+    """
+    __slots__ = ("engine", "bits")
+
+    def __init__(self, engine):
+        """
+        Initialize the achievements.
+
+        Args:
+            engine (GoalEngine): The engine assigning the agent ids.
+        """
+        self.engine = engine
+        self.bits = Bitset()
+
+    def add(self, jid):
+        self.bits.add(self.engine.get_agent_id(jid))
+
+    def discard(self, jid):
+        agent_id = self.engine.agent_ids.get(str(jid))
+        if agent_id is not None:
+            self.bits.discard(agent_id)
+
+    def clear(self):
+        self.bits.clear()
+
+    def __contains__(self, jid) -> bool:
+        agent_id = self.engine.agent_ids.get(str(jid))
+        return agent_id is not None and agent_id in self.bits
+
+    def __iter__(self):
+        for agent_id in self.bits:
+            yield self.engine.agent_jids[agent_id]
+
+    def __len__(self):
+        return len(self.bits)
+
+    def __eq__(self, other):
+        if isinstance(other, (Achievements, set, frozenset)):
+            return set(self) == {str(jid) for jid in other}
+        return False
+
+    def __repr__(self):
+        return f"Achievements({list(self)})"
+
+
+class GoalEngine:
+    """
+    An event-driven evaluator of gamification goals. Techniques subscribe an agent to the metric
+    of their goal (e.g. total_services, price or quality_factor); publishing a new value of a
+    metric for an agent evaluates the goals of the techniques subscribed to it, unless the value
+    did not change or the goal was already achieved. An achieved goal is rewarded right away and
+    stays pending until its technique consumes it to apply its effect, so the cost of goal
+    checking follows the metric changes rather than the proposals.
+    """
+    def __init__(self):
+        # Agent JID -> agent id (bit index of the achievement bitsets), and the reverse
+        self.agent_ids: dict[str, int] = {}
+        self.agent_jids: list[str] = []
+        # Agent id -> metric -> techniques whose goal the agent is subscribed to
+        self.subscriptions: dict[int, dict[str, list]] = {}
+        # (agent id, metric) -> last published value
+        self.values: dict[tuple[int, str], object] = {}
+        # Technique id -> agents with an achievement whose effect was not applied yet
+        self.pending: dict[int, Bitset] = {}
+        self.events = 0
+        self.evaluations = 0
+
+    def get_agent_id(self, jid) -> int:
+        """
+        Get the id of an agent, assigning the next free id to new agents.
+
+        Args:
+            jid: The JID of the agent.
+
+        Returns:
+            int: The id of the agent.
+        """
+        jid = str(jid)
+        agent_id = self.agent_ids.get(jid)
+        if agent_id is None:
+            agent_id = len(self.agent_jids)
+            self.agent_ids.update({jid: agent_id})
+            self.agent_jids.append(jid)
+        return agent_id
+
+    def create_achievements(self) -> Achievements:
+        """
+        Create the achievement set of a technique's goal.
+
+        Returns:
+            Achievements: The empty achievements.
+        """
+        return Achievements(self)
+
+    def subscribe(self, agent, technique):
+        """
+        Subscribe an agent to the metric of a technique's goal.
+
+        Args:
+            agent: The agent.
+            technique (GamificationTechnique): The technique, with a goal.
+        """
+        metric = technique.goal.get("metric")
+        agent_id = self.get_agent_id(agent.jid)
+        techniques = self.subscriptions.setdefault(agent_id, {}).setdefault(metric, [])
+        if technique not in techniques:
+            techniques.append(technique)
+        # Evaluate the new subscriber on the next published value, even if it did not change
+        self.values.pop((agent_id, metric), None)
+
+    def unsubscribe(self, agent):
+        """
+        Unsubscribe an agent from all metrics.
+
+        Args:
+            agent: The agent.
+        """
+        agent_id = self.agent_ids.get(str(agent.jid))
+        if agent_id is not None:
+            for metric in self.subscriptions.pop(agent_id, {}):
+                self.values.pop((agent_id, metric), None)
+
+    def publish(self, agent, metric: str, value) -> list:
+        """
+        Publish the value of a metric for an agent, evaluating the goals subscribed to it if it changed.
+
+        Args:
+            agent: The agent.
+            metric (str): The name of the metric.
+            value: The value of the metric.
+
+        Returns:
+            list: The techniques whose goal the agent achieved.
+        """
+        self.events += 1
+        agent_id = self.agent_ids.get(str(agent.jid))
+        techniques = self.subscriptions.get(agent_id, {}).get(metric) if agent_id is not None else None
+        if not techniques:
+            return []
+        key = (agent_id, metric)
+        if key in self.values and self.values.get(key) == value:
+            return []
+        self.values.update({key: value})
+
+        achieved = []
+        for technique in techniques:
+            if agent.jid in technique.achieved_by:
+                continue
+            self.evaluations += 1
+            if technique.check_goal_achievement(agent, value):
+                technique.award_reward(agent)
+                self.pending.setdefault(id(technique), Bitset()).add(agent_id)
+                achieved.append(technique)
+        return achieved
+
+    def is_pending(self, technique, agent) -> bool:
+        """
+        Check whether an agent has an achievement of a technique's goal whose effect was not applied yet.
+
+        Args:
+            technique (GamificationTechnique): The technique.
+            agent: The agent.
+
+        Returns:
+            bool: True if the achievement is pending, False otherwise.
+        """
+        pending = self.pending.get(id(technique))
+        agent_id = self.agent_ids.get(str(agent.jid))
+        return bool(pending) and agent_id is not None and agent_id in pending
+
+    def consume(self, technique, agent) -> bool:
+        """
+        Consume a pending achievement of a technique's goal, so its effect is applied once.
+
+        Args:
+            technique (GamificationTechnique): The technique.
+            agent: The agent.
+
+        Returns:
+            bool: True if the agent achieved the goal since the last call, False otherwise.
+        """
+        pending = self.pending.get(id(technique))
+        agent_id = self.agent_ids.get(str(agent.jid))
+        if not pending or agent_id is None or agent_id not in pending:
+            return False
+        pending.discard(agent_id)
+        return True
+
+    def get_stats(self) -> dict[str, int]:
+        """
+        Get the engine statistics.
+
+        Returns:
+            dict[str, int]: The number of agents, published events and goal evaluations.
+        """
+        return {"agents": len(self.agent_jids), "events": self.events, "evaluations": self.evaluations}
+
+    def __str__(self):
+        stats = self.get_stats()
+        return f"GoalEngine({stats.get('agents')} agents, {stats.get('events')} events, {stats.get('evaluations')} evaluations)"
+
+
+# Engine shared by all gamification techniques
+defaultGoalEngine = GoalEngine()
@@ -1,7 +1,135 @@
+import copy
+from collections import deque
+from collections.abc import Iterator, Mapping, MutableMapping
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import NamedTuple
+
+from utils.inventory_events import InventoryEventStream
+
+# Marks a feature or stack attribute that does not exist (before it is added or after it is removed)
+_MISSING = object()
+# Posting key for indexed values that cannot be hashed; such items are compared by equality
+_UNHASHABLE = object()
+
+
+def _posting_key(value: any):
+    """
+    Get the key under which a value is stored in a feature or stack attribute index.
+
+    Args:
+        value (any): The indexed value.
+
+    Returns:
+        any: The value itself if it is hashable, the unhashable marker otherwise.
+    """
+    try:
+        hash(value)
+    except TypeError:
+        return _UNHASHABLE
+    return value
+
+
+def _post(index: dict, value: any, item):
+    """
+    Add an item to the posting of a value in an index.
+
+    Args:
+        index (dict): The index, mapping values to postings (dicts used as ordered sets of items).
+        value (any): The value of the item.
+        item (Item): The item.
+    """
+    index.setdefault(_posting_key(value), {}).update({item: None})
+
+
+def _unpost(index: dict, value: any, item):
+    """
+    Remove an item from the posting of a value in an index.
+
+    Args:
+        index (dict): The index, mapping values to postings.
+        value (any): The value the item was posted under.
+        item (Item): The item.
+    """
+    key = _posting_key(value)
+    posting = index.get(key)
+    posting.pop(item)
+    if not posting:
+        index.pop(key)
+
+
+def _lookup(index: dict, value: any) -> dict:
+    """
+    Get the items posted under a value in an index.
+
+    Args:
+        index (dict): The index, mapping values to postings.
+        value (any): The value to look up.
+
+    Returns:
+        dict: The matching items as keys, in the order they were posted. Must not be modified by the caller.
+    """
+    key = _posting_key(value)
+    posting = index.get(key, {}) if key is not _UNHASHABLE else {}
+    unhashable = index.get(_UNHASHABLE)
+    if not unhashable:
+        return posting
+    return posting | {item: None for item, stored in unhashable.items() if stored == value}
+
+
+# Types of values that cannot change in place, so snapshots can share them with the inventory
+_IMMUTABLE_TYPES = (str, int, float, complex, bool, bytes, type(None), frozenset)
+
+
+def _is_immutable(value: any) -> bool:
+    """
+    Check whether a feature or stack attribute value cannot change in place.
+
+    Args:
+        value (any): The value.
+
+    Returns:
+        bool: True for immutable values and tuples of them, False otherwise.
+    """
+    if isinstance(value, tuple):
+        return all(_is_immutable(element) for element in value)
+    return isinstance(value, _IMMUTABLE_TYPES)
+
+
+def _to_json_value(value: any) -> any:
+    """
+    Convert a feature or stack attribute value to JSON-compatible data.
+
+    Objects with a to_json or to_dict method (e.g. Recipe, Service) are converted with it,
+    dicts (e.g. ServiceTally) to plain dicts, and deques, lists, tuples and sets to lists. Other
+    objects without a JSON form (e.g. SPADE messages in an inbox) are converted with str, so
+    the conversion is one-way for them.
+
+    Args:
+        value (any): The value.
+
+    Returns:
+        any: The JSON-compatible value.
+    """
+    if isinstance(value, (str, int, float, bool, type(None))):
+        return value
+    if isinstance(value, Mapping):
+        return {str(key): _to_json_value(element) for key, element in value.items()}
+    if isinstance(value, (list, tuple, deque, set, frozenset)):
+        return [_to_json_value(element) for element in value]
+    if hasattr(value, "to_json"):
+        return _to_json_value(value.to_json())
+    if hasattr(value, "to_dict"):
+        return _to_json_value(value.to_dict())
+    return str(value)
+
+
 class Item:
     """
     An item is an object that can be stored in an inventory.
     """
+    __slots__ = ("name", "features", "_observers")
+
     def __init__(self, name: str, features: dict[str, any]=None):
         """
         Initialize the item.
@@ -14,6 +142,42 @@ class Item:
         assert features is None or isinstance(features, dict), "Features must be a dict."
         self.name = name
         self.features = features or {}
+        # Inventories notified about feature changes (only those maintaining feature indexes)
+        self._observers = None
+
+    def _watch(self, observer):
+        """
+        Register an inventory to be notified about feature changes of the item.
+
+        Args:
+            observer (Inventory): The inventory.
+        """
+        if self._observers is None:
+            self._observers = []
+        self._observers.append(observer)
+
+    def _unwatch(self, observer):
+        """
+        Stop notifying an inventory about feature changes of the item.
+
+        Args:
+            observer (Inventory): The inventory.
+        """
+        self._observers.remove(observer)
+        if not self._observers:
+            self._observers = None
+
+    def _notify(self, feature: str, old: any, new: any):
+        """
+        Notify the observing inventories about a feature change.
+
+        Args:
+            feature (str): The name of the feature.
+            old (any): The previous value, or _MISSING if the feature was added.
+            new (any): The new value, or _MISSING if the feature was removed.
+        """
+        for observer in self._observers:
+            observer._on_feature_change(self, feature, old, new)
 
     def add_feature(self, feature: str, value: any):
         """
@@ -25,6 +189,8 @@ class Item:
         """
         assert feature not in self.features, f"Feature {feature} already exists"
         self.features.update({feature: value})
+        if self._observers:
+            self._notify(feature, _MISSING, value)
 
     def set_feature(self, feature: str, value: any):
         """
@@ -35,7 +201,10 @@ class Item:
             value (any): The value of the feature.
         """
         assert feature in self.features, f"Feature {feature} not found"
+        old = self.features.get(feature)
         self.features.update({feature: value})
+        if self._observers:
+            self._notify(feature, old, value)
 
     def update_feature(self, feature: str, value: any):
         """
@@ -55,7 +224,13 @@ class Item:
         Args:
             features (dict): A dictionary containing the features to update.
         """
-        self.features.update(features)
+        if not self._observers:
+            self.features.update(features)
+            return
+        for feature, value in features.items():
+            old = self.features.get(feature, _MISSING)
+            self.features.update({feature: value})
+            self._notify(feature, old, value)
 
     def get_feature_value(self, feature: str) -> any:
         """
@@ -87,7 +262,9 @@ class Item:
             feature (str): The name of the feature.
         """
         assert feature in self.features, f"Feature {feature} not found"
-        self.features.pop(feature)
+        old = self.features.pop(feature)
+        if self._observers:
+            self._notify(feature, old, _MISSING)
 
     def get_name(self) -> str:
         """
@@ -98,6 +275,15 @@ class Item:
         """
         return self.name
 
+    def __getstate__(self):
+        # Observers belong to the inventories holding this object, not to its copies
+        return {"name": self.name, "features": self.features}
+
+    def __setstate__(self, state):
+        self.name = state["name"]
+        self.features = state["features"]
+        self._observers = None
+
     def __str__(self):
         return self.name
 
@@ -113,7 +299,7 @@ class Item:
         """
         return {
             "name": self.name,
-            "features": self.features
+            "features": _to_json_value(self.features)
         }
 
     @classmethod
@@ -121,15 +307,847 @@ class Item:
         return cls(json["name"], json["features"])
 
 
+class SharedItem(Item):
+    """
+    An immutable item shared by many inventories, e.g. a reward prototype. Inventories stack it as
+    a counted quantity instead of holding one copy per unit; to change it, an inventory detaches
+    its stack onto a private mutable copy (copy-on-write).
+    """
+    __slots__ = ()
+
+    def __init__(self, name: str, features: dict[str, any]=None):
+        """
+        Initialize the shared item.
+
+        Args:
+            name (str): The name of the item.
+            features (dict[str, any], optional): The features of the item, copied. Defaults to None.
+        """
+        super().__init__(name, dict(features or {}))
+        # Read-only, so the features of every inventory stacking the item cannot be changed through get_features()
+        self.features = MappingProxyType(self.features)
+
+    def _watch(self, observer):
+        # A shared item never changes, so there is nothing to notify
+        pass
+
+    def _unwatch(self, observer):
+        pass
+
+    def _immutable(self, *args):
+        raise TypeError(f"Shared item {self.name} is immutable, detach it from the inventory to change it")
+
+    add_feature = set_feature = update_feature = update_features = remove_feature = _immutable
+
+    def copy(self) -> Item:
+        """
+        Get a private mutable copy of the item.
+
+        Returns:
+            Item: The copy.
+        """
+        return Item(self.name, dict(self.features))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        # Read-only feature views cannot be pickled, so the item is rebuilt from a copy of its features
+        return (SharedItem, (self.name, dict(self.features)))
+
+    def __repr__(self):
+        return f"SharedItem({self.name}, {dict(self.features)})"
+
+
+class ItemStack(MutableMapping):
+    """
+    A compact item stack: the quantity is kept in a slot and any other attributes in a dict
+    that is only created when needed. Behaves like the {"quantity": n} dict it replaces.
+    """
+    __slots__ = ("quantity", "_attributes")
+
+    def __init__(self, attributes: dict[str, any] = None):
+        """
+        Initialize the item stack.
+
+        Args:
+            attributes (dict[str, any], optional): The attributes of the stack (e.g. quantity). Defaults to None.
+        """
+        self.quantity = _MISSING
+        self._attributes = None
+        if attributes:
+            for attribute, value in attributes.items():
+                self[attribute] = value
+
+    def get(self, attribute: str, default: any = None) -> any:
+        """
+        Get an attribute of the stack.
+
+        Args:
+            attribute (str): The name of the attribute.
+            default (any, optional): The value returned if the attribute is not set. Defaults to None.
+
+        Returns:
+            any: The value of the attribute.
+        """
+        if attribute == "quantity":
+            return default if self.quantity is _MISSING else self.quantity
+        if self._attributes is None:
+            return default
+        return self._attributes.get(attribute, default)
+
+    def __getitem__(self, attribute: str) -> any:
+        value = self.get(attribute, _MISSING)
+        if value is _MISSING:
+            raise KeyError(attribute)
+        return value
+
+    def __setitem__(self, attribute: str, value: any):
+        if attribute == "quantity":
+            self.quantity = value
+        elif self._attributes is None:
+            self._attributes = {attribute: value}
+        else:
+            self._attributes[attribute] = value
+
+    def __delitem__(self, attribute: str):
+        if attribute == "quantity" and self.quantity is not _MISSING:
+            self.quantity = _MISSING
+        elif self._attributes is not None and attribute in self._attributes:
+            del self._attributes[attribute]
+        else:
+            raise KeyError(attribute)
+
+    def __contains__(self, attribute: str) -> bool:
+        return self.get(attribute, _MISSING) is not _MISSING
+
+    def __iter__(self):
+        if self.quantity is not _MISSING:
+            yield "quantity"
+        if self._attributes is not None:
+            yield from self._attributes
+
+    def __len__(self) -> int:
+        return (self.quantity is not _MISSING) + len(self._attributes or ())
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class ItemHandle:
+    """
+    A handle bound to an item and its stack in an inventory. Reads and writes the quantity and the
+    features directly, without looking the item up by name. The handle is invalidated when the
+    item's stack is removed from the inventory, and valid again if a transaction rollback restores it.
+    """
+    __slots__ = ("inventory", "item", "stack", "valid")
+
+    def __init__(self, inventory, item: Item):
+        """
+        Initialize the item handle.
+
+        Args:
+            inventory (Inventory): The inventory holding the item.
+            item (Item): The item.
+        """
+        self.inventory = inventory
+        self.item = item
+        self.stack = inventory.item_stack.get(item)
+        self.valid = True
+
+    @property
+    def quantity(self) -> int:
+        return self.stack.get("quantity")
+
+    @quantity.setter
+    def quantity(self, value: int):
+        assert self.valid, f"Item {self.item} is no longer in the inventory"
+        self.inventory._set_stack_attribute(self.item, "quantity", value)
+
+    def get_feature(self, feature: str) -> any:
+        """
+        Get the value of a feature of the item.
+
+        Args:
+            feature (str): The name of the feature.
+
+        Returns:
+            any: The value of the feature.
+        """
+        return self.item.features[feature]
+
+    def set_feature(self, feature: str, value: any):
+        """
+        Set a feature of the item.
+
+        Args:
+            feature (str): The name of the feature.
+            value (any): The value of the feature.
+        """
+        self.item.set_feature(feature, value)
+
+    def __repr__(self):
+        return f"ItemHandle({self.item!r}, {self.stack}{'' if self.valid else ', invalid'})"
+
+
+class SnapshotEntry(NamedTuple):
+    """
+    The state of an item stack in a snapshot. The feature and stack dicts are copies whose
+    mutable values (e.g. a ServiceTally, a deque or a Recipe) are deep copies, so later in-place
+    changes of the live values do not reach the snapshot.
+    """
+    name: str
+    features: dict[str, any]
+    stack: dict[str, any]
+
+
+class InventorySnapshot:
+    """
+    A copy-on-write snapshot of an inventory. A snapshot only stores the entries of the items that
+    changed since the previous snapshot of the same inventory and shares all other entries with it;
+    the full state is materialized on demand. Every MAX_DEPTH snapshots a full snapshot is taken, so
+    lookups stay cheap and old snapshots can be garbage collected.
+    """
+    __slots__ = ("parent", "delta", "depth", "_entries")
+
+    MAX_DEPTH = 32
+
+    def __init__(self, parent, delta: dict[Item, SnapshotEntry | None]):
+        """
+        Initialize the snapshot.
+
+        Args:
+            parent (InventorySnapshot): The previous snapshot, or None for a full snapshot.
+            delta (dict[Item, SnapshotEntry | None]): The entries of the changed items (None for removed items).
+        """
+        self.parent = parent
+        self.delta = delta
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self._entries = None
+
+    @property
+    def entries(self) -> dict[Item, SnapshotEntry]:
+        """
+        The entries of all items in the snapshot, materialized on first access.
+        """
+        if self._entries is None:
+            # Replay the deltas from the closest materialized snapshot, without materializing the ones in between
+            chain = []
+            snapshot = self
+            while snapshot is not None and snapshot._entries is None:
+                chain.append(snapshot)
+                snapshot = snapshot.parent
+            entries = dict(snapshot._entries) if snapshot is not None else {}
+            for snapshot in reversed(chain):
+                for item, entry in snapshot.delta.items():
+                    if entry is None:
+                        entries.pop(item, None)
+                    else:
+                        entries.update({item: entry})
+            self._entries = entries
+        return self._entries
+
+    def get_entry(self, item: Item) -> SnapshotEntry | None:
+        """
+        Get the entry of an item, walking the snapshot chain instead of materializing it.
+
+        Args:
+            item (Item): The item.
+
+        Returns:
+            SnapshotEntry | None: The entry, or None if the item was not in the inventory.
+        """
+        snapshot = self
+        while snapshot is not None:
+            if snapshot._entries is not None:
+                return snapshot._entries.get(item)
+            if item in snapshot.delta:
+                return snapshot.delta.get(item)
+            snapshot = snapshot.parent
+        return None
+
+    def _changed_since(self, ancestor) -> set[Item] | None:
+        """
+        Get the items changed between an ancestor snapshot and this one.
+
+        Args:
+            ancestor (InventorySnapshot): The older snapshot.
+
+        Returns:
+            set[Item] | None: The changed items, or None if the snapshot does not descend from the ancestor.
+        """
+        changed = set()
+        snapshot = self
+        while snapshot is not None and snapshot is not ancestor:
+            changed.update(snapshot.delta)
+            snapshot = snapshot.parent
+        return changed if snapshot is ancestor else None
+
+    def diff(self, other) -> dict[str, dict]:
+        """
+        Compare an older snapshot to this one. Between snapshots of the same inventory the cost is
+        proportional to the number of changed items.
+
+        Args:
+            other (InventorySnapshot): The older snapshot.
+
+        Returns:
+            dict[str, dict]: The "added" and "removed" items with their entries and the "changed"
+            items with their (old, new) entries.
+        """
+        candidates = self._changed_since(other)
+        if candidates is None:
+            candidates = other._changed_since(self)
+        if candidates is None:
+            candidates = self.entries.keys() | other.entries.keys()
+
+        diff = {"added": {}, "removed": {}, "changed": {}}
+        for item in candidates:
+            old = other.get_entry(item)
+            new = self.get_entry(item)
+            if old is new:
+                continue
+            if old is None:
+                diff["added"].update({item: new})
+            elif new is None:
+                diff["removed"].update({item: old})
+            elif old != new:
+                diff["changed"].update({item: (old, new)})
+        return diff
+
+    def to_json(self) -> dict:
+        """
+        Convert the snapshot to a JSON object with the same layout as Inventory.to_json.
+
+        Returns:
+            dict: The JSON object.
+        """
+        return {
+            "items": [
+                {"item": {"name": entry.name, "features": _to_json_value(entry.features)}, "stack": _to_json_value(entry.stack)}
+                for entry in self.entries.values()
+            ]
+        }
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f"InventorySnapshot({len(self.delta)} changed, depth {self.depth})"
+
+
 class Inventory():
-    def __init__(self, item_stack: dict[Item, dict[str, any]] = None):
+    # Upper bound on the number of distinct name queries kept up to date on add/remove
+    MAX_CACHED_NAME_QUERIES = 256
+
+    def __init__(self, item_stack: dict[Item, dict[str, any]] = None, compact: bool = False):
         """
         Initialize the inventory.
 
         Args:
             item_stack (dict[Item, dict[str, any]], optional): A dictionary containing the item stacks and their attributes (e.g. quantity). Defaults to None.
+            compact (bool, optional): Whether to store the stacks as slot-based ItemStack records instead of dicts. Defaults to False.
+        """
+        self.compact = compact
+        # Copied, so the inventory's indexes and compact records never alias the caller's dict
+        self.item_stack = dict(item_stack or {})
+        if compact:
+            for item, stack in self.item_stack.items():
+                if not isinstance(stack, ItemStack):
+                    self.item_stack.update({item: ItemStack(stack)})
+
+        # Name index: lower-cased item name -> items with that name, in insertion order
+        self._names = {}
+        # Running aggregates of the stack quantities, in total and per lower-cased item name
+        self._total_quantity = 0
+        self._name_quantities = {}
+        # Cache of substring name queries -> matching items, kept up to date on add/remove
+        self._name_queries = {}
+        # Opt-in indexes: feature/attribute name -> {value: {item: None}}
+        self._feature_indexes = {}
+        self._attribute_indexes = {}
+        # Whether the stacked items notify this inventory about their feature changes
+        self._watching = False
+        # Handles handed out for stacked items, invalidated when their stack is removed
+        self._handles = {}
+        # Undo log of the running transaction, None outside of transactions
+        self._undo_log = None
+        # Row views (e.g. of a PopulationInventoryStore) written through on quantity and feature changes
+        self._views = []
+        # Latest snapshot and the items changed since it; None until the first snapshot
+        self._snapshot = None
+        self._dirty = None
+        # Items whose latest snapshot entry holds mutable values, which can change without notifying the inventory
+        self._volatile = set()
+        # Change event stream and the source name of this inventory's events; None unless enabled
+        self._events = None
+        self._event_source = None
+        for item in self.item_stack:
+            self._index_item(item)
+
+    def _index_item(self, item: Item):
+        """
+        Add a newly stacked item to the name index, every cached name query it matches and the
+        feature and stack attribute indexes.
+
+        Args:
+            item (Item): The item that was added to the inventory.
+        """
+        name = item.get_name().lower()
+        self._names.setdefault(name, []).append(item)
+        for query, matches in self._name_queries.items():
+            if query in name:
+                matches.append(item)
+        self._add_quantity(name, self.item_stack.get(item).get("quantity", 0))
+
+        if self._watching:
+            item._watch(self)
+        features = item.get_features()
+        for feature, index in self._feature_indexes.items():
+            if feature in features:
+                _post(index, features.get(feature), item)
+                self._feature_changed(feature)
+        stack = self.item_stack.get(item)
+        for attribute, index in self._attribute_indexes.items():
+            if attribute in stack:
+                _post(index, stack.get(attribute), item)
+
+    def _unindex_item(self, item: Item):
+        """
+        Remove an item from the name index, the cached name queries and the feature and stack
+        attribute indexes.
+
+        Args:
+            item (Item): The item that is being removed from the inventory.
+        """
+        name = item.get_name().lower()
+        items = self._names.get(name)
+        items.remove(item)
+        self._add_quantity(name, -self.item_stack.get(item).get("quantity", 0))
+        if not items:
+            self._names.pop(name)
+            self._name_quantities.pop(name)
+        for query, matches in self._name_queries.items():
+            if query in name:
+                matches.remove(item)
+
+        if self._watching:
+            item._unwatch(self)
+        features = item.get_features()
+        for feature, index in self._feature_indexes.items():
+            if feature in features:
+                _unpost(index, features.get(feature), item)
+                self._feature_changed(feature)
+        stack = self.item_stack.get(item)
+        for attribute, index in self._attribute_indexes.items():
+            if attribute in stack:
+                _unpost(index, stack.get(attribute), item)
+
+    def _new_stack(self, quantity: int) -> dict[str, any] | ItemStack:
+        """
+        Create the stack of an item that enters the inventory.
+
+        Args:
+            quantity (int): The quantity of the item.
+
+        Returns:
+            dict[str, any] | ItemStack: The stack, compact if the inventory is.
+        """
+        if self.compact:
+            stack = ItemStack()
+            stack.quantity = quantity
+            return stack
+        return {"quantity": quantity}
+
+    def _insert_stack(self, item: Item, stack: dict[str, any], handle: ItemHandle = None):
+        """
+        Add a new item stack to the inventory and index it.
+
+        Args:
+            item (Item): The item, which must not be in the inventory yet.
+            stack (dict[str, any]): The attributes of the stack (e.g. quantity).
+            handle (ItemHandle, optional): A handle invalidated when the stack was dropped, bound to the stack again. Defaults to None.
+        """
+        self.item_stack.update({item: stack})
+        self._index_item(item)
+        if handle is not None:
+            handle.stack = stack
+            handle.valid = True
+            self._handles.update({item: handle})
+        if self._undo_log is not None:
+            self._undo_log.append(("insert", item, None, None))
+        if self._dirty is not None:
+            self._dirty.add(item)
+        if self._events is not None:
+            self._events.emit(self._event_source, "added", item, None, stack.get("quantity", 0))
+
+    def _drop_stack(self, item: Item):
+        """
+        Remove an item stack from the inventory and the indexes.
+
+        Args:
+            item (Item): The item, which must be in the inventory.
+        """
+        self._unindex_item(item)
+        stack = self.item_stack.pop(item)
+        handle = self._handles.pop(item, None)
+        if handle is not None:
+            handle.valid = False
+        if self._undo_log is not None:
+            # The handle is kept, so a rollback restores it along with the stack
+            self._undo_log.append(("drop", item, handle, stack))
+        if self._dirty is not None:
+            self._dirty.add(item)
+        if self._events is not None:
+            self._events.emit(self._event_source, "removed", item, None, -stack.get("quantity", 0))
+
+    def _set_stack_attribute(self, item: Item, attribute: str, value: any):
+        """
+        Set an attribute of an item stack in place, keeping the attribute index up to date.
+
+        Args:
+            item (Item): The item, which must be in the inventory.
+            attribute (str): The name of the attribute.
+            value (any): The value of the attribute.
+        """
+        stack = self.item_stack.get(item)
+        if self._undo_log is not None:
+            self._undo_log.append(("set", item, attribute, stack.get(attribute, _MISSING)))
+        if self._dirty is not None:
+            self._dirty.add(item)
+        if attribute == "quantity":
+            change = value - stack.get("quantity", 0)
+            self._add_quantity(item.get_name().lower(), change)
+            if self._events is not None:
+                self._events.emit(self._event_source, "quantity", item, attribute, change)
+        elif self._events is not None:
+            self._events.emit(self._event_source, "attribute", item, attribute, value)
+        index = self._attribute_indexes.get(attribute)
+        if index is not None:
+            if attribute in stack:
+                _unpost(index, stack.get(attribute), item)
+            _post(index, value, item)
+        stack[attribute] = value
+
+    def _remove_stack_attribute(self, item: Item, attribute: str):
+        """
+        Remove an attribute from an item stack, keeping the attribute index up to date.
+
+        Args:
+            item (Item): The item, which must be in the inventory.
+            attribute (str): The name of the attribute, which must be set.
+        """
+        stack = self.item_stack.get(item)
+        if self._undo_log is not None:
+            self._undo_log.append(("set", item, attribute, stack.get(attribute)))
+        if self._dirty is not None:
+            self._dirty.add(item)
+        if attribute == "quantity":
+            self._add_quantity(item.get_name().lower(), -stack.get("quantity"))
+        if self._events is not None:
+            change = -stack.get("quantity") if attribute == "quantity" else None
+            self._events.emit(self._event_source, "quantity" if attribute == "quantity" else "attribute", item, attribute, change)
+        index = self._attribute_indexes.get(attribute)
+        if index is not None:
+            _unpost(index, stack.get(attribute), item)
+        stack.pop(attribute)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group stack changes (added and removed items, quantities and other stack attributes) so
+        that they are applied atomically: if the block raises, every change made in it is rolled
+        back and the exception is re-raised. Transactions can be nested. Changes of item features
+        are not part of the transaction.
+
+        Yields:
+            Inventory: The inventory.
+        """
+        outermost = self._undo_log is None
+        if outermost:
+            self._undo_log = []
+        savepoint = len(self._undo_log)
+        try:
+            yield self
+        except BaseException:
+            self._rollback(savepoint)
+            raise
+        finally:
+            if outermost:
+                self._undo_log = None
+
+    def _rollback(self, savepoint: int):
+        """
+        Undo the changes recorded in the undo log after a savepoint.
+
+        Args:
+            savepoint (int): The length of the undo log when the (nested) transaction started.
+        """
+        undo_log = self._undo_log
+        self._undo_log = None
+        while len(undo_log) > savepoint:
+            change, item, attribute, value = undo_log.pop()
+            match change:
+                case "insert":
+                    self._drop_stack(item)
+                case "drop":
+                    # Drop entries hold the dropped handle in place of an attribute
+                    self._insert_stack(item, value, handle=attribute)
+                case "set" if value is _MISSING:
+                    self._remove_stack_attribute(item, attribute)
+                case "set":
+                    self._set_stack_attribute(item, attribute, value)
+        self._undo_log = undo_log
+
+    def apply_quantity_changes(self, changes: dict[Item, int | float]):
+        """
+        Atomically change the quantities of multiple items. Items that are not in the inventory are
+        added; stacks whose quantity drops to zero are kept.
+
+        Args:
+            changes (dict[Item, int | float]): The quantity change of each item.
+        """
+        assert all(isinstance(item, Item) for item in changes), "All items must be Item objects."
+        assert all(
+            (self.item_stack.get(item).get("quantity") if item in self.item_stack else 0) + change >= 0
+            for item, change in changes.items()
+        ), "Quantities cannot become negative."
+        with self.transaction():
+            for item, change in changes.items():
+                if item in self.item_stack:
+                    self._set_stack_attribute(item, "quantity", self.item_stack.get(item).get("quantity") + change)
+                else:
+                    self._insert_stack(item, self._new_stack(change))
+
+    def _on_feature_change(self, item: Item, feature: str, old: any, new: any):
+        """
+        Keep the feature index, the snapshot bookkeeping and the event stream up to date when a feature of a stacked item changes.
+
+        Args:
+            item (Item): The changed item.
+            feature (str): The name of the feature.
+            old (any): The previous value, or _MISSING if the feature was added.
+            new (any): The new value, or _MISSING if the feature was removed.
+        """
+        if self._dirty is not None:
+            self._dirty.add(item)
+        if self._events is not None:
+            self._events.emit(self._event_source, "feature", item, feature, None if new is _MISSING else new)
+        index = self._feature_indexes.get(feature)
+        if index is None:
+            return
+        if old is not _MISSING:
+            _unpost(index, old, item)
+        if new is not _MISSING:
+            _post(index, new, item)
+        self._feature_changed(feature)
+
+    def _feature_changed(self, feature: str):
+        """
+        Write an indexed feature through to the row views after its postings changed.
+
+        Args:
+            feature (str): The name of the feature.
+        """
+        for view in self._views:
+            view.feature_changed(self, feature)
+
+    def enable_events(self, stream: InventoryEventStream = None, source: str = None, maxlen: int = 4096) -> InventoryEventStream:
+        """
+        Emit change events (items added and removed, quantity changes, stack attribute and feature
+        changes) into an event stream, which can be shared by many inventories.
+
+        Args:
+            stream (InventoryEventStream, optional): The stream. Defaults to a new stream.
+            source (str, optional): The source name of the events, e.g. the agent's JID. Defaults to None.
+            maxlen (int, optional): The ring buffer capacity of a new stream. Defaults to 4096.
+
+        Returns:
+            InventoryEventStream: The stream.
+        """
+        self._events = stream if stream is not None else InventoryEventStream(maxlen)
+        self._event_source = source
+        self._set_watching(True)
+        return self._events
+
+    def disable_events(self):
+        """
+        Stop emitting change events.
+        """
+        self._events = None
+        self._set_watching(False)
+
+    def add_view(self, view):
+        """
+        Bind a row view, which is notified after every change of an item quantity (by item name)
+        and of an indexed feature (by feature name).
+
+        Args:
+            view: An object with quantity_changed(inventory, name) and feature_changed(inventory, feature) methods.
+        """
+        self._views.append(view)
+
+    def remove_view(self, view):
+        """
+        Unbind a row view.
+
+        Args:
+            view: The view to unbind.
+        """
+        self._views.remove(view)
+
+    def _set_watching(self, watching: bool):
+        """
+        Start or stop receiving feature change notifications from all stacked items. Items keep
+        notifying as long as they are needed by a feature index, for snapshots or for change events.
+
+        Args:
+            watching (bool): Whether the items should notify this inventory.
+        """
+        watching = watching or bool(self._feature_indexes) or self._dirty is not None or self._events is not None
+        if watching == self._watching:
+            return
+        for item in self.item_stack:
+            if watching:
+                item._watch(self)
+            else:
+                item._unwatch(self)
+        self._watching = watching
+
+    def add_feature_index(self, feature: str):
+        """
+        Maintain a hash index over an item feature, so lookups by that feature do not scan the inventory.
+
+        The index is kept consistent through change notifications of the stacked items. Indexed lookups
+        return items in the order they obtained the looked up value.
+
+        Args:
+            feature (str): The name of the feature.
+        """
+        if feature in self._feature_indexes:
+            return
+        index = {}
+        for item in self.item_stack:
+            features = item.get_features()
+            if feature in features:
+                _post(index, features.get(feature), item)
+        self._feature_indexes.update({feature: index})
+        self._set_watching(True)
+
+    def remove_feature_index(self, feature: str):
+        """
+        Stop maintaining the index over an item feature.
+
+        Args:
+            feature (str): The name of the feature.
+        """
+        self._feature_indexes.pop(feature, None)
+        self._set_watching(bool(self._feature_indexes))
+
+    def add_stack_attribute_index(self, attribute: str):
+        """
+        Maintain a hash index over an item stack attribute, so lookups by that attribute do not scan the inventory.
+
+        Args:
+            attribute (str): The name of the attribute.
+        """
+        if attribute in self._attribute_indexes:
+            return
+        index = {}
+        for item, stack in self.item_stack.items():
+            if attribute in stack:
+                _post(index, stack.get(attribute), item)
+        self._attribute_indexes.update({attribute: index})
+
+    def remove_stack_attribute_index(self, attribute: str):
+        """
+        Stop maintaining the index over an item stack attribute.
+
+        Args:
+            attribute (str): The name of the attribute.
         """
-        self.item_stack = item_stack or {}
+        self._attribute_indexes.pop(attribute, None)
+
+    def _match_features(self, features: dict) -> Iterator[Item]:
+        """
+        Get the items having all the given feature values, intersecting index postings where possible.
+
+        Args:
+            features (dict): A dictionary containing the features and their values.
+
+        Returns:
+            Iterator[Item]: A lazy iterator over the matching items.
+        """
+        postings = [_lookup(self._feature_indexes.get(feature), value) for feature, value in features.items() if feature in self._feature_indexes]
+        unindexed = {feature: value for feature, value in features.items() if feature not in self._feature_indexes}
+        matches = lambda item: all(item.get_features().get(feature, _MISSING) == value for feature, value in unindexed.items())
+        if not postings:
+            return filter(matches, self.item_stack)
+        postings.sort(key=len)
+        return (item for item in postings[0] if all(item in posting for posting in postings[1:]) and matches(item))
+
+    def _match_stacks(self, attributes: dict) -> dict[Item, dict[str, any]]:
+        """
+        Get the item stacks having all the given attribute values, intersecting index postings where possible.
+
+        Args:
+            attributes (dict): A dictionary containing the attributes and their values.
+
+        Returns:
+            dict[Item, dict[str, any]]: The matching item stacks.
+        """
+        postings = [_lookup(self._attribute_indexes.get(attribute), value) for attribute, value in attributes.items() if attribute in self._attribute_indexes]
+        unindexed = {attribute: value for attribute, value in attributes.items() if attribute not in self._attribute_indexes}
+        matches = lambda stack: all(stack.get(attribute) == value for attribute, value in unindexed.items())
+        if not postings:
+            return dict(filter(lambda item_stack: matches(item_stack[1]), self.item_stack.items()))
+        postings.sort(key=len)
+        return {item: self.item_stack.get(item) for item in postings[0] if all(item in posting for posting in postings[1:]) and matches(self.item_stack.get(item))}
+
+    def _add_quantity(self, name: str, change: int | float):
+        """
+        Update the running quantity aggregates.
+
+        Args:
+            name (str): The lower-cased name of the changed item.
+            change (int | float): The change of the item's quantity.
+        """
+        self._total_quantity += change
+        self._name_quantities.update({name: self._name_quantities.get(name, 0) + change})
+        for view in self._views:
+            view.quantity_changed(self, name)
+
+    def _match_name(self, name: str) -> list[Item]:
+        """
+        Get the (cached) list of items whose name contains the given name, ignoring case.
+
+        The first query for a name is answered from the name index and cached; the cache is
+        updated incrementally on every add/remove, so repeated queries cost O(1).
+
+        Args:
+            name (str): The name, or part of the name, of the item.
+
+        Returns:
+            list[Item]: The matching items in inventory order. Must not be modified by the caller.
+        """
+        query = name.lower()
+        matches = self._name_queries.get(query)
+        if matches is None:
+            names = [indexed for indexed in self._names if query in indexed]
+            if len(names) == 1:
+                matches = list(self._names.get(names[0]))
+            elif names:
+                # Items of several names interleave, so keep the inventory order
+                matches = [item for item in self.item_stack if query in item.get_name().lower()]
+            else:
+                matches = []
+            if len(self._name_queries) >= self.MAX_CACHED_NAME_QUERIES:
+                self._name_queries.clear()
+            self._name_queries[query] = matches
+        return matches
 
     def add_item(self, item: Item):
         """
@@ -140,9 +1158,9 @@ class Inventory():
         """
         assert isinstance(item, Item), "Item must be an Item object."
         if item in self.item_stack:
-            self.item_stack.update({item: {"quantity": self.item_stack.get(item).get("quantity") + 1}})
+            self._set_stack_attribute(item, "quantity", self.item_stack.get(item).get("quantity") + 1)
         else:
-            self.item_stack.update({item: {"quantity": 1}})
+            self._insert_stack(item, self._new_stack(1))
 
     def add_items(self, items: list[Item]):
         """
@@ -166,9 +1184,9 @@ class Inventory():
         assert isinstance(item, Item), "Item must be an Item object."
         assert isinstance(quantity, int), "Quantity must be an integer."
         if item in self.item_stack:
-            self.item_stack.update({item: {"quantity": self.item_stack.get(item).get("quantity") + quantity}})
+            self._set_stack_attribute(item, "quantity", self.item_stack.get(item).get("quantity") + quantity)
         else:
-            self.item_stack.update({item: {"quantity": quantity}})
+            self._insert_stack(item, self._new_stack(quantity))
 
     def remove_item(self, item: Item):
         """
@@ -180,9 +1198,29 @@ class Inventory():
         assert item in self.item_stack, "Item not found"
         new_quantity = self.item_stack.get(item).get("quantity") - 1
         if new_quantity:
-            self.item_stack.update({item: {"quantity": new_quantity}})
+            self._set_stack_attribute(item, "quantity", new_quantity)
         else:
-            self.item_stack.pop(item)
+            self._drop_stack(item)
+
+    def detach_item(self, item: Item) -> Item:
+        """
+        Move the stack of a shared item onto a private mutable copy of the item, which can then be
+        changed without affecting the other inventories holding the shared item.
+
+        Args:
+            item (Item): The item.
+
+        Returns:
+            Item: The private copy, or the item itself if it is not shared.
+        """
+        assert item in self.item_stack, "Item not found"
+        if not isinstance(item, SharedItem):
+            return item
+        stack = self.item_stack.get(item)
+        private = item.copy()
+        self._drop_stack(item)
+        self._insert_stack(private, stack)
+        return private
 
     def has_item(self, item: Item):
         """
@@ -222,9 +1260,25 @@ class Inventory():
             name (str): The name of the item.
 
         Returns:
-            Item: The item.
+            list[Item]: The items whose name contains the given name, ignoring case.
+        """
+        return list(self._match_name(name))
+
+    def get_items_by_exact_name(self, name: str, case_sensitive: bool = False) -> list[Item]:
+        """
+        Get all items from the inventory whose name equals the given name.
+
+        Args:
+            name (str): The name of the item.
+            case_sensitive (bool, optional): Whether the name has to match in case as well. Defaults to False.
+
+        Returns:
+            list[Item]: The items with the given name.
         """
-        return list(filter(lambda item: name.lower() in item.get_name().lower(), self.item_stack.keys()))
+        items = self._names.get(name.lower(), [])
+        if case_sensitive:
+            return [item for item in items if item.get_name() == name]
+        return list(items)
 
     def get_item_by_name(self, name: str):
         """
@@ -236,7 +1290,36 @@ class Inventory():
         Returns:
             Item: The item.
         """
-        return self.get_items_by_name(name)[0]
+        return self._match_name(name)[0]
+
+    def get_handle(self, item: Item) -> ItemHandle:
+        """
+        Get the (cached) handle of an item in the inventory.
+
+        Args:
+            item (Item): The item.
+
+        Returns:
+            ItemHandle: The handle, valid until the item's stack is removed.
+        """
+        assert item in self.item_stack, "Item not found"
+        handle = self._handles.get(item)
+        if handle is None:
+            handle = ItemHandle(self, item)
+            self._handles.update({item: handle})
+        return handle
+
+    def get_item_handle(self, name: str) -> ItemHandle:
+        """
+        Get the handle of the item that get_item_by_name returns for a name.
+
+        Args:
+            name (str): The name of the item.
+
+        Returns:
+            ItemHandle: The handle, valid until the item's stack is removed.
+        """
+        return self.get_handle(self.get_item_by_name(name))
 
     def get_item_by_feature(self, feature: str, value: any):
         """
@@ -249,7 +1332,23 @@ class Inventory():
         Returns:
             Item: The item.
         """
-        return next(filter(lambda item: item.get_feature_value(feature) == value, self.item_stack), None)
+        return next(self._match_features({feature: value}), None)
+
+    def count_items_by_feature(self, feature: str, value: any) -> int:
+        """
+        Count the items in the inventory having a feature value; O(1) if the feature is indexed.
+
+        Args:
+            feature (str): The name of the feature.
+            value (any): The value of the feature.
+
+        Returns:
+            int: The number of items.
+        """
+        index = self._feature_indexes.get(feature)
+        if index is not None:
+            return len(_lookup(index, value))
+        return sum(1 for _ in self._match_features({feature: value}))
 
     def get_item_by_features(self, features: dict):
         """
@@ -261,7 +1360,7 @@ class Inventory():
         Returns:
             Item: The item.
         """
-        return next(filter(lambda item: all(item.get_feature_value(feature) == value for feature, value in features.items()), self.item_stack), None)
+        return next(self._match_features(features), None)
 
     def get_items_by_feature(self, feature: str, value: any):
         """
@@ -274,7 +1373,7 @@ class Inventory():
         Returns:
             list[Item]: A list of items.
         """
-        return list(filter(lambda item: item.get_feature_value(feature) == value, self.item_stack))
+        return list(self._match_features({feature: value}))
 
     def get_items_by_features(self, features: dict):
         """
@@ -286,7 +1385,7 @@ class Inventory():
         Returns:
             list[Item]: A list of items.
         """
-        return list(filter(lambda item: all(item.get_feature_value(feature) == value for feature, value in features.items()), self.item_stack))
+        return list(self._match_features(features))
 
     def get_item_quantity(self, item: Item):
         """
@@ -308,7 +1407,19 @@ class Inventory():
         Returns:
             int: The total quantity of all items.
         """
-        return sum(attributes.get("quantity") for attributes in self.item_stack.values())
+        return self._total_quantity
+
+    def get_quantity_by_name(self, name: str) -> int:
+        """
+        Get the total quantity of the items with a name, ignoring case.
+
+        Args:
+            name (str): The name of the items.
+
+        Returns:
+            int: The total quantity of the items with the given name.
+        """
+        return self._name_quantities.get(name.lower(), 0)
 
     def add_item_stack_attribute(self, item: Item, attribute: str, value: any):
         """
@@ -320,7 +1431,7 @@ class Inventory():
             value (any): The value of the attribute.
         """
         assert item in self.item_stack, "Item not found"
-        self.item_stack.get(item).update({attribute: value})
+        self._set_stack_attribute(item, attribute, value)
 
     def update_item_stack_attribute(self, item: Item, attribute: str, value: any):
         """
@@ -360,7 +1471,7 @@ class Inventory():
         """
         assert item in self.item_stack, "Item not found"
         assert attribute in self.item_stack.get(item), "Attribute not found"
-        self.item_stack.get(item).pop(attribute)
+        self._remove_stack_attribute(item, attribute)
 
     def get_item_stack_attributes(self, item: Item):
         """
@@ -386,7 +1497,7 @@ class Inventory():
         Returns:
             dict[Item, dict[str, any]]: The specific item stack.
         """
-        return dict(filter(lambda item_stack: item_stack[1].get(attribute) == value, self.item_stack.items()))
+        return self._match_stacks({attribute: value})
 
     def get_item_stack_by_attributes(self, attributes: dict):
         """
@@ -398,7 +1509,7 @@ class Inventory():
         Returns:
             dict[Item, dict[str, any]]: The specific item stack.
         """
-        return dict(filter(lambda item_stack: all(item_stack[1].get(attribute) == value for attribute, value in attributes.items()), self.item_stack.items()), None)
+        return self._match_stacks(attributes)
 
     def get_item_stacks_by_attribute(self, attribute: str, value: any):
         """
@@ -411,7 +1522,7 @@ class Inventory():
         Returns:
             dict[Item, dict[str, any]]: The specific item stacks.
         """
-        return dict(filter(lambda item_stack: item_stack[1].get(attribute) == value, self.item_stack.items()))
+        return self._match_stacks({attribute: value})
 
     def get_item_stacks_by_attributes(self, attributes: dict):
         """
@@ -423,17 +1534,18 @@ class Inventory():
         Returns:
             dict[Item, dict[str, any]]: The specific item stacks.
         """
-        return dict(filter(lambda item_stack: all(item_stack[1].get(attribute) == value for attribute, value in attributes.items()), self.item_stack.items()))
+        return self._match_stacks(attributes)
 
     def to_json(self):
         """
-        Convert the inventory object to a JSON object.
+        Convert the inventory object to a JSON object. Object values are converted to their JSON
+        form (see _to_json_value), which from_json does not convert back.
 
         Returns:
             dict: The JSON object.
         """
         return {
-            "items": {item.to_json(): quantity for item, quantity in self.item_stack.items()}
+            "items": [{"item": item.to_json(), "stack": _to_json_value(stack)} for item, stack in self.item_stack.items()]
         }
 
     @classmethod
@@ -447,7 +1559,67 @@ class Inventory():
         Returns:
             Inventory: The inventory object.
         """
-        return cls({Item.from_json(item): quantity for item, quantity in json["items"].items()})
+        return cls({Item.from_json(entry["item"]): dict(entry["stack"]) for entry in json["items"]})
+
+    def snapshot(self) -> InventorySnapshot:
+        """
+        Take a copy-on-write snapshot of the inventory. Only the items changed since the previous
+        snapshot are copied, so the cost is proportional to what changed. From the first snapshot on,
+        the items notify the inventory about feature changes. Mutable feature values can also change
+        in place (e.g. a ServiceTally being incremented), so the items holding them are copied again
+        and compared with their previous entry on every snapshot.
+
+        Returns:
+            InventorySnapshot: The snapshot.
+        """
+        previous = self._snapshot
+        if previous is None:
+            snapshot = InventorySnapshot(None, {item: self._snapshot_entry(item) for item in self.item_stack})
+        else:
+            volatile = [item for item in self._volatile if item not in self._dirty]
+            delta = {}
+            for item in self._dirty:
+                if item in self.item_stack:
+                    delta.update({item: self._snapshot_entry(item)})
+                else:
+                    delta.update({item: None})
+                    self._volatile.discard(item)
+            for item in volatile:
+                entry = self._snapshot_entry(item)
+                if entry != previous.get_entry(item):
+                    delta.update({item: entry})
+            snapshot = InventorySnapshot(previous, delta)
+            if snapshot.depth >= InventorySnapshot.MAX_DEPTH:
+                # Flatten the chain, still sharing the unchanged entries
+                snapshot = InventorySnapshot(None, snapshot.entries)
+        self._snapshot = snapshot
+        self._dirty = set()
+        self._set_watching(True)
+        return snapshot
+
+    def _snapshot_entry(self, item: Item) -> SnapshotEntry:
+        """
+        Copy the state of an item stack for a snapshot, deep-copying its mutable values.
+
+        Args:
+            item (Item): The item.
+
+        Returns:
+            SnapshotEntry: The entry.
+        """
+        features = dict(item.get_features())
+        stack = dict(self.item_stack.get(item))
+        mutable = False
+        for values in (features, stack):
+            for key, value in values.items():
+                if not _is_immutable(value):
+                    values[key] = copy.deepcopy(value)
+                    mutable = True
+        if mutable:
+            self._volatile.add(item)
+        else:
+            self._volatile.discard(item)
+        return SnapshotEntry(item.get_name(), features, stack)
 
     def __str__(self):
         return f"Inventory({'; '.join([f"{quantity.get('quantity')}x {item.get_name()}" for item, quantity in self.item_stack.items()])})"
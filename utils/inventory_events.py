@@ -0,0 +1,131 @@
+import asyncio
+from collections import deque
+from typing import Callable, NamedTuple
+
+
+class InventoryEvent(NamedTuple):
+    """
+    A change of an inventory.
+
+    kind is one of:
+        "added": an item stack was added, value is its quantity
+        "removed": an item stack was removed, value is the negated quantity it had
+        "quantity": the quantity of a stack changed, value is the change
+        "attribute": another stack attribute (key) was set to value (None if removed)
+        "feature": a feature (key) of a stacked item was set to value (None if removed)
+    """
+    sequence: int
+    source: str
+    kind: str
+    item: any
+    key: str | None
+    value: any
+
+
+class InventoryEventStream:
+    """
+    A bounded stream of change events emitted by one or more inventories.
+
+    Events are kept in a ring buffer, which collectors drain periodically; once it is full the
+    oldest events are overwritten (counted in buffer_dropped). Events are also pushed to callback
+    subscribers and to bounded asyncio queues, so consumers never need to poll the agents; a full
+    queue drops its oldest event (counted in queue_dropped).
+    """
+    def __init__(self, maxlen: int = 4096):
+        """
+        Initialize the event stream.
+
+        Args:
+            maxlen (int, optional): The capacity of the ring buffer. Defaults to 4096.
+        """
+        assert maxlen > 0, "Buffer length must be positive."
+        self.buffer = deque(maxlen=maxlen)
+        self.sequence = 0
+        # Events overwritten in the ring buffer before being drained, and dropped from full queues
+        self.buffer_dropped = 0
+        self.queue_dropped = 0
+        self.subscribers: list[Callable[[InventoryEvent], None]] = []
+        self.queues: list[asyncio.Queue] = []
+
+    def emit(self, source: str, kind: str, item, key: str | None, value: any):
+        """
+        Emit an event.
+
+        Args:
+            source (str): The source of the event, e.g. the JID of the inventory's agent.
+            kind (str): The kind of the change.
+            item (Item): The changed item.
+            key (str | None): The changed stack attribute or feature.
+            value (any): The quantity change or the new value.
+        """
+        event = InventoryEvent(self.sequence, source, kind, item, key, value)
+        self.sequence += 1
+        if len(self.buffer) == self.buffer.maxlen:
+            self.buffer_dropped += 1
+        self.buffer.append(event)
+        for callback in self.subscribers:
+            callback(event)
+        for queue in self.queues:
+            if queue.full():
+                queue.get_nowait()
+                self.queue_dropped += 1
+            queue.put_nowait(event)
+
+    def drain(self) -> list[InventoryEvent]:
+        """
+        Take all buffered events.
+
+        Returns:
+            list[InventoryEvent]: The events, oldest first.
+        """
+        events = list(self.buffer)
+        self.buffer.clear()
+        return events
+
+    def subscribe(self, callback: Callable[[InventoryEvent], None]):
+        """
+        Call a function with every event as it is emitted, e.g. to update a downstream index.
+
+        Args:
+            callback (Callable[[InventoryEvent], None]): The function.
+        """
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[InventoryEvent], None]):
+        """
+        Stop calling a function with the events.
+
+        Args:
+            callback (Callable[[InventoryEvent], None]): The function.
+        """
+        self.subscribers.remove(callback)
+
+    def subscribe_queue(self, maxsize: int = 1024) -> asyncio.Queue:
+        """
+        Get a bounded asyncio queue receiving every event; when it is full the oldest event is dropped.
+
+        Args:
+            maxsize (int, optional): The capacity of the queue. Defaults to 1024.
+
+        Returns:
+            asyncio.Queue: The queue.
+        """
+        assert maxsize > 0, "Queue size must be positive."
+        queue = asyncio.Queue(maxsize=maxsize)
+        self.queues.append(queue)
+        return queue
+
+    def unsubscribe_queue(self, queue: asyncio.Queue):
+        """
+        Stop pushing events to a queue.
+
+        Args:
+            queue (asyncio.Queue): The queue.
+        """
+        self.queues.remove(queue)
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def __str__(self):
+        return f"InventoryEventStream({len(self.buffer)} buffered, {self.sequence} emitted, {self.buffer_dropped} overwritten, {self.queue_dropped} dropped from queues)"
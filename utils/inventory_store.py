@@ -0,0 +1,205 @@
+import numpy as np
+
+from utils.inventory import Inventory
+
+
+# Well-known quantities and flags of consumer and provider agents
+DEFAULT_COLUMNS = {
+    "money": {"name": "money"},
+    "completed recipes": {"name": "completed recipe"},
+    "free media": {"feature": "available", "value": True},
+}
+
+
+class InventoryRow:
+    """
+    The binding of an inventory to its row in a population store. The inventory notifies it about
+    every quantity and indexed feature change, which it writes through to the store's columns.
+    """
+    __slots__ = ("store", "row")
+
+    def __init__(self, store, row: int):
+        """
+        Initialize the row binding.
+
+        Args:
+            store (PopulationInventoryStore): The store.
+            row (int): The row of the inventory in the store.
+        """
+        self.store = store
+        self.row = row
+
+    def quantity_changed(self, inventory: Inventory, name: str):
+        """
+        Write the quantity of the items with a name to the columns holding it.
+
+        Args:
+            inventory (Inventory): The changed inventory.
+            name (str): The lower-cased name of the changed items.
+        """
+        for column in self.store.quantity_columns.get(name, ()):
+            self.store.columns[column][self.row] = inventory.get_quantity_by_name(name)
+
+    def feature_changed(self, inventory: Inventory, feature: str):
+        """
+        Write the number of items with a feature value to the columns counting it.
+
+        Args:
+            inventory (Inventory): The changed inventory.
+            feature (str): The name of the changed feature.
+        """
+        for column, value in self.store.feature_columns.get(feature, ()):
+            self.store.columns[column][self.row] = inventory.count_items_by_feature(feature, value)
+
+
+class PopulationInventoryStore:
+    """
+    A columnar store holding well-known quantities and flags of a whole population of inventories,
+    one row per agent, so population-wide questions become vectorized operations on the columns.
+
+    A column either holds the total quantity of the items with a name ({"name": "money"}) or the
+    number of items with a feature value ({"feature": "available", "value": True}). Registered
+    inventories write their changes through to their row.
+
+    The store is a write-through mirror: the inventories stay the storage of their items, and a
+    row holds a copy of the well-known values that is updated on every change. Writing to the
+    columns directly does not change the inventories.
+    """
+    def __init__(self, columns: dict[str, dict[str, any]] = None, capacity: int = 1024):
+        """
+        Initialize the store.
+
+        Args:
+            columns (dict[str, dict[str, any]], optional): The column definitions. Defaults to DEFAULT_COLUMNS.
+            capacity (int, optional): The initial number of rows. Defaults to 1024.
+        """
+        columns = columns or DEFAULT_COLUMNS
+        assert all("name" in column or "feature" in column for column in columns.values()), "Columns must define a name or a feature."
+        self.definitions = columns
+        self.capacity = max(1, capacity)
+        self.size = 0
+
+        # Lower-cased item name -> columns holding its quantity
+        self.quantity_columns: dict[str, list[str]] = {}
+        # Feature -> (column, value) pairs counting the items with the value
+        self.feature_columns: dict[str, list[tuple[str, any]]] = {}
+        self.columns: dict[str, np.ndarray] = {}
+        for column, definition in columns.items():
+            if "name" in definition:
+                self.quantity_columns.setdefault(definition.get("name").lower(), []).append(column)
+                self.columns.update({column: np.zeros(self.capacity, dtype=np.float64)})
+            else:
+                self.feature_columns.setdefault(definition.get("feature"), []).append((column, definition.get("value")))
+                self.columns.update({column: np.zeros(self.capacity, dtype=np.int64)})
+        self.active = np.zeros(self.capacity, dtype=bool)
+
+        self.keys: list[str] = []
+        self.rows: dict[str, int] = {}
+        self.bindings: list[tuple[Inventory, InventoryRow] | None] = []
+
+    def _grow(self):
+        """
+        Double the capacity of all columns.
+        """
+        self.capacity *= 2
+        for column, values in self.columns.items():
+            grown = np.zeros(self.capacity, dtype=values.dtype)
+            grown[:self.size] = values[:self.size]
+            self.columns.update({column: grown})
+        active = np.zeros(self.capacity, dtype=bool)
+        active[:self.size] = self.active[:self.size]
+        self.active = active
+
+    def register(self, key: str, inventory: Inventory) -> int:
+        """
+        Register an inventory and bind it, so its changes are written to its row. A key registered
+        before (e.g. an agent that restarted) gets its former row back.
+
+        Args:
+            key (str): The key of the row, e.g. the agent's JID.
+            inventory (Inventory): The inventory.
+
+        Returns:
+            int: The row of the inventory.
+        """
+        row = self.rows.get(key)
+        if row is None:
+            if self.size == self.capacity:
+                self._grow()
+            row = self.size
+            self.size += 1
+            self.keys.append(key)
+            self.rows.update({key: row})
+            self.bindings.append(None)
+        assert self.bindings[row] is None, f"Row {key} already exists"
+        self.active[row] = True
+
+        view = InventoryRow(self, row)
+        for feature in self.feature_columns:
+            inventory.add_feature_index(feature)
+        inventory.add_view(view)
+        self.bindings[row] = (inventory, view)
+
+        for name in self.quantity_columns:
+            view.quantity_changed(inventory, name)
+        for feature in self.feature_columns:
+            view.feature_changed(inventory, feature)
+        return row
+
+    def unregister(self, key: str):
+        """
+        Unbind an inventory. Its row is kept for the key, but excluded from queries until the key
+        is registered again.
+
+        Args:
+            key (str): The key of the row.
+        """
+        row = self.rows.get(key)
+        assert row is not None and self.bindings[row] is not None, f"Row {key} is not registered"
+        inventory, view = self.bindings[row]
+        inventory.remove_view(view)
+        self.bindings[row] = None
+        self.active[row] = False
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        """
+        Get the values of a column for all rows (a view, not a copy).
+
+        Args:
+            column (str): The name of the column.
+
+        Returns:
+            np.ndarray: The values of the column.
+        """
+        return self.columns[column][:self.size]
+
+    def get_row(self, key: str) -> dict[str, any]:
+        """
+        Get the values of a row.
+
+        Args:
+            key (str): The key of the row.
+
+        Returns:
+            dict[str, any]: The value of each column.
+        """
+        row = self.rows.get(key)
+        return {column: values[row].item() for column, values in self.columns.items()}
+
+    def select(self, mask: np.ndarray) -> list[str]:
+        """
+        Get the keys of the registered rows selected by a mask.
+
+        Args:
+            mask (np.ndarray): A boolean mask over all rows, e.g. (store["free media"] > 0) & (store["money"] > 10).
+
+        Returns:
+            list[str]: The keys of the selected rows.
+        """
+        return [self.keys[row] for row in np.flatnonzero(mask & self.active[:self.size])]
+
+    def __len__(self):
+        return int(self.active[:self.size].sum())
+
+    def __str__(self):
+        return f"PopulationInventoryStore({len(self)} rows, columns: {', '.join(self.columns)})"
@@ -0,0 +1,259 @@
+import math
+from array import array
+from collections.abc import Iterator
+from contextlib import ExitStack
+
+from utils.inventory import ItemHandle
+from utils.logger import logger
+
+
+class SettlementError(Exception):
+    """
+    A settlement that could not be applied. Nothing of it was applied: the entries stay unsettled
+    and the next settlement retries them, e.g. once the failing account is funded again or bound
+    to a new money item with rebind_account.
+    """
+
+
+class SettlementLedger:
+    """
+    An append-only ledger of money transfers between agents.
+
+    Transfers are recorded as compact entries (payer, payee, amount) and applied to the agents'
+    inventories in batches: every account's pending changes are netted and applied once, inside
+    one transaction per inventory, so either the whole batch is settled or none of it is.
+    The ledger tracks the balance every account should have after its settled entries, so an audit
+    reveals money that was changed outside the ledger.
+    """
+    def __init__(self, batch_size: int = 1024):
+        """
+        Initialize the ledger.
+
+        Args:
+            batch_size (int, optional): The number of unsettled entries that triggers a settlement. Defaults to 1024.
+        """
+        assert batch_size > 0, "Batch size must be positive."
+        self.batch_size = batch_size
+
+        # Account index -> handle of the account's money item
+        self.accounts: list[ItemHandle] = []
+        # Account key (e.g. the agent's JID) -> account index
+        self.account_index: dict[str, int] = {}
+        # Account index -> balance the account should have: its opening balance and its settled entries
+        self.balances = array("d")
+
+        # Entries, one column per field
+        self.payers = array("q")
+        self.payees = array("q")
+        self.amounts = array("d")
+        # Number of entries already applied to the inventories
+        self.settled = 0
+        # Account index -> net change of the unsettled entries
+        self.pending: dict[int, float] = {}
+
+        self.total_recorded = 0.0
+        self.total_settled = 0.0
+
+    def open_account(self, key: str, handle: ItemHandle) -> int:
+        """
+        Open an account for an agent.
+
+        Args:
+            key (str): The key of the account, e.g. the agent's JID.
+            handle (ItemHandle): The handle of the agent's money item.
+
+        Returns:
+            int: The index of the account.
+        """
+        assert key not in self.account_index, f"Account {key} already exists"
+        self.accounts.append(handle)
+        self.balances.append(handle.quantity)
+        self.account_index.update({key: len(self.accounts) - 1})
+        return len(self.accounts) - 1
+
+    def rebind_account(self, key: str, handle: ItemHandle):
+        """
+        Bind an account to a new money item, e.g. after its item was removed from the inventory.
+        Money the new item holds beyond the account's balance shows up in the audit.
+
+        Args:
+            key (str): The key of the account.
+            handle (ItemHandle): The handle of the agent's money item.
+        """
+        self.accounts[self.account_index[key]] = handle
+
+    def _get_handle(self, index: int) -> ItemHandle | None:
+        """
+        Get the handle of an account's money item, bound again if the item was removed and added back.
+
+        Args:
+            index (int): The index of the account.
+
+        Returns:
+            ItemHandle | None: The handle, or None if the item is no longer in its inventory.
+        """
+        handle = self.accounts[index]
+        if not handle.valid and handle.inventory.has_item(handle.item):
+            handle = handle.inventory.get_handle(handle.item)
+            self.accounts[index] = handle
+        return handle if handle.valid else None
+
+    def has_account(self, key: str) -> bool:
+        """
+        Check if an account exists.
+
+        Args:
+            key (str): The key of the account.
+
+        Returns:
+            bool: True if the account exists, False otherwise.
+        """
+        return key in self.account_index
+
+    def get_balance(self, key: str) -> int | float:
+        """
+        Get the settled balance of an account.
+
+        Args:
+            key (str): The key of the account.
+
+        Returns:
+            int | float: The quantity of the account's money item.
+        """
+        return self.accounts[self.account_index[key]].quantity
+
+    def get_available_balance(self, key: str) -> int | float:
+        """
+        Get the balance of an account including its unsettled entries.
+
+        Args:
+            key (str): The key of the account.
+
+        Returns:
+            int | float: The balance the account will have once everything is settled.
+        """
+        index = self.account_index[key]
+        return self.accounts[index].quantity + self.pending.get(index, 0)
+
+    def record(self, payer: str, payee: str, amount: int | float) -> int:
+        """
+        Record a transfer. The transfer is applied with the next settlement, which happens
+        automatically once batch_size entries are waiting.
+
+        Args:
+            payer (str): The key of the paying account.
+            payee (str): The key of the paid account.
+            amount (int | float): The transferred amount.
+
+        Returns:
+            int: The index of the entry.
+
+        Raises:
+            ValueError: If the amount is negative or the payer cannot afford it.
+            SettlementError: If the automatic settlement fails; the entry stays recorded and unsettled.
+        """
+        if amount < 0:
+            raise ValueError(f"Amount must not be negative, got {amount}")
+        if self.get_available_balance(payer) < amount:
+            raise ValueError(f"Insufficient funds in account {payer}")
+        payer_index = self.account_index[payer]
+        payee_index = self.account_index[payee]
+
+        self.payers.append(payer_index)
+        self.payees.append(payee_index)
+        self.amounts.append(amount)
+        self.pending.update({payer_index: self.pending.get(payer_index, 0) - amount})
+        self.pending.update({payee_index: self.pending.get(payee_index, 0) + amount})
+        self.total_recorded += amount
+
+        if len(self.amounts) - self.settled >= self.batch_size:
+            self.settle()
+        return len(self.amounts) - 1
+
+    def settle(self) -> int:
+        """
+        Apply all unsettled entries to the accounts' inventories.
+
+        Returns:
+            int: The number of settled entries.
+
+        Raises:
+            SettlementError: If an account's money item is gone or cannot cover its net change, or an
+                inventory fails to apply its changes. Nothing is applied and the entries stay unsettled.
+        """
+        count = len(self.amounts) - self.settled
+        if not count:
+            return 0
+
+        keys = list(self.account_index)
+        changes = {}
+        for index, change in self.pending.items():
+            handle = self._get_handle(index)
+            if handle is None:
+                raise SettlementError(f"Money item of account {keys[index]} is no longer in its inventory")
+            if handle.quantity + change < 0:
+                raise SettlementError(f"Insufficient funds in account {keys[index]} to settle a change of {change}")
+            changes.setdefault(handle.inventory, {}).update({handle.item: change})
+
+        # Enter one transaction per inventory; an error in any of them rolls back all of them
+        try:
+            with ExitStack() as transactions:
+                for inventory, inventory_changes in changes.items():
+                    transactions.enter_context(inventory.transaction())
+                    inventory.apply_quantity_changes(inventory_changes)
+        except Exception as error:
+            raise SettlementError(f"Settlement of {count} transfers failed and was rolled back: {error}") from error
+
+        for index, change in self.pending.items():
+            self.balances[index] += change
+        self.total_settled += math.fsum(self.amounts[self.settled:])
+        self.settled = len(self.amounts)
+        self.pending = {}
+        logger.info(f"[Ledger] Settled {count} transfers")
+        return count
+
+    def get_entries(self, start: int = 0) -> Iterator[tuple[str, str, float]]:
+        """
+        Get the recorded entries.
+
+        Args:
+            start (int, optional): The index of the first entry. Defaults to 0.
+
+        Returns:
+            Iterator[tuple[str, str, float]]: The payer key, payee key and amount of each entry.
+        """
+        keys = list(self.account_index)
+        for index in range(start, len(self.amounts)):
+            yield keys[self.payers[index]], keys[self.payees[index]], self.amounts[index]
+
+    def audit(self) -> dict[str, int | float | bool | dict]:
+        """
+        Audit the ledger against the accounts: every account's money item must hold the balance
+        the ledger expects from its opening balance and settled entries.
+
+        Returns:
+            dict[str, int | float | bool | dict]: The entry counts, the recorded and settled totals, the
+            difference between the accounts' quantities and their expected balances (in total and by
+            account key) and whether money was conserved, i.e. only moved by the ledger.
+        """
+        discrepancies = {}
+        for key, index in self.account_index.items():
+            handle = self._get_handle(index)
+            difference = (handle.quantity if handle is not None else 0) - self.balances[index]
+            if not math.isclose(difference, 0, abs_tol=1e-9):
+                discrepancies.update({key: difference})
+        return {
+            "entries": len(self.amounts),
+            "settled entries": self.settled,
+            "recorded": self.total_recorded,
+            "settled": self.total_settled,
+            "imbalance": math.fsum(discrepancies.values()),
+            "discrepancies": discrepancies,
+            "conserved": not discrepancies,
+        }
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def __str__(self):
+        return f"SettlementLedger({len(self.accounts)} accounts, {len(self.amounts)} entries, {len(self.amounts) - self.settled} unsettled)"
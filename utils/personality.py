@@ -1,9 +1,11 @@
 import numpy as np
 
+from utils.random_streams import defaultRandomStreams
 
-import numpy as np
 
 class PersonalityProfile:
+    __slots__ = ("_scores", "_storage", "_canonical", "_matrices", "version")
+
     # Define the facets for each of the five factors
     facets = {
         'Openness': ['Fantasy', 'Aesthetics', 'Feelings', 'Actions', 'Ideas', 'Values'],
@@ -30,9 +32,130 @@ class PersonalityProfile:
             scores = np.zeros(30)  # 5 factors * 6 facets each
         else:
             assert len(scores) == 30, "Scores must be a list or array of length 30."
-            scores = np.array(scores)
+            scores = np.array(scores, dtype=np.float64)
+
+        self._scores = scores
+        # Population matrix and row holding the scores instead of _scores, if the profile is a view
+        self._storage = None
+        # Interned profile whose (read-only) scores this profile shares until it is changed
+        self._canonical = None
+        # Population matrices holding a row of this profile, as (matrix, row) pairs
+        self._matrices = None
+        # Incremented whenever the scores change, so cached results derived from them can be invalidated
+        self.version = 0
+
+    @property
+    def scores(self) -> np.ndarray:
+        """
+        The scores of all facets, read-only: they are changed through the setters, which keep the
+        version and the population matrices up to date. For a view into a floating point population
+        matrix this is the matrix row itself; for a quantized matrix it is a dequantized copy.
+        """
+        return self._read(slice(None))
+
+    @scores.setter
+    def scores(self, scores: list):
+        self._write(slice(None), scores)
+
+    def _bind(self, matrix, row: int):
+        """
+        Turn the profile into a view of a population matrix row, which from now on holds its scores.
+
+        Args:
+            matrix (PopulationPersonalityMatrix): The matrix, whose row already holds the scores.
+            row (int): The row of the profile in the matrix.
+        """
+        self._storage = (matrix, row)
+        self._scores = None
+        self._canonical = None
+
+    def _share(self, canonical):
+        """
+        Share the scores of an interned profile until the scores are changed (copy-on-write).
+
+        Args:
+            canonical (PersonalityProfile): The interned profile.
+        """
+        self._scores = canonical._scores
+        self._storage = None
+        self._canonical = canonical
+
+    def _read(self, index: int | slice) -> float | np.ndarray:
+        """
+        Read one score or a range of scores.
+
+        Args:
+            index (int | slice): The facet index or range.
+
+        Returns:
+            float | np.ndarray: The score(s), read-only.
+        """
+        if self._storage is not None:
+            matrix, row = self._storage
+            return matrix.read(row, index)
+        scores = self._scores[index]
+        if isinstance(scores, np.ndarray):
+            scores.flags.writeable = False
+        return scores
+
+    def _write(self, index: int | slice, scores: float | list):
+        """
+        Write one score or a range of scores in place and notify the dependants.
+
+        Args:
+            index (int | slice): The facet index or range.
+            scores (float | list): The score(s).
+        """
+        if self._canonical is not None:
+            # Stop sharing the interned scores (and their matrix rows) before changing them
+            self._scores = self._scores.copy()
+            self._canonical = None
+            if self._matrices:
+                self._matrices = [(matrix, matrix._detach(self)) for matrix, _ in self._matrices]
+        if self._storage is None:
+            self._scores[index] = scores
+        else:
+            matrix, row = self._storage
+            matrix.write(row, index, scores)
+        self._changed()
+
+    def _watch(self, matrix, row: int):
+        """
+        Register a population matrix row to be updated whenever the scores change.
 
-        self.scores = scores
+        Args:
+            matrix (PopulationPersonalityMatrix): The matrix.
+            row (int): The row of the profile in the matrix.
+        """
+        if self._matrices is None:
+            self._matrices = []
+        self._matrices.append((matrix, row))
+
+    def _changed(self):
+        """
+        Bump the version and write the scores through to the population matrices holding the profile.
+        """
+        self.version += 1
+        if self._matrices:
+            for matrix, row in self._matrices:
+                matrix.update_row(row, self.scores)
+
+    @property
+    def canonical(self):
+        """
+        The profile identifying the scores: the interned profile whose scores are shared, or the
+        profile itself. Profiles with the same canonical profile have the same scores.
+        """
+        return self._canonical if self._canonical is not None else self
+
+    def content_key(self) -> bytes:
+        """
+        Get a key identifying the scores by content, e.g. for deduplicating identical profiles.
+
+        Returns:
+            bytes: The scores as float64 bytes.
+        """
+        return np.asarray(self.scores, dtype=np.float64).tobytes()
 
     def get_facet_score(self, facet: str) -> float:
         """
@@ -45,7 +168,7 @@ class PersonalityProfile:
             float: The score for the facet.
         """
         assert facet in self.facet_to_index, "Facet not found."
-        return self.scores[self.facet_to_index.get(facet)]
+        return self._read(self.facet_to_index.get(facet))
 
     def set_facet_score(self, facet: str, score: float):
         """
@@ -56,7 +179,7 @@ class PersonalityProfile:
             score (float): The score to set for the facet.
         """
         assert 0 <= score <= 1, "Score must be between -1 and 1."
-        self.scores[self.facet_to_index.get(facet)] = score
+        self._write(self.facet_to_index.get(facet), score)
 
     def get_factor_scores(self, factor: str) -> np.ndarray:
         """
@@ -71,7 +194,7 @@ class PersonalityProfile:
         assert factor in self.facets, "Factor not found."
         start_index = list(self.facets.keys()).index(factor) * 6
         end_index = start_index + 6
-        return self.scores[start_index:end_index]
+        return self._read(slice(start_index, end_index))
 
     def set_factor_scores(self, factor: str, scores: list):
         """
@@ -85,7 +208,7 @@ class PersonalityProfile:
         assert len(scores) == 6, "Scores must be a list or array of length 6."
         start_index = list(self.facets.keys()).index(factor) * 6
         end_index = start_index + 6
-        self.scores[start_index:end_index] = scores
+        self._write(slice(start_index, end_index), scores)
 
     def get_personality_vector(self) -> np.ndarray:
         """
@@ -104,10 +227,28 @@ class PersonalityProfile:
             scores (list): A list of scores for all facets.
         """
         assert len(scores) == 30, "Scores must be a list or array of length 30."
-        self.scores = np.array(scores)
+        self._write(slice(None), scores)
+
+    def generate_random_personality_vector(self, random=None):
+        """
+        Set uniformly random scores.
+
+        Args:
+            random (RandomStream, optional): The stream the scores are drawn from. Defaults to the "personality profiles" stream of defaultRandomStreams.
+        """
+        random = random if random is not None else defaultRandomStreams.get_stream("personality profiles")
+        self._write(slice(None), random.random_batch(30))
+
+    def __getstate__(self):
+        # Matrix rows belong to the population holding this object, not to its copies (which own their scores)
+        return {"scores": np.array(self.scores)}
 
-    def generate_random_personality_vector(self):
-        self.scores = np.random.rand(30)
+    def __setstate__(self, state):
+        self._scores = state["scores"]
+        self._storage = None
+        self._canonical = None
+        self._matrices = None
+        self.version = 0
 
     def __str__(self):
         return str(self.scores)
@@ -117,13 +258,67 @@ class PersonalityProfile:
 
     def __eq__(self, other):
         if isinstance(other, PersonalityProfile):
-            return np.array_equal(self.scores, other.scores)
+            return self.content_key() == other.content_key()
         return False
 
+    def __hash__(self):
+        # Consistent with __eq__, so the hash changes with the scores: a profile must not change
+        # while it is a set member or dict key (population matrices key their rows by id instead)
+        return hash(self.content_key())
+
     def __ne__(self, other):
         return not self.__eq__(other)
 
 
+class ProfileInterner:
+    """
+    A flyweight pool of personality profiles. Interning a profile returns a new profile sharing
+    the read-only scores of the single pooled copy with identical scores, so homogeneous
+    populations store each distinct personality once; a profile copies its scores on its first
+    change, so changes never leak to the other profiles.
+    """
+    def __init__(self):
+        # Content key -> pooled profile (never handed out, so its scores never change)
+        self.canonicals: dict[bytes, PersonalityProfile] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def intern(self, profile: PersonalityProfile) -> PersonalityProfile:
+        """
+        Get a profile sharing the pooled scores identical to a profile's scores.
+
+        Args:
+            profile (PersonalityProfile): The profile.
+
+        Returns:
+            PersonalityProfile: A new profile with the same scores.
+        """
+        key = profile.content_key()
+        canonical = self.canonicals.get(key)
+        if canonical is None:
+            self.misses += 1
+            canonical = PersonalityProfile(profile.get_personality_vector())
+            canonical._scores.setflags(write=False)
+            self.canonicals.update({key: canonical})
+        else:
+            self.hits += 1
+        interned = PersonalityProfile.__new__(PersonalityProfile)
+        interned._matrices = None
+        interned.version = 0
+        interned._share(canonical)
+        return interned
+
+    def __len__(self):
+        return len(self.canonicals)
+
+    def __str__(self):
+        return f"ProfileInterner({len(self.canonicals)} profiles, {self.hits} hits, {self.misses} misses)"
+
+
+# Pool shared by all agents
+defaultProfileInterner = ProfileInterner()
+
+
 class Personality:
     def __init__(self, age: int=27, gender: float=0, personality_scores: list=None, personality: dict[str, int | float | list] = None):
         """
@@ -192,8 +387,8 @@ class Personality:
         """
         self.personality_descriptor.get("personality profile").set_personality_vector(scores)
 
-    def generate_random_personality_vector(self):
-        self.personality_descriptor.get("personality profile").generate_random_personality_vector()
+    def generate_random_personality_vector(self, random=None):
+        self.personality_descriptor.get("personality profile").generate_random_personality_vector(random)
 
     def __str__(self):
         return str(self.personality_descriptor)
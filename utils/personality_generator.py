@@ -0,0 +1,149 @@
+import numpy as np
+
+from utils.personality import PersonalityProfile
+from utils.personality_matrix import DTYPES, QUANTIZATION_LEVELS
+import utils.personality_profiles as personality_profiles
+
+
+def facet_covariance(spread: float = 0.1, factor_correlation: float = 0.5) -> np.ndarray:
+    """
+    Build a facet covariance matrix in which the facets of the same factor are correlated.
+
+    Args:
+        spread (float, optional): The standard deviation of every facet. Defaults to 0.1.
+        factor_correlation (float, optional): The correlation between facets of the same factor. Defaults to 0.5.
+
+    Returns:
+        np.ndarray: The covariance matrix (30 x 30).
+    """
+    assert spread >= 0, "Spread must not be negative."
+    assert 0 <= factor_correlation < 1, "Factor correlation must be between 0 and 1."
+    correlation = np.kron(np.eye(5), np.full((6, 6), factor_correlation))
+    np.fill_diagonal(correlation, 1.0)
+    return correlation * spread ** 2
+
+
+class PopulationGenerator:
+    """
+    A generator of personality populations, drawing many profiles per vectorized call from one
+    of three distributions:
+        uniform: independent uniform scores (like PersonalityProfile.generate_random_personality_vector)
+        normal: scores around per-facet means with a facet covariance
+        mixture: scores around a weighted mixture of profiles (e.g. those in utils.personality_profiles)
+    Scores are clipped to [0, 1].
+    """
+    def __init__(
+        self,
+        means: list = None,
+        covariance: np.ndarray = None,
+        mixture: dict[str, float] | list[tuple[PersonalityProfile, float]] = None,
+        seed: int = None,
+    ):
+        """
+        Initialize the generator. Without means or a mixture the scores are uniform.
+
+        Args:
+            means (list, optional): The mean score of each facet. Defaults to None.
+            covariance (np.ndarray, optional): The facet covariance (30 x 30). Defaults to facet_covariance().
+            mixture (dict[str, float] | list[tuple[PersonalityProfile, float]], optional): The weight of each
+                profile the scores are drawn around, by name of a profile in utils.personality_profiles
+                or as (profile, weight) pairs. Defaults to None.
+            seed (int, optional): The seed of the random generator. Defaults to None.
+        """
+        assert means is None or mixture is None, "Means and a mixture cannot be combined."
+        self.rng = np.random.default_rng(seed)
+
+        self.centers = None
+        self.weights = None
+        if means is not None:
+            assert len(means) == 30, "Means must be a list or array of length 30."
+            self.centers = np.array([means], dtype=np.float64)
+            self.weights = np.ones(1)
+        elif mixture is not None:
+            assert mixture, "Mixture must not be empty."
+            components = list(mixture.items()) if isinstance(mixture, dict) else list(mixture)
+            profiles = [getattr(personality_profiles, profile) if isinstance(profile, str) else profile for profile, _ in components]
+            assert all(isinstance(profile, PersonalityProfile) for profile in profiles), "Mixture components must be personality profiles."
+            self.centers = np.array([profile.get_personality_vector() for profile in profiles], dtype=np.float64)
+            weights = np.array([weight for _, weight in components], dtype=np.float64)
+            assert (weights >= 0).all() and weights.sum() > 0, "Mixture weights must be non-negative and not all zero."
+            self.weights = weights / weights.sum()
+
+        covariance = facet_covariance() if covariance is None else np.asarray(covariance, dtype=np.float64)
+        assert covariance.shape == (30, 30), "Covariance must be a 30 x 30 matrix."
+        # Factor L with L L^T = covariance, computed once for all draws (eigendecomposition, so
+        # positive semi-definite covariances work as well)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        self.factor = eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+
+    def generate(self, count: int) -> np.ndarray:
+        """
+        Draw personality vectors.
+
+        Args:
+            count (int): The number of vectors.
+
+        Returns:
+            np.ndarray: The vectors, one row per profile (count x 30).
+        """
+        assert count >= 0, "Count must not be negative."
+        if self.centers is None:
+            return self.rng.random((count, 30))
+        if len(self.centers) == 1:
+            scores = np.broadcast_to(self.centers[0], (count, 30)).copy()
+        else:
+            scores = self.centers[self.rng.choice(len(self.centers), size=count, p=self.weights)]
+        scores += self.rng.standard_normal((count, 30)) @ self.factor.T
+        return np.clip(scores, 0, 1, out=scores)
+
+    def generate_profiles(self, count: int) -> list[PersonalityProfile]:
+        """
+        Draw personality profiles.
+
+        Args:
+            count (int): The number of profiles.
+
+        Returns:
+            list[PersonalityProfile]: The profiles.
+        """
+        return [PersonalityProfile(scores) for scores in self.generate(count)]
+
+    def generate_to_file(self, path: str, count: int, chunk_size: int = 65536, dtype: type = np.float32) -> np.memmap:
+        """
+        Draw personality vectors into a .npy file, one chunk at a time, so populations larger than
+        the memory can be generated.
+
+        Args:
+            path (str): The path of the file.
+            count (int): The number of vectors.
+            chunk_size (int, optional): The number of vectors drawn at once. Defaults to 65536.
+            dtype (type, optional): The storage type (np.float64, np.float32 or np.uint8, quantized to 256 levels). Defaults to np.float32.
+
+        Returns:
+            np.memmap: The written vectors, memory-mapped read-only.
+        """
+        assert chunk_size > 0, "Chunk size must be positive."
+        assert dtype in DTYPES, "Storage type must be np.float64, np.float32 or np.uint8."
+        vectors = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(count, 30))
+        for start in range(0, count, chunk_size):
+            chunk = self.generate(min(chunk_size, count - start))
+            if dtype == np.uint8:
+                chunk = np.rint(chunk * QUANTIZATION_LEVELS)
+            vectors[start:start + len(chunk)] = chunk
+        vectors.flush()
+        del vectors
+        return load_population(path)
+
+
+def load_population(path: str) -> np.memmap:
+    """
+    Load personality vectors written by PopulationGenerator.generate_to_file without reading them
+    into memory.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        np.memmap: The vectors, memory-mapped read-only (uint8 files hold scores quantized to 256 levels).
+    """
+    return np.load(path, mmap_mode="r")
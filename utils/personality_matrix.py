@@ -0,0 +1,456 @@
+from collections.abc import Iterator
+
+import numpy as np
+
+from utils.personality import PersonalityProfile
+
+
+# Largest distance between two personality vectors with facet scores in [0, 1]
+MAX_DISTANCE = np.sqrt(30)
+# Storage types of population matrices; uint8 scores are quantized to 256 levels in [0, 1]
+DTYPES = (np.float64, np.float32, np.uint8)
+QUANTIZATION_LEVELS = 255
+
+
+def compatibility_matrix(agent_vectors: np.ndarray, technique_vectors: np.ndarray) -> np.ndarray:
+    """
+    Calculate the compatibility of every agent with every technique in one pass, as
+    1 - distance / sqrt(30), with the squared distances expanded to |a|^2 + |t|^2 - 2 a.t so the
+    bulk of the work is a single matrix product. Agents without a personality (all scores zero)
+    are not compatible with any technique.
+
+    Args:
+        agent_vectors (np.ndarray): The personality vectors of the agents (N x 30).
+        technique_vectors (np.ndarray): The personality vectors of the techniques (T x 30).
+
+    Returns:
+        np.ndarray: The compatibility of each agent (row) with each technique (column), N x T.
+    """
+    agent_norms = np.einsum("ij,ij->i", agent_vectors, agent_vectors)
+    technique_norms = np.einsum("ij,ij->i", technique_vectors, technique_vectors)
+    distances = agent_norms[:, None] + technique_norms[None, :] - 2 * (agent_vectors @ technique_vectors.T)
+    # Rounding can make the squared distance of (nearly) equal vectors slightly negative
+    np.maximum(distances, 0, out=distances)
+    compatibilities = 1 - np.sqrt(distances) / MAX_DISTANCE
+    compatibilities[~agent_vectors.any(axis=1)] = 0.0
+    return compatibilities
+
+
+class PopulationPersonalityMatrix:
+    """
+    The personality vectors of a population of profiles, one row per profile, kept in a single
+    matrix so population-wide calculations become matrix operations. Registered profiles write
+    their changes through to their row; profiles shared by several agents share a row.
+
+    With views enabled, registered profiles become views of their row instead of keeping a copy
+    of their scores, and the matrix can store the scores as float32 or as uint8 quantized to 256
+    levels, taking a half or an eighth of the memory of float64 scores.
+    """
+    def __init__(self, capacity: int = 1024, dtype: type = np.float64, views: bool = False):
+        """
+        Initialize the matrix.
+
+        Args:
+            capacity (int, optional): The initial number of rows. Defaults to 1024.
+            dtype (type, optional): The storage type of the scores (np.float64, np.float32 or np.uint8). Defaults to np.float64.
+            views (bool, optional): Whether registered profiles become views of their rows. Defaults to False.
+        """
+        assert dtype in DTYPES, "Storage type must be np.float64, np.float32 or np.uint8."
+        self.dtype = dtype
+        self.quantized = dtype == np.uint8
+        # Factor turning stored values into scores
+        self.scale = 1 / QUANTIZATION_LEVELS if self.quantized else 1.0
+        self.views = views
+        self.capacity = max(1, capacity)
+        self.size = 0
+        self.matrix = np.zeros((self.capacity, 30), dtype=dtype)
+        self.profiles: list[PersonalityProfile] = []
+        # id of the profile -> row (profile hashes follow their scores, which change)
+        self.rows: dict[int, int] = {}
+        # Interned profiles sharing the row of their pooled profile, kept so their ids stay unique
+        self.sharing: dict[int, PersonalityProfile] = {}
+        # Incremented whenever a row is added or changed
+        self.version = 0
+        # Version of the last change of each row, so dependent calculations can update only the changed rows
+        self.row_versions = np.zeros(self.capacity, dtype=np.int64)
+
+    def _grow(self):
+        """
+        Double the capacity of the matrix.
+        """
+        self.capacity *= 2
+        matrix = np.zeros((self.capacity, 30), dtype=self.dtype)
+        matrix[:self.size] = self.matrix[:self.size]
+        self.matrix = matrix
+        row_versions = np.zeros(self.capacity, dtype=np.int64)
+        row_versions[:self.size] = self.row_versions[:self.size]
+        self.row_versions = row_versions
+
+    def _add_row(self, profile: PersonalityProfile) -> int:
+        """
+        Add a row holding the scores of a profile.
+
+        Args:
+            profile (PersonalityProfile): The profile.
+
+        Returns:
+            int: The row.
+        """
+        if self.size == self.capacity:
+            self._grow()
+        row = self.size
+        self.size += 1
+        self.profiles.append(profile)
+        self.rows.update({id(profile): row})
+        self.update_row(row, profile.get_personality_vector())
+        return row
+
+    def register(self, profile: PersonalityProfile, view: bool = None) -> int:
+        """
+        Register a profile as a new row, unless it is already registered. Interned profiles share
+        the row of their pooled profile until they are changed.
+
+        Args:
+            profile (PersonalityProfile): The profile.
+            view (bool, optional): Whether the profile becomes a view of its row; profiles that
+                already are views of another matrix, and interned profiles, keep a copy instead.
+                Defaults to the matrix's setting.
+
+        Returns:
+            int: The row of the profile.
+        """
+        row = self.rows.get(id(profile))
+        if row is not None:
+            return row
+        canonical = profile._canonical
+        if canonical is not None:
+            row = self.rows.get(id(canonical))
+            if row is None:
+                row = self._add_row(canonical)
+            self.rows.update({id(profile): row})
+            self.sharing.update({id(profile): profile})
+            profile._watch(self, row)
+            return row
+        row = self._add_row(profile)
+        if (self.views if view is None else view) and profile._storage is None:
+            profile._bind(self, row)
+        else:
+            profile._watch(self, row)
+        return row
+
+    def _detach(self, profile: PersonalityProfile) -> int:
+        """
+        Move an interned profile that stops sharing its pooled scores onto a row of its own.
+
+        Args:
+            profile (PersonalityProfile): The profile.
+
+        Returns:
+            int: The new row of the profile.
+        """
+        self.sharing.pop(id(profile))
+        return self._add_row(profile)
+
+    def get_row(self, profile: PersonalityProfile) -> int | None:
+        """
+        Get the row of a profile.
+
+        Args:
+            profile (PersonalityProfile): The profile.
+
+        Returns:
+            int | None: The row, or None if the profile is not registered.
+        """
+        return self.rows.get(id(profile))
+
+    def update_row(self, row: int, scores: np.ndarray):
+        """
+        Write the scores of a profile to its row.
+
+        Args:
+            row (int): The row.
+            scores (np.ndarray): The personality vector of the profile.
+        """
+        self.write(row, slice(None), scores)
+
+    def write(self, row: int, index: int | slice, scores: float | list):
+        """
+        Write one score or a range of scores of a row, quantizing them if needed.
+
+        Args:
+            row (int): The row.
+            index (int | slice): The facet index or range.
+            scores (float | list): The score(s).
+        """
+        if self.quantized:
+            scores = np.rint(np.clip(scores, 0, 1) * QUANTIZATION_LEVELS)
+        self.matrix[row, index] = scores
+        self.version += 1
+        self.row_versions[row] = self.version
+
+    def read(self, row: int, index: int | slice) -> float | np.ndarray:
+        """
+        Read one score or a range of scores of a row.
+
+        Args:
+            row (int): The row.
+            index (int | slice): The facet index or range.
+
+        Returns:
+            float | np.ndarray: The score(s), read-only; a range of a floating point matrix is a view.
+        """
+        scores = self.matrix[row, index] * self.scale if self.quantized else self.matrix[row, index]
+        if isinstance(scores, np.ndarray):
+            # Scores are changed through write, which keeps the row versions up to date
+            scores.flags.writeable = False
+        return scores
+
+    def get_vector(self, row: int) -> np.ndarray:
+        """
+        Get the scores of a row.
+
+        Args:
+            row (int): The row.
+
+        Returns:
+            np.ndarray: The scores, read-only; the row itself for a floating point matrix, a dequantized copy otherwise.
+        """
+        return self.read(row, slice(None))
+
+    def get_changed_rows(self, version: int) -> np.ndarray:
+        """
+        Get the rows added or changed since a version of the matrix.
+
+        Args:
+            version (int): The version.
+
+        Returns:
+            np.ndarray: The rows, in ascending order.
+        """
+        return np.flatnonzero(self.row_versions[:self.size] > version)
+
+    def get_vectors(self, rows: slice | np.ndarray = None) -> np.ndarray:
+        """
+        Get the personality vectors of some rows, dequantizing only those.
+
+        Args:
+            rows (slice | np.ndarray, optional): The rows. Defaults to None (all registered profiles).
+
+        Returns:
+            np.ndarray: The vectors (a view for a floating point matrix and a slice of rows, a float32 copy for a quantized matrix).
+        """
+        vectors = self.matrix[:self.size] if rows is None else self.matrix[:self.size][rows]
+        if self.quantized:
+            return vectors.astype(np.float32) * np.float32(self.scale)
+        return vectors
+
+    def sync(self):
+        """
+        Rewrite all rows from their profiles, e.g. after scores were changed in place.
+        """
+        for row, profile in enumerate(self.profiles):
+            self.update_row(row, profile.get_personality_vector())
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """
+        Get the personality vectors of all registered profiles (a view for a floating point matrix,
+        a dequantized float32 copy for a quantized one).
+
+        Returns:
+            np.ndarray: The vectors, one row per profile.
+        """
+        return self.get_vectors()
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Get the memory used by the stored scores.
+
+        Returns:
+            int: The number of bytes of the matrix.
+        """
+        return self.matrix.nbytes
+
+    def __len__(self):
+        return self.size
+
+    def __str__(self):
+        return f"PopulationPersonalityMatrix({self.size} profiles, {np.dtype(self.dtype).name})"
+
+
+class PersonalityIndex:
+    """
+    A nearest-neighbour index over the personality vectors of a population matrix, answering
+    top-k and radius queries by Euclidean distance (the distance compatibility is derived from).
+
+    Tree indexes degrade to a full scan at 30 dimensions, so queries scan the matrix in blocks,
+    each a single matrix product against cached squared norms, keeping only the best candidates
+    of each block with a partial sort. Profiles registered with the matrix (also after the index
+    was created) are indexed immediately.
+    """
+    def __init__(self, population: PopulationPersonalityMatrix, block_size: int = 65536):
+        """
+        Initialize the index.
+
+        Args:
+            population (PopulationPersonalityMatrix): The indexed population.
+            block_size (int, optional): The number of rows scanned at once. Defaults to 65536.
+        """
+        assert block_size > 0, "Block size must be positive."
+        self.population = population
+        self.block_size = block_size
+        # Squared norms of the rows (with spare rows for new profiles) and the population version they are up to date with
+        self.norms = np.zeros(0)
+        self.norms_version = None
+
+    def add(self, profile: PersonalityProfile) -> int:
+        """
+        Add a profile to the index (and to its population).
+
+        Args:
+            profile (PersonalityProfile): The profile.
+
+        Returns:
+            int: The row of the profile.
+        """
+        return self.population.register(profile)
+
+    def _get_norms(self) -> np.ndarray:
+        """
+        Get the squared norms of all rows, recomputing those of the rows added or changed since
+        they were last computed.
+
+        Returns:
+            np.ndarray: The squared norm of each row.
+        """
+        population = self.population
+        if self.norms_version != population.version:
+            if population.size > len(self.norms):
+                norms = np.zeros(population.capacity)
+                norms[:len(self.norms)] = self.norms
+                self.norms = norms
+            rows = population.get_changed_rows(self.norms_version) if self.norms_version is not None else np.arange(population.size)
+            if len(rows):
+                vectors = population.get_vectors(rows)
+                self.norms[rows] = np.einsum("ij,ij->i", vectors, vectors, dtype=np.float64)
+            self.norms_version = population.version
+        return self.norms[:population.size]
+
+    def _as_queries(self, queries) -> np.ndarray:
+        """
+        Turn profiles or vectors into a matrix of query vectors.
+
+        Args:
+            queries: A profile, a vector, a list of profiles or a matrix of vectors.
+
+        Returns:
+            np.ndarray: The query vectors, one row per query.
+        """
+        if isinstance(queries, PersonalityProfile):
+            queries = [queries]
+        if isinstance(queries, list) and queries and isinstance(queries[0], PersonalityProfile):
+            queries = [profile.get_personality_vector() for profile in queries]
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float64))
+        assert queries.shape[1] == 30, "Queries must have 30 scores."
+        return queries
+
+    def _blocks(self, queries: np.ndarray) -> Iterator[tuple[int, np.ndarray]]:
+        """
+        Scan the population in blocks, dequantizing one block at a time for a quantized matrix.
+
+        Args:
+            queries (np.ndarray): The query vectors.
+
+        Returns:
+            Iterator[tuple[int, np.ndarray]]: The first row of each block and the squared distances of the queries to its rows.
+        """
+        norms = self._get_norms()
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        for start in range(0, len(norms), self.block_size):
+            block = self.population.get_vectors(slice(start, start + self.block_size))
+            distances = query_norms[:, None] + norms[None, start:start + len(block)] - 2 * (queries @ block.T)
+            np.maximum(distances, 0, out=distances)
+            yield start, distances
+
+    def query_batch(self, queries, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest profiles of several queries.
+
+        Args:
+            queries: A list of profiles or a matrix of vectors (one per row).
+            k (int, optional): The number of neighbours. Defaults to 1.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The rows and distances of the neighbours of each query
+            (Q x k, nearest first; fewer columns if the population is smaller than k).
+        """
+        assert k > 0, "k must be positive."
+        queries = self._as_queries(queries)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        best_distances = np.zeros((len(queries), 0))
+        for start, distances in self._blocks(queries):
+            rows = np.broadcast_to(np.arange(start, start + distances.shape[1]), distances.shape)
+            candidate_rows = np.concatenate((best_rows, rows), axis=1)
+            candidate_distances = np.concatenate((best_distances, distances), axis=1)
+            if candidate_distances.shape[1] > k:
+                kept = np.argpartition(candidate_distances, k - 1, axis=1)[:, :k]
+                candidate_rows = np.take_along_axis(candidate_rows, kept, axis=1)
+                candidate_distances = np.take_along_axis(candidate_distances, kept, axis=1)
+            best_rows, best_distances = candidate_rows, candidate_distances
+        order = np.argsort(best_distances, axis=1, kind="stable")
+        return np.take_along_axis(best_rows, order, axis=1), np.sqrt(np.take_along_axis(best_distances, order, axis=1))
+
+    def query(self, query, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest profiles of a profile or vector (which may itself be in the index).
+
+        Args:
+            query: The profile or vector.
+            k (int, optional): The number of neighbours. Defaults to 1.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The rows and distances of the neighbours, nearest first.
+        """
+        rows, distances = self.query_batch(query, k)
+        return rows[0], distances[0]
+
+    def query_radius(self, query, radius: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find all profiles within a distance of a profile or vector.
+
+        Args:
+            query: The profile or vector.
+            radius (float): The largest distance.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The rows and distances of the profiles, nearest first.
+        """
+        assert radius >= 0, "Radius must not be negative."
+        found_rows, found_distances = [], []
+        for start, distances in self._blocks(self._as_queries(query)):
+            within = np.flatnonzero(distances[0] <= radius ** 2)
+            found_rows.append(within + start)
+            found_distances.append(distances[0, within])
+        rows = np.concatenate(found_rows) if found_rows else np.zeros(0, dtype=np.int64)
+        distances = np.concatenate(found_distances) if found_distances else np.zeros(0)
+        order = np.argsort(distances, kind="stable")
+        return rows[order], np.sqrt(distances[order])
+
+    def get_profiles(self, rows: np.ndarray) -> list[PersonalityProfile]:
+        """
+        Get the profiles of rows returned by a query.
+
+        Args:
+            rows (np.ndarray): The rows.
+
+        Returns:
+            list[PersonalityProfile]: The profiles.
+        """
+        return [self.population.profiles[row] for row in rows]
+
+    def __len__(self):
+        return len(self.population)
+
+    def __str__(self):
+        return f"PersonalityIndex({len(self.population)} profiles, blocks of {self.block_size})"
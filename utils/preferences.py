@@ -0,0 +1,83 @@
+from utils.personality import PersonalityProfile
+from utils.random_streams import RandomStream
+
+
+# Facets the consumer's offer preferences are derived from, by weight
+PREFERENCE_FACETS = {
+    "price": "Self-Discipline",          # price sensitivity (Conscientiousness)
+    "duration": "Dutifulness",           # quality focus (Conscientiousness)
+    "awards": "Values",                  # badge appreciation (Openness)
+    "risk": "Excitement seeking",        # risk tolerance (Extraversion)
+}
+
+
+class ConsumerPreferences:
+    """
+    A consumer's personality compiled into the weights of its offer valuation, so valuing an offer
+    is a handful of multiplications independent of the personality API. Lower values are better:
+        value = price * price weight + duration * duration weight + awards * awards weight
+                + uniform(-1, 1) * risk weight
+    """
+    __slots__ = ("profile", "version", "factors", "price", "duration", "awards", "risk", "stream")
+
+    def __init__(self, profile: PersonalityProfile, stream: RandomStream):
+        """
+        Compile the preferences of a personality profile.
+
+        Args:
+            profile (PersonalityProfile): The consumer's personality profile.
+            stream (RandomStream): The consumer's random stream.
+        """
+        self.profile = profile
+        self.stream = stream
+        self.version = profile.version
+        # Personality factors (price sensitivity, quality focus, badge appreciation, risk tolerance)
+        self.factors = {weight: float(profile.get_facet_score(facet)) for weight, facet in PREFERENCE_FACETS.items()}
+
+        # Higher price sensitivity means price matters more
+        self.price = 0.5 + self.factors.get("price") * 0.5
+        # Higher quality focus means duration matters more - longer is better quality
+        self.duration = -self.factors.get("duration") * 0.5
+        # Higher badge appreciation means awards matter more - more is better
+        self.awards = -self.factors.get("awards") * 10
+        # Higher risk tolerance means more variability is acceptable
+        self.risk = self.factors.get("risk") * 5
+
+    def is_current(self, profile: PersonalityProfile) -> bool:
+        """
+        Check if the preferences were compiled from the current state of a profile.
+
+        Args:
+            profile (PersonalityProfile): The consumer's personality profile.
+
+        Returns:
+            bool: True if the profile is the compiled one and has not changed since, False otherwise.
+        """
+        return profile is self.profile and profile.version == self.version
+
+    def value(self, price: float, duration: float, awards: int) -> float:
+        """
+        Value an offer.
+
+        Args:
+            price (float): The price of the offered service.
+            duration (float): The duration of the offered service.
+            awards (int): The number of awards of the provider.
+
+        Returns:
+            float: The value of the offer (lower is better).
+        """
+        return (
+            price * self.price
+            + duration * self.duration
+            + awards * self.awards
+            + (self.stream.random() * 2 - 1) * self.risk
+        )
+
+    def __repr__(self):
+        return (
+            f"ConsumerPreferences(price_sensitivity={self.factors.get('price'):.2f}, "
+            f"quality_focus={self.factors.get('duration'):.2f}, "
+            f"badge_appreciation={self.factors.get('awards'):.2f}, "
+            f"risk_tolerance={self.factors.get('risk'):.2f})"
+        )
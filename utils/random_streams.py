@@ -0,0 +1,181 @@
+import hashlib
+
+import numpy as np
+
+
+class RandomStream:
+    """
+    A stream of random numbers of one agent: a counter-based (Philox) numpy Generator whose uniform
+    draws are pre-drawn in batches, so a single draw is a buffer read. It offers the parts of the
+    random module's interface the agents use, and every method consumes the same sequence of
+    uniform draws, so n calls of random() return the same numbers as one random_batch(n).
+    """
+    __slots__ = ("generator", "buffer_size", "buffer", "position")
+
+    def __init__(self, generator: np.random.Generator, buffer_size: int = 1024):
+        """
+        Initialize the stream.
+
+        Args:
+            generator (np.random.Generator): The generator of the stream.
+            buffer_size (int, optional): The number of uniform numbers drawn at once. Defaults to 1024.
+        """
+        assert buffer_size > 0, "Buffer size must be positive."
+        self.generator = generator
+        self.buffer_size = buffer_size
+        self.buffer = np.empty(0)
+        self.position = 0
+
+    def random_batch(self, count: int) -> np.ndarray:
+        """
+        Draw uniform numbers in [0, 1).
+
+        Args:
+            count (int): The number of draws.
+
+        Returns:
+            np.ndarray: The draws.
+        """
+        available = len(self.buffer) - self.position
+        if count <= available:
+            draws = self.buffer[self.position:self.position + count]
+            self.position += count
+            return draws
+        draws = np.empty(count)
+        draws[:available] = self.buffer[self.position:]
+        missing = count - available
+        # Refill in whole buffers
+        refill = -(-missing // self.buffer_size) * self.buffer_size
+        buffer = self.generator.random(refill)
+        draws[available:] = buffer[:missing]
+        self.buffer = buffer
+        self.position = missing
+        return draws
+
+    def random(self) -> float:
+        """
+        Draw a uniform number in [0, 1).
+
+        Returns:
+            float: The draw.
+        """
+        if self.position == len(self.buffer):
+            self.buffer = self.generator.random(self.buffer_size)
+            self.position = 0
+        draw = self.buffer[self.position]
+        self.position += 1
+        return float(draw)
+
+    def uniform(self, low: float, high: float) -> float:
+        return low + (high - low) * self.random()
+
+    def randint(self, low: int, high: int) -> int:
+        """
+        Draw an integer in [low, high], both included.
+
+        Args:
+            low (int): The lowest integer.
+            high (int): The highest integer.
+
+        Returns:
+            int: The draw.
+        """
+        return low + int(self.random() * (high - low + 1))
+
+    def choice(self, sequence):
+        return sequence[int(self.random() * len(sequence))]
+
+
+class RandomStreams:
+    """
+    The random streams of a run, derived from one seed. The stream of an agent only depends on
+    the seed and the agent's key (e.g. its JID), not on the order agents are created in or draw
+    in, so runs with the same seed are reproducible even though agents run concurrently.
+    """
+    def __init__(self, seed: int = None, buffer_size: int = 1024):
+        """
+        Initialize the streams.
+
+        Args:
+            seed (int, optional): The seed of the run. Defaults to None (fresh entropy, see the seed attribute).
+            buffer_size (int, optional): The number of uniform numbers each stream draws at once. Defaults to 1024.
+        """
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.buffer_size = buffer_size
+        self.streams: dict[str, RandomStream] = {}
+
+    @property
+    def seed(self) -> int:
+        """
+        The seed of the run, to reproduce runs started without one.
+        """
+        return self.seed_sequence.entropy
+
+    def get_stream(self, key: str) -> RandomStream:
+        """
+        Get the stream of a key, creating it on first use.
+
+        Args:
+            key (str): The key, e.g. the JID of an agent.
+
+        Returns:
+            RandomStream: The stream.
+        """
+        key = str(key)
+        stream = self.streams.get(key)
+        if stream is None:
+            digest = hashlib.sha256(key.encode()).digest()
+            spawn_key = tuple(int.from_bytes(digest[index:index + 4], "little") for index in range(0, len(digest), 4))
+            sequence = np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=spawn_key)
+            stream = RandomStream(np.random.Generator(np.random.Philox(sequence)), self.buffer_size)
+            self.streams.update({key: stream})
+        return stream
+
+    def __len__(self):
+        return len(self.streams)
+
+    def __str__(self):
+        return f"RandomStreams(seed={self.seed}, {len(self.streams)} streams)"
+
+
+def get_random(agent=None) -> RandomStream:
+    """
+    Get the random stream of an agent. Agents without one draw from the stream of their JID in
+    defaultRandomStreams.
+
+    Args:
+        agent (optional): The agent.
+
+    Returns:
+        RandomStream: The stream.
+    """
+    stream = getattr(agent, "random", None)
+    return stream if stream is not None else defaultRandomStreams.get_stream(getattr(agent, "jid", None))
+
+
+def random_batch(agents: list, agent_indices: np.ndarray) -> np.ndarray:
+    """
+    Draw a uniform number for each of a batch of proposals from the stream of the agent making it,
+    the same numbers as drawing them one by one in proposal order.
+
+    Args:
+        agents (list): The agents making the proposals.
+        agent_indices (np.ndarray): The index of the agent making each proposal.
+
+    Returns:
+        np.ndarray: The draws.
+    """
+    agent_indices = np.asarray(agent_indices)
+    streams = [get_random(agent) for agent in agents]
+    draws = np.empty(len(agent_indices))
+    # Streams are independent, so each agent's draws can be taken at once
+    order = np.argsort(agent_indices, kind="stable")
+    ordered = agent_indices[order]
+    starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]]) if len(ordered) else np.zeros(0, dtype=np.int64)
+    for start, end in zip(starts, np.r_[starts[1:], len(ordered)]):
+        draws[order[start:end]] = streams[ordered[start]].random_batch(end - start)
+    return draws
+
+
+# Streams of the agents not given any, seeded from fresh entropy
+defaultRandomStreams = RandomStreams()
@@ -1,4 +1,5 @@
 import numpy as np
+from utils.random_streams import defaultRandomStreams
 from utils.service import Service
 from typing import Self
 
@@ -144,10 +145,16 @@ class Recipe:
         return recipe
 
     @classmethod
-    def random(cls, services: list[str]=["A", "B", "C", "D"], min_length: int=1, max_length: int=5):
-        import random
-        recipe_length = random.randint(min_length, max_length)
-        return cls([{"service": Service(random.choice(services)), "done": False, "providers": []} for _ in range(recipe_length)])
+    def random(cls, services: list[str]=["A", "B", "C", "D"], min_length: int=1, max_length: int=5, stream=None):
+        stream = stream if stream is not None else defaultRandomStreams.get_stream("recipes")
+        recipe_length = stream.randint(min_length, max_length)
+        return cls([{"service": Service(stream.choice(services)), "done": False, "providers": []} for _ in range(recipe_length)])
+
+    def __eq__(self, other):
+        # Compared by value, e.g. to detect changes between inventory snapshots
+        if not isinstance(other, Recipe):
+            return NotImplemented
+        return (self.recipe, self.current_element_index, self.done) == (other.recipe, other.current_element_index, other.done)
 
     def __str__(self):
         return f"Recipe.{self.current_element_index+1}/{self.get_recipe_length()}: " + ", ".join([element.get("service").name if isinstance(element, dict) else f"({str(element)})" if isinstance(element, Recipe) else "" for element in self.recipe])
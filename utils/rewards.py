@@ -0,0 +1,120 @@
+from utils.inventory import Inventory, Item, SharedItem
+
+
+class RewardRegistry:
+    """
+    A registry of reward prototypes (flyweights). Every reward is a single shared, immutable item,
+    so awarding it only increments the quantity of its stack in the agent's inventory, and the
+    number of rewards of a kind (e.g. badges) is read from the inventory's name aggregates.
+    """
+    def __init__(self):
+        # Lower-cased reward name -> prototype
+        self.prototypes: dict[str, SharedItem] = {}
+        # Kind (e.g. "badge") -> prototypes of that kind
+        self.kinds: dict[str, list[SharedItem]] = {}
+
+    def intern(self, item: Item, kind: str = None) -> SharedItem:
+        """
+        Get the prototype of a reward, registering it if it is new. A reward name stands for one
+        prototype, so registering it again with other features or another kind is an error.
+
+        Args:
+            item (Item): The reward item.
+            kind (str, optional): The kind of the reward (e.g. "badge"). Defaults to the item's "kind"
+                feature, or to the kind of the prototype already registered under its name.
+
+        Raises:
+            ValueError: If the reward has no kind, or conflicts with the prototype registered under its name.
+
+        Returns:
+            SharedItem: The prototype registered under the item's name, with its kind as the "kind" feature.
+        """
+        key = item.get_name().lower()
+        prototype = self.prototypes.get(key)
+        features = dict(item.get_features())
+        kind = kind or features.get("kind") or (prototype is not None and prototype.get_features()["kind"])
+        if not kind:
+            raise ValueError(f"Reward {item.get_name()} has no kind.")
+        if features.get("kind", kind) != kind:
+            raise ValueError(f"Reward {item.get_name()} is of kind {features.get('kind')}, not {kind}.")
+        features.update({"kind": kind})
+        if prototype is not None:
+            if prototype is not item and dict(prototype.get_features()) != features:
+                raise ValueError(f"Reward {item.get_name()} is already registered with other features.")
+            return prototype
+        if isinstance(item, SharedItem) and item.get_features().get("kind") == kind:
+            prototype = item
+        else:
+            prototype = SharedItem(item.get_name(), features)
+        self.prototypes.update({key: prototype})
+        self.kinds.setdefault(kind, []).append(prototype)
+        return prototype
+
+    def get(self, name: str) -> SharedItem | None:
+        """
+        Get the prototype of a reward.
+
+        Args:
+            name (str): The name of the reward, ignoring case.
+
+        Returns:
+            SharedItem | None: The prototype, or None if there is no such reward.
+        """
+        return self.prototypes.get(name.lower())
+
+    def award(self, inventory: Inventory, item: Item, quantity: int = 1) -> SharedItem:
+        """
+        Award a reward, adding its prototype to an inventory.
+
+        Args:
+            inventory (Inventory): The inventory.
+            item (Item): The reward item.
+            quantity (int, optional): The number of rewards. Defaults to 1.
+
+        Returns:
+            SharedItem: The awarded prototype.
+        """
+        prototype = self.intern(item)
+        inventory.add_item_in_quantity(prototype, quantity)
+        return prototype
+
+    def get_counts(self, inventory: Inventory, kind: str) -> dict[str, int]:
+        """
+        Get the number of rewards of a kind in an inventory.
+
+        Args:
+            inventory (Inventory): The inventory.
+            kind (str): The kind of the rewards, e.g. "badge".
+
+        Returns:
+            dict[str, int]: The number of each reward the inventory holds (only those it holds).
+        """
+        counts = {}
+        for prototype in self.kinds.get(kind, ()):
+            quantity = inventory.get_quantity_by_name(prototype.name)
+            if quantity:
+                counts.update({prototype.name: quantity})
+        return counts
+
+    def count(self, inventory: Inventory, kind: str) -> int:
+        """
+        Get the total number of rewards of a kind in an inventory.
+
+        Args:
+            inventory (Inventory): The inventory.
+            kind (str): The kind of the rewards, e.g. "badge".
+
+        Returns:
+            int: The number of rewards.
+        """
+        return sum(inventory.get_quantity_by_name(prototype.name) for prototype in self.kinds.get(kind, ()))
+
+    def __len__(self):
+        return len(self.prototypes)
+
+    def __str__(self):
+        return f"RewardRegistry({', '.join(prototype.name for prototype in self.prototypes.values())})"
+
+
+# Registry shared by all gamification techniques
+defaultRewardRegistry = RewardRegistry()
@@ -1,20 +1,115 @@
-from dataclasses import dataclass, asdict
+import sys
+from dataclasses import dataclass
+
+from utils.random_streams import defaultRandomStreams
 
-@dataclass
-class Service:
-    name: str
-    price: float | int = None
-    duration: int = None
+
+class BaseService:
+    """
+    Methods shared by the mutable and the frozen service records.
+    """
+    __slots__ = ()
 
     def to_dict(self):
-        return asdict(self)
+        # Hand-rolled instead of dataclasses.asdict, which recurses and deep-copies every field
+        return {"name": self.name, "price": self.price, "duration": self.duration}
 
     @classmethod
     def from_dict(cls, data):
         return cls(**data)
 
     @classmethod
-    def random(cls):
-        import random
-        import numpy as np
-        return cls(random.choice(["A", "B", "C"]), random.randint(1, 10), random.randint(1, 10))
\ No newline at end of file
+    def random(cls, stream=None):
+        stream = stream if stream is not None else defaultRandomStreams.get_stream("services")
+        return cls(stream.choice(["A", "B", "C"]), stream.randint(1, 10), stream.randint(1, 10))
+
+
+@dataclass(slots=True)
+class Service(BaseService):
+    name: str
+    price: float | int = None
+    duration: int = None
+
+    def __post_init__(self):
+        # Services are matched by name all the time, so share one string object per name
+        if isinstance(self.name, str):
+            self.name = sys.intern(self.name)
+
+    def freeze(self):
+        return FrozenService(self.name, self.price, self.duration)
+
+
+@dataclass(frozen=True, slots=True)
+class FrozenService(BaseService):
+    """
+    An immutable (and hashable) service, e.g. for catalogues shared between agents.
+    """
+    name: str
+    price: float | int = None
+    duration: int = None
+
+    def __post_init__(self):
+        if isinstance(self.name, str):
+            object.__setattr__(self, "name", sys.intern(self.name))
+
+    def thaw(self):
+        return Service(self.name, self.price, self.duration)
+
+
+class ServiceTally(dict):
+    """
+    A dict counting how many times each service was provided, which keeps the total up to date
+    on every change instead of summing the counts.
+    """
+    def __init__(self, counts: dict[str, int] = None):
+        super().__init__(counts or {})
+        self.total = sum(self.values())
+
+    def __setitem__(self, name: str, count: int):
+        self.total += count - self.get(name, 0)
+        super().__setitem__(name, count)
+
+    def __delitem__(self, name: str):
+        self.total -= self[name]
+        super().__delitem__(name)
+
+    def update(self, counts=(), **kwargs):
+        for name, count in dict(counts, **kwargs).items():
+            self[name] = count
+
+    def __ior__(self, counts):
+        self.update(counts)
+        return self
+
+    def setdefault(self, name: str, count: int = 0):
+        if name not in self:
+            self[name] = count
+        return self[name]
+
+    def pop(self, name: str, *default):
+        if name in self:
+            self.total -= self[name]
+        return super().pop(name, *default)
+
+    def popitem(self):
+        name, count = super().popitem()
+        self.total -= count
+        return name, count
+
+    def clear(self):
+        super().clear()
+        self.total = 0
+
+    def __reduce__(self):
+        # Rebuilt from the counts, as copying the total and then setting each count would count them twice
+        return (ServiceTally, (dict(self),))
+
+    def increment(self, name: str, count: int = 1):
+        """
+        Count a service as provided.
+
+        Args:
+            name (str): The name of the service.
+            count (int, optional): How many times it was provided. Defaults to 1.
+        """
+        self[name] = self.get(name, 0) + count
@@ -0,0 +1,60 @@
+from utils.gamification import CompatibilityCache
+from utils.gamification_techniques import GamificationTechniqueCollection, defaultGamificationTechniqueCollection
+from utils.goals import GoalEngine
+from utils.ledger import SettlementLedger
+from utils.personality_matrix import PopulationPersonalityMatrix
+from utils.random_streams import RandomStreams
+
+
+class SimulationContext:
+    """
+    The mutable state of one simulation, so several simulations can run in one process without
+    affecting each other: the goal state and compatibility cache of its techniques, its random
+    streams, personality matrix and ledger. Immutable data is shared between simulations: the
+    technique definitions and personality profiles, the reward prototypes and the interned profiles.
+    Agents given a context take these from it instead of the process-wide defaults.
+    """
+    def __init__(
+        self,
+        techniques: GamificationTechniqueCollection = None,
+        seed: int = None,
+        personality_matrix: PopulationPersonalityMatrix = None,
+        ledger: SettlementLedger = None,
+    ):
+        """
+        Initialize the context.
+
+        Args:
+            techniques (GamificationTechniqueCollection, optional): The techniques of the simulation, copied with their own goal state. Defaults to defaultGamificationTechniqueCollection.
+            seed (int, optional): The seed of the simulation's random streams. Defaults to None (fresh entropy).
+            personality_matrix (PopulationPersonalityMatrix, optional): The personality matrix of the agents. Defaults to a new matrix.
+            ledger (SettlementLedger, optional): The ledger settling the agents' payments. Defaults to a new ledger.
+        """
+        self.goal_engine = GoalEngine()
+        self.compatibility_cache = CompatibilityCache()
+        self.techniques = (techniques if techniques is not None else defaultGamificationTechniqueCollection).isolate(self.goal_engine, self.compatibility_cache)
+        self.random_streams = RandomStreams(seed)
+        self.personality_matrix = personality_matrix if personality_matrix is not None else PopulationPersonalityMatrix()
+        self.ledger = ledger if ledger is not None else SettlementLedger()
+
+    @property
+    def seed(self) -> int:
+        """
+        The seed of the simulation's random streams.
+        """
+        return self.random_streams.seed
+
+    def get_stats(self) -> dict[str, dict]:
+        """
+        Get the statistics of the simulation's gamification state.
+
+        Returns:
+            dict[str, dict]: The compatibility cache and goal engine statistics.
+        """
+        return {
+            "compatibility cache": self.compatibility_cache.get_stats(),
+            "goal engine": self.goal_engine.get_stats(),
+        }
+
+    def __str__(self):
+        return f"SimulationContext(seed={self.seed}, {len(self.techniques.techniques)} techniques, {len(self.personality_matrix)} profiles)"